@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# benchmarks/cold_start.py
+"""
+Cold-start benchmark for the samplesheet Lambda.
+
+Each trial runs in a fresh interpreter and measures:
+  - import_ms: time to import lambda_function.handler
+  - first_invocation_ms: time for the first generate_samplesheet call,
+    including client creation, against moto-backed DynamoDB and S3
+  - reference_ms: time, in another fresh interpreter, to import a fixed set
+    of standard-library modules
+
+Modules are compiled from source on every import (through an empty pycache
+prefix), as they are in a Lambda package shipped without .pyc files, so the
+result does not depend on what earlier runs left in __pycache__.
+
+A few milliseconds of absolute time mostly measure the machine, so the
+medians are compared against the baseline relative to reference_ms of the
+same run, and the script exits non-zero when either ratio regresses past the
+allowed tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'cold_start.json')
+# Pure-Python standard-library modules the handler does not import; importing
+# them from source is the same kind of work as importing the handler
+REFERENCE_MODULES = ('textwrap', 'string', 'shlex', 'fnmatch', 'difflib')
+METRICS = ('import_ms', 'first_invocation_ms')
+
+# Executed in a fresh interpreter per trial. The handler is imported before
+# moto so its import time is not hidden by moto importing boto3 first.
+TRIAL_SCRIPT = r'''
+import json, os, sys, time
+sys.path.insert(0, sys.argv[1])
+sys.dont_write_bytecode = True
+os.environ.update({
+    'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'DYNAMODB_TABLE': 'cold-start-table', 'S3_BUCKET': 'cold-start-bucket',
+})
+
+sys.pycache_prefix = sys.argv[2]
+start = time.perf_counter()
+import lambda_function.handler as handler
+import_ms = (time.perf_counter() - start) * 1000
+sys.pycache_prefix = None
+
+import boto3
+from moto import mock_aws
+
+with mock_aws():
+    s3 = boto3.client('s3', region_name='us-east-1')
+    s3.create_bucket(Bucket='cold-start-bucket')
+    table = boto3.resource('dynamodb', region_name='us-east-1').create_table(
+        TableName='cold-start-table',
+        KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    for i in range(10):
+        key = f'raw_data/SAM{i:03d}.fastq.gz'
+        s3.put_object(Bucket='cold-start-bucket', Key=key, Body=b'x')
+        table.put_item(Item={'experiment_id': 'EXP001', 'sample_id': f'SAM{i:03d}', 's3_object_key': key})
+
+    event = {'body': json.dumps({'experiment_id': 'EXP001'})}
+    start = time.perf_counter()
+    response = handler.generate_samplesheet(event, {})
+    first_invocation_ms = (time.perf_counter() - start) * 1000
+    assert response['statusCode'] == 200, response
+
+print(json.dumps({'import_ms': import_ms, 'first_invocation_ms': first_invocation_ms}))
+'''
+
+REFERENCE_SCRIPT = r'''
+import importlib, sys, time
+sys.dont_write_bytecode = True
+sys.pycache_prefix = sys.argv[1]
+start = time.perf_counter()
+for name in sys.argv[2:]:
+    importlib.import_module(name)
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def _run(args):
+    result = subprocess.run([sys.executable, '-c'] + args, capture_output=True, text=True, check=True)
+    # The handler prints the received event; the measurements are the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_trial():
+    """Runs one trial and its reference in fresh interpreters and returns their measurements."""
+    with tempfile.TemporaryDirectory() as pycache:
+        trial = _run([TRIAL_SCRIPT, PROJECT_ROOT, pycache])
+    with tempfile.TemporaryDirectory() as pycache:
+        trial['reference_ms'] = _run([REFERENCE_SCRIPT, pycache] + list(REFERENCE_MODULES))
+    return trial
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start latency of the samplesheet Lambda.')
+    parser.add_argument('--trials', default=5, type=int, help='Number of fresh-interpreter trials.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Path to the baseline JSON file.')
+    parser.add_argument('--tolerance', default=0.5, type=float, help='Allowed fractional regression of each ratio to reference_ms over the baseline.')
+    parser.add_argument('--update-baseline', action='store_true', help='Record the measured medians as the new baseline.')
+    args = parser.parse_args()
+
+    trials = [run_trial() for _ in range(args.trials)]
+    medians = {
+        metric: statistics.median(trial[metric] for trial in trials)
+        for metric in METRICS + ('reference_ms',)
+    }
+    ratios = {metric: medians[metric] / medians['reference_ms'] for metric in METRICS}
+    for metric, value in medians.items():
+        ratio = f", {ratios[metric]:.2f}x reference" if metric in ratios else ''
+        print(f"{metric}: {value:.1f} ms (median of {args.trials}{ratio})")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(
+                {metric: round(value, 1) for metric, value in medians.items()},
+                ratios={metric: round(value, 2) for metric, value in ratios.items()}
+            ), f, indent=4)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for metric, ratio in ratios.items():
+        limit = baseline['ratios'][metric] * (1 + args.tolerance)
+        if ratio > limit:
+            regressions.append(
+                f"{metric} is {ratio:.2f}x reference_ms, over the limit of {limit:.2f}x "
+                f"(baseline {baseline['ratios'][metric]}x, {baseline[metric]} ms)"
+            )
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# benchmarks/monitor_load.py
+"""
+Load test for the monitoring dashboard's API.
+
+By default the monitor is served in-process by a threaded WSGI server whose
+Batch and CloudWatch Logs clients are replaced with local stubs that answer
+after a fixed latency, so results reflect the monitor itself rather than AWS.
+Pass --url to load an already running server (e.g. gunicorn serving wsgi:app)
+instead.
+
+Concurrent clients each keep one HTTP connection open and alternate between
+/jobs and /jobs/<id>/logs for the requested duration; requests per second and
+p50/p99 latency are reported per endpoint.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class StubBatch:
+    """Answers list_jobs and describe_jobs from memory after `latency` seconds."""
+
+    def __init__(self, job_count, latency):
+        self.latency = latency
+        self.jobs = [
+            {'jobId': f'job-{i}', 'jobName': f'job-{i}', 'status': 'RUNNING' if i % 10 == 0 else 'SUCCEEDED',
+             'createdAt': i, 'container': {'logStreamName': f'stream-{i}'}}
+            for i in range(job_count)
+        ]
+        self.by_id = {job['jobId']: job for job in self.jobs}
+
+    def list_jobs(self, jobQueue, jobStatus, maxResults=100, nextToken=None):
+        time.sleep(self.latency)
+        start = int(nextToken or 0)
+        matching = [job for job in self.jobs if job['status'] == jobStatus]
+        page = matching[start:start + maxResults]
+        response = {'jobSummaryList': page}
+        if start + len(page) < len(matching):
+            response['nextToken'] = str(start + len(page))
+        return response
+
+    def describe_jobs(self, jobs):
+        time.sleep(self.latency)
+        return {'jobs': [self.by_id[job_id] for job_id in jobs]}
+
+
+class StubLogs:
+    """Returns a fixed page of log lines after `latency` seconds."""
+
+    def __init__(self, lines, latency):
+        self.latency = latency
+        self.events = [{'message': f'line {i}'} for i in range(lines)]
+
+    def get_log_events(self, logGroupName, logStreamName, startFromHead=True, nextToken=None):
+        time.sleep(self.latency)
+        if nextToken == 'end':
+            return {'events': [], 'nextForwardToken': 'end'}
+        return {'events': self.events, 'nextForwardToken': 'end'}
+
+
+def start_stub_server(args):
+    """Serves the monitor against stub clients; returns (server, base_url)."""
+    from werkzeug.serving import make_server
+    import monitor
+
+    batch = StubBatch(args.jobs, args.backend_latency)
+    logs = StubLogs(100, args.backend_latency)
+    monitor.get_batch_client = lambda: batch
+    monitor.get_logs_client = lambda: logs
+    monitor.configure('stub-queue', index=not args.no_index)
+    if monitor._job_index is not None:
+        monitor._job_index.wait_until_ready()
+
+    # Per-request access logging would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, monitor.app, threaded=True)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def run_load(base_url, paths, concurrency, duration):
+    """Runs `concurrency` keep-alive clients for `duration` seconds; returns latencies per path."""
+    url = urlsplit(base_url)
+    latencies = {label: [] for label, _ in paths}
+    errors = {label: 0 for label, _ in paths}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        local = {label: [] for label, _ in paths}
+        local_errors = {label: 0 for label, _ in paths}
+        i = offset
+        while time.perf_counter() < deadline:
+            label, path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors[label] += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                local_errors[label] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+                continue
+            local[label].append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            for label in local:
+                latencies[label].extend(local[label])
+                errors[label] += local_errors[label]
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies, errors, duration):
+    report = {}
+    for label, values in latencies.items():
+        values = sorted(values)
+        report[label] = {
+            'requests': len(values),
+            'errors': errors[label],
+            'rps': round(len(values) / duration, 1),
+            'p50_ms': round(_percentile(values, 0.50) * 1000, 2) if values else None,
+            'p99_ms': round(_percentile(values, 0.99) * 1000, 2) if values else None,
+            'mean_ms': round(statistics.fmean(values) * 1000, 2) if values else None
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the monitor API against a stub backend.')
+    parser.add_argument('--url', help='Base URL of a running monitor. Defaults to an in-process server with stub AWS clients.')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent keep-alive clients.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run.')
+    parser.add_argument('--job-id', default='job-0', help='Job whose logs are requested.')
+    parser.add_argument('--jobs', type=int, default=2000, help='Jobs in the stub queue.')
+    parser.add_argument('--backend-latency', type=float, default=0.02, help='Seconds each stub AWS call takes.')
+    parser.add_argument('--no-index', action='store_true', help='Serve /jobs without the background job index.')
+    parser.add_argument('--format', choices=['table', 'json'], default='table')
+    args = parser.parse_args()
+
+    base_url = args.url
+    if not base_url:
+        _, base_url = start_stub_server(args)
+    paths = [('/jobs', '/jobs?limit=200'), ('/jobs/<id>/logs', f'/jobs/{args.job_id}/logs')]
+
+    latencies, errors = run_load(base_url, paths, args.concurrency, args.duration)
+    report = summarize(latencies, errors, args.duration)
+
+    if args.format == 'json':
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'endpoint':<18}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, row in report.items():
+        print(f"{label:<18}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10}{row['p50_ms'] or '-':>10}{row['p99_ms'] or '-':>10}")
+
+
+if __name__ == '__main__':
+    main()
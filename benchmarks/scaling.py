@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# benchmarks/scaling.py
+"""
+Scaling benchmark for the samplesheet Lambda, the launcher and the monitor.
+
+Three scenarios are swept, each with tracing enabled so that every case
+records its spans and AWS API calls (see tracing.py):
+
+  - samplesheet: generate_samplesheet for experiments of 10 to 50,000
+    samples. DynamoDB is moto; S3 is a local stub, since creating 50,000
+    tagged objects in moto alone takes minutes.
+  - launcher: NextflowLauncher.submit_manifest for manifests of several
+    sizes and worker counts, against stub Lambda, S3 and Batch clients.
+  - monitor: concurrent HTTP clients against the in-process monitor (see
+    monitor_load.py) for job queues of several sizes.
+
+Every AWS call, moto or stub, waits --latency seconds first. A case records
+the p50/p99 latency of its top-level operation, the p50/p99 of each span, and
+the AWS API calls per operation (per samplesheet, per manifest, per HTTP
+request). Results are compared against a baseline JSON file; the script exits
+non-zero when a case's p50 regresses past --tolerance or its API calls per
+operation grow past --call-tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tracing
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'scaling.json')
+SCENARIOS = ['samplesheet', 'launcher', 'monitor']
+BUCKET = 'bench-bucket'
+TABLE = 'bench-table'
+# Samples in each samplesheet the stub Lambda returns to the launcher
+LAUNCHER_SAMPLES = 100
+
+
+def _operation_name(method_name):
+    """'get_object_tagging' -> 'GetObjectTagging', as botocore names operations."""
+    return ''.join(part.capitalize() for part in method_name.split('_'))
+
+
+class TracedStub:
+    """Records every method call on a stub client as an AWS API call of `service`."""
+
+    def __init__(self, target, service):
+        self._target = target
+        self._service = service
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                tracing.record_api_call(self._service, _operation_name(name), time.perf_counter() - start)
+        return call
+
+
+def inject_latency(client, seconds):
+    """Makes every request of a boto3 (or moto-backed) client wait `seconds` first."""
+    if seconds:
+        client.meta.events.register('request-created', lambda **kwargs: time.sleep(seconds))
+
+
+class StubS3:
+    """Answers the S3 calls of the Lambda and the launcher from memory after `latency` seconds."""
+
+    def __init__(self, latency):
+        from botocore.exceptions import ClientError
+        self._client_error = ClientError
+        self.latency = latency
+        self.objects = set()
+        self._lock = threading.Lock()
+
+    def get_object_tagging(self, Bucket, Key):
+        time.sleep(self.latency)
+        return {'TagSet': [{'Key': 'fastq_2', 'Value': Key.replace('.fastq.gz', '_R2.fastq.gz')}]}
+
+    def head_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        with self._lock:
+            if (Bucket, Key) in self.objects:
+                return {'ContentLength': 0}
+        raise self._client_error({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+
+    def put_object(self, Bucket, Key, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.objects.add((Bucket, Key))
+        return {}
+
+    def copy_object(self, Bucket, Key, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.objects.add((Bucket, Key))
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        with self._lock:
+            self.objects.discard((Bucket, Key))
+        return {}
+
+    def create_multipart_upload(self, **kwargs):
+        time.sleep(self.latency)
+        return {'UploadId': 'upload'}
+
+    def upload_part(self, PartNumber, **kwargs):
+        time.sleep(self.latency)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        time.sleep(self.latency)
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        time.sleep(self.latency)
+        return {}
+
+
+class StubLambda:
+    """Returns an inline samplesheet of `samples` rows for any experiment after `latency` seconds."""
+
+    def __init__(self, samples, latency):
+        self.samples = samples
+        self.latency = latency
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        time.sleep(self.latency)
+        experiment_id = json.loads(json.loads(Payload)['body'])['experiment_id']
+        rows = ''.join(
+            f's{i},s3://{BUCKET}/raw_data/{experiment_id}/s{i}.fastq.gz,,control,none\n'
+            for i in range(self.samples)
+        )
+        body = 'sample,fastq_1,fastq_2,experimental_group,treatment\n' + rows
+        return {'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': body}).encode('utf-8'))}
+
+
+class StubSubmitBatch:
+    """Accepts submit_job calls after `latency` seconds."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.submitted = 0
+        self._lock = threading.Lock()
+
+    def submit_job(self, jobName, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.submitted += 1
+            return {'jobId': f'job-{self.submitted}', 'jobName': jobName}
+
+
+def case_result(snapshot, top_span, operations):
+    """
+    Summarizes one case from a tracing snapshot.
+
+    Args:
+        top_span (str): Span whose p50/p99 is the case's latency.
+        operations (int): Top-level operations run; API calls are reported per operation.
+    """
+    spans = snapshot.get(tracing.SPAN_METRIC, {})
+    api_calls = snapshot.get(tracing.AWS_API_CALL_METRIC, {})
+    top = spans.get(top_span, {})
+    return {
+        'operations': operations,
+        'p50_ms': top.get('p50_ms'),
+        'p99_ms': top.get('p99_ms'),
+        'api_calls': {name: round(summary['count'] / operations, 2) for name, summary in api_calls.items()},
+        'api_latency': {name: {'p50_ms': summary['p50_ms'], 'p99_ms': summary['p99_ms']} for name, summary in api_calls.items()},
+        'spans': spans
+    }
+
+
+def run_samplesheet(sample_counts, latency, repeat):
+    import boto3
+    from moto import mock_aws
+    import lambda_function.handler as handler
+
+    results = {}
+    with mock_aws():
+        setup = boto3.resource('dynamodb', region_name='us-east-1')
+        # Only the measured client is slowed down and recorded
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        tracing.instrument_client(dynamodb.meta.client)
+        inject_latency(dynamodb.meta.client, latency)
+        s3_client = TracedStub(StubS3(latency), 's3')
+
+        for count in sample_counts:
+            # One table per case, as moto's query time grows with the whole table
+            table_name = f'{TABLE}-{count}'
+            table = setup.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+                AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            with table.batch_writer() as writer:
+                for i in range(count):
+                    writer.put_item(Item={
+                        'experiment_id': 'EXP001',
+                        'sample_id': f'S{i:06d}',
+                        's3_object_key': f'raw_data/EXP001/S{i:06d}.fastq.gz',
+                        'experimental_group': 'treated' if i % 2 else 'control',
+                        'treatment': 'drug_x' if i % 2 else 'none',
+                        'updated_at': '2024-01-01T00:00:00Z'
+                    })
+            os.environ.update({'DYNAMODB_TABLE': table_name, 'S3_BUCKET': BUCKET})
+
+            tracing.reset()
+            event = {'body': json.dumps({'experiment_id': 'EXP001'})}
+            for _ in range(repeat):
+                # A fresh tag cache measures a cold container's tag lookups
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = handler.generate_samplesheet(
+                        event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=handler.TagCache()
+                    )
+                if response['statusCode'] != 200:
+                    raise RuntimeError(f"samplesheet for {count} samples failed: {response['body']}")
+            results[f'samples={count}'] = case_result(tracing.snapshot(), 'samplesheet.generate', repeat)
+            print(f"samplesheet samples={count}: p50 {results[f'samples={count}']['p50_ms']} ms", file=sys.stderr)
+            table.delete()
+    return results
+
+
+def run_launcher(manifest_sizes, workers, latency, repeat):
+    from launcher import NextflowLauncher
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        params_file = os.path.join(tmp, 'params.json')
+        with open(params_file, 'w') as f:
+            json.dump({'outdir': f's3://{BUCKET}/results', 'genome': 'GRCh38'}, f)
+
+        for size in manifest_sizes:
+            entries = [{'experiment_id': f'EXP{i:05d}'} for i in range(size)]
+            for worker_count in workers:
+                tracing.reset()
+                for _ in range(repeat):
+                    # A new launcher per run, so no upload is skipped by its known-object cache
+                    launcher = NextflowLauncher()
+                    launcher.lambda_client = TracedStub(StubLambda(LAUNCHER_SAMPLES, latency), 'lambda')
+                    launcher.s3_client = TracedStub(StubS3(latency), 's3')
+                    launcher.batch_client = TracedStub(StubSubmitBatch(latency), 'batch')
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        summary = launcher.submit_manifest(
+                            entries, 'https://github.com/nf-core/rnaseq', BUCKET, 'bench-queue', 'nextflow-runner',
+                            lambda_function_name='bench-samplesheet', default_params_file=params_file,
+                            job_name='bench', max_workers=worker_count, submit_rate=0
+                        )
+                    failed = [job for job in summary['jobs'] if 'error' in job]
+                    if failed:
+                        raise RuntimeError(f"manifest of {size} failed: {failed[0]['error']}")
+                key = f'entries={size},workers={worker_count}'
+                results[key] = case_result(tracing.snapshot(), 'launcher.submit_manifest', repeat)
+                print(f"launcher {key}: p50 {results[key]['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def run_monitor(queue_sizes, clients, latency, duration):
+    from werkzeug.serving import make_server
+    import monitor
+    from monitor_load import StubBatch, StubLogs, run_load
+
+    # Per-request access logging would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    paths = [('/jobs', '/jobs?limit=200'), ('/jobs/<id>/logs', '/jobs/job-0/logs')]
+    results = {}
+    for size in queue_sizes:
+        batch = TracedStub(StubBatch(size, latency), 'batch')
+        logs = TracedStub(StubLogs(100, latency), 'logs')
+        monitor.get_batch_client = lambda: batch
+        monitor.get_logs_client = lambda: logs
+        monitor._job_list_cache.clear()
+        monitor._job_description_cache.clear()
+        # The index polls once up front; later polls would add noise to the per-request API calls
+        monitor.configure('bench-queue', poll_interval=3600, idle_poll_interval=3600)
+        monitor._job_index.wait_until_ready()
+        server = make_server('127.0.0.1', 0, monitor.app, threaded=True)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        try:
+            for client_count in clients:
+                tracing.reset()
+                latencies, errors = run_load(base_url, paths, client_count, duration)
+                all_latencies = sorted(value for values in latencies.values() for value in values)
+                requests = max(len(all_latencies), 1)
+                result = case_result(tracing.snapshot(), None, requests)
+                result.update({
+                    'p50_ms': round(tracing.percentile(all_latencies, 0.50) * 1000, 3) if all_latencies else None,
+                    'p99_ms': round(tracing.percentile(all_latencies, 0.99) * 1000, 3) if all_latencies else None,
+                    'rps': round(len(all_latencies) / duration, 1),
+                    'errors': sum(errors.values()),
+                    'endpoints': tracing.snapshot().get(tracing.HTTP_REQUEST_METRIC, {})
+                })
+                key = f'jobs={size},clients={client_count}'
+                results[key] = result
+                print(f"monitor {key}: p50 {result['p50_ms']} ms, {result['rps']} rps", file=sys.stderr)
+        finally:
+            server.shutdown()
+            monitor._job_index.stop()
+    return results
+
+
+def compare(results, baseline, tolerance, call_tolerance, min_delta_ms):
+    """
+    Compares cases present in both runs.
+
+    Returns:
+        list: One message per regression. A case regresses when its p50
+              (or, for the monitor, any endpoint's p50) exceeds the baseline
+              by more than `tolerance` and by at least `min_delta_ms`, or when an operation's API calls per
+              top-level operation exceed the baseline by more than
+              `call_tolerance`.
+    """
+    regressions = []
+    for scenario, cases in results.items():
+        for key, case in cases.items():
+            base = baseline.get(scenario, {}).get(key)
+            if not base:
+                continue
+            # Monitor cases mix fast and slow endpoints, so each endpoint is compared on its own
+            if 'endpoints' in case:
+                latencies = [(f'{key} {name}', summary, base.get('endpoints', {}).get(name, {}))
+                             for name, summary in case['endpoints'].items()]
+            else:
+                latencies = [(key, case, base)]
+            for label, current, previous in latencies:
+                if current.get('p50_ms') is None or previous.get('p50_ms') is None:
+                    continue
+                limit = previous['p50_ms'] * (1 + tolerance)
+                if current['p50_ms'] > limit and current['p50_ms'] - previous['p50_ms'] >= min_delta_ms:
+                    regressions.append(f"{scenario} {label}: p50 {current['p50_ms']} ms exceeds {limit:.1f} ms (baseline {previous['p50_ms']} ms)")
+            for operation, calls in case['api_calls'].items():
+                base_calls = base.get('api_calls', {}).get(operation, 0)
+                if calls > base_calls * (1 + call_tolerance):
+                    regressions.append(f"{scenario} {key}: {calls} {operation} calls per operation (baseline {base_calls})")
+    return regressions
+
+
+def _int_list(value):
+    return [int(entry) for entry in value.split(',') if entry]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep the samplesheet Lambda, launcher and monitor over input sizes and concurrency.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenarios to run.')
+    parser.add_argument('--samples', type=_int_list, default=[10, 100, 1000, 10000, 50000], help='Samplesheet sample counts.')
+    parser.add_argument('--manifest-sizes', type=_int_list, default=[1, 10, 100], help='Launcher manifest sizes.')
+    parser.add_argument('--workers', type=_int_list, default=[1, 8, 32], help='Launcher worker counts.')
+    parser.add_argument('--queue-sizes', type=_int_list, default=[100, 1000, 10000], help='Jobs in the monitored queue.')
+    parser.add_argument('--clients', type=_int_list, default=[1, 8, 32], help='Concurrent monitor clients.')
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds each AWS call waits.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per samplesheet and launcher case.')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds per monitor case.')
+    parser.add_argument('--output', help='Also write the results JSON here.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Path to the baseline JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed fractional p50 regression over the baseline.')
+    parser.add_argument('--call-tolerance', type=float, default=0.1, help='Allowed fractional growth in API calls per operation.')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Ignore p50 regressions smaller than this.')
+    parser.add_argument('--update-baseline', action='store_true', help='Record these results as the new baseline.')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    tracing.enable()
+
+    scenarios = [scenario for scenario in args.scenarios.split(',') if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {'settings': {'latency': args.latency, 'repeat': args.repeat, 'duration': args.duration}}
+    if 'samplesheet' in scenarios:
+        results['samplesheet'] = run_samplesheet(args.samples, args.latency, args.repeat)
+    if 'launcher' in scenarios:
+        results['launcher'] = run_launcher(args.manifest_sizes, args.workers, args.latency, args.repeat)
+    if 'monitor' in scenarios:
+        results['monitor'] = run_monitor(args.queue_sizes, args.clients, args.latency, args.duration)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+            f.write('\n')
+
+    print(f"{'scenario':<13}{'case':<26}{'p50 ms':>10}{'p99 ms':>10}  api calls per operation")
+    for scenario in scenarios:
+        for key, case in results[scenario].items():
+            calls = ', '.join(f'{name}={count}' for name, count in case['api_calls'].items())
+            print(f"{scenario:<13}{key:<26}{case['p50_ms'] or '-':>10}{case['p99_ms'] or '-':>10}  {calls}")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != results['settings']:
+        print(f"Warning: baseline settings {baseline.get('settings')} differ from {results['settings']}")
+    regressions = compare(
+        {scenario: results[scenario] for scenario in scenarios}, baseline,
+        args.tolerance, args.call_tolerance, args.min_delta_ms
+    )
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+# gunicorn.conf.py
+# Settings for serving wsgi:app in production; see wsgi.py.
+import os
+
+bind = os.environ.get('MONITOR_BIND', '0.0.0.0:8000')
+# Threaded workers: each open dashboard holds a thread for its event stream
+worker_class = 'gthread'
+workers = int(os.environ.get('MONITOR_WORKERS', 2))
+threads = int(os.environ.get('MONITOR_THREADS', 32))
+# Threads share one client per service; give each room for a connection
+os.environ.setdefault('MONITOR_MAX_POOL_CONNECTIONS', str(threads + 8))
+keepalive = 5
+graceful_timeout = 10
+accesslog = '-'
@@ -0,0 +1,147 @@
+# job_index.py
+"""
+In-memory index of the jobs in a Batch queue, kept current by one background
+poller so that dashboard requests and push updates never call AWS directly.
+
+Each poll lists every status and diffs the result against the index. Changed
+and new jobs are recorded with their status history and published as a
+numbered delta; clients that know the last version they saw can ask for only
+the deltas after it. The poller runs every `active_interval` seconds while any
+job is queued or running (or the last poll found changes) and backs off
+towards `idle_interval` while the queue is idle.
+"""
+import threading
+import time
+from collections import deque
+
+ACTIVE_STATUSES = {'SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING'}
+DEFAULT_ACTIVE_INTERVAL = 5.0
+DEFAULT_IDLE_INTERVAL = 60.0
+# Deltas retained for clients that reconnect with an older version
+DEFAULT_DELTA_HISTORY = 500
+
+
+class JobIndex:
+    def __init__(self, list_jobs, statuses, active_interval=DEFAULT_ACTIVE_INTERVAL,
+                 idle_interval=DEFAULT_IDLE_INTERVAL, delta_history=DEFAULT_DELTA_HISTORY):
+        """
+        Args:
+            list_jobs (callable): Takes a list of statuses and returns every job
+                                  summary in those statuses.
+            statuses (list): The statuses to index.
+        """
+        self.list_jobs = list_jobs
+        self.statuses = statuses
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.version = 0
+        self.interval = active_interval
+        self.last_polled_at = None
+        self.last_error = None
+        self._jobs = {}
+        self._deltas = deque(maxlen=delta_history)
+        self._changed = threading.Condition()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Lists the queue once and publishes a delta if anything changed."""
+        jobs = self.list_jobs(self.statuses)
+        now = int(time.time() * 1000)
+        with self._changed:
+            seen = set()
+            upserted = []
+            for summary in jobs:
+                job_id = summary['jobId']
+                seen.add(job_id)
+                previous = self._jobs.get(job_id)
+                if previous is not None and all(previous.get(k) == v for k, v in summary.items()):
+                    continue
+                history = list(previous['statusHistory']) if previous else []
+                if not history or history[-1]['status'] != summary['status']:
+                    history.append({'status': summary['status'], 'at': now})
+                job = dict(summary, statusHistory=history)
+                self._jobs[job_id] = job
+                upserted.append(job)
+            # Batch expires finished jobs after a few days
+            removed = [job_id for job_id in self._jobs if job_id not in seen]
+            for job_id in removed:
+                del self._jobs[job_id]
+
+            if upserted or removed:
+                self.version += 1
+                self._deltas.append({'version': self.version, 'upserted': upserted, 'removed': removed})
+                self._changed.notify_all()
+
+            active = any(job['status'] in ACTIVE_STATUSES for job in self._jobs.values())
+            if active or upserted or removed:
+                self.interval = self.active_interval
+            else:
+                self.interval = min(self.interval * 2, self.idle_interval)
+            self.last_polled_at = now
+            self.last_error = None
+        self._ready.set()
+        return self.version
+
+    def snapshot(self):
+        """Returns (version, jobs) for the whole index."""
+        with self._changed:
+            return self.version, list(self._jobs.values())
+
+    def get(self, job_id):
+        """Returns the indexed summary of one job, or None if it is not in the index."""
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def changes_since(self, version):
+        """
+        Returns the deltas published after `version`, or None when some of
+        them have been dropped from history and the client must resync from
+        a snapshot.
+        """
+        with self._changed:
+            if version == self.version:
+                return []
+            # A version from before a restart, or older than the retained deltas
+            if version > self.version or not self._deltas or self._deltas[0]['version'] > version + 1:
+                return None
+            return [delta for delta in self._deltas if delta['version'] > version]
+
+    def wait_for_change(self, version, timeout):
+        """Blocks until the index moves past `version` or `timeout` seconds pass."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version > version or self._stop.is_set(), timeout)
+            return self.version
+
+    def wait_until_ready(self, timeout=None):
+        """Blocks until the first poll has completed."""
+        return self._ready.wait(timeout)
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f'Job index poll failed: {e}')
+                self.last_error = str(e)
+                self.interval = self.active_interval
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='job-index', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
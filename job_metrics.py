@@ -0,0 +1,249 @@
+# job_metrics.py
+"""
+CPU, memory and duration series for AWS Batch jobs.
+
+Job details are fetched with describe_jobs in batches of up to 100 IDs and
+utilization with one get_metric_data call per group of jobs (CloudWatch
+accepts up to 500 queries per call). Samples are kept in memory in ring
+buffers downsampled into 1-minute and 10-minute tiers, so serving a
+dashboard with many jobs is a memory read. API calls are made outside the
+collector's lock, so concurrent refreshes of different jobs overlap.
+Finished jobs are evicted least recently used first.
+
+Utilization comes from ECS Container Insights task-level metrics
+(CpuUtilized, MemoryUtilized), which requires Container Insights with
+enhanced observability on the Batch compute environment's ECS cluster.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+DESCRIBE_JOBS_BATCH_SIZE = 100
+MAX_METRIC_QUERIES_PER_CALL = 500
+METRIC_NAMESPACE = 'ECS/ContainerInsights'
+METRIC_PERIOD = 60
+# (series name, CloudWatch metric)
+JOB_METRICS = (('cpu_utilization', 'CpuUtilized'), ('memory_utilization', 'MemoryUtilized'))
+JOBS_PER_METRIC_CALL = MAX_METRIC_QUERIES_PER_CALL // len(JOB_METRICS)
+# Running jobs are re-queried at most this often; finished jobs only once
+DEFAULT_REFRESH_INTERVAL = 60
+
+# Finished jobs whose series are kept in memory
+DEFAULT_MAX_FINISHED_JOBS = 1000
+
+# (tier name, bucket width in seconds, capacity). Container Insights samples
+# arrive every METRIC_PERIOD seconds, so the finest tier is one sample per bucket.
+TIERS = (('1m', 60, 1440), ('10m', 600, 1008))
+TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED'}
+
+
+class RingSeries:
+    """A time series held in fixed-size ring buffers, one per downsampling tier."""
+
+    def __init__(self):
+        self._tiers = {name: deque(maxlen=capacity) for name, _, capacity in TIERS}
+        self.last_timestamp = None
+
+    def add(self, timestamp, value):
+        # Overlapping fetch windows return samples already stored
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return
+        self.last_timestamp = timestamp
+        for name, width, _ in TIERS:
+            tier = self._tiers[name]
+            bucket = timestamp - timestamp % width
+            if tier and tier[-1][0] == bucket:
+                tier[-1][1] += value
+                tier[-1][2] += 1
+            else:
+                tier.append([bucket, value, 1])
+
+    def points(self, tier='1m'):
+        return [[bucket, total / count] for bucket, total, count in self._tiers[tier]]
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _job_resources(job):
+    """Returns the job's reserved (vcpus, memory MiB) from its container details."""
+    container = job.get('container', {})
+    vcpus, memory = container.get('vcpus'), container.get('memory')
+    for requirement in container.get('resourceRequirements', []):
+        if requirement['type'] == 'VCPU':
+            vcpus = float(requirement['value'])
+        elif requirement['type'] == 'MEMORY':
+            memory = float(requirement['value'])
+    return vcpus, memory
+
+
+class MetricsCollector:
+    def __init__(self, batch_client, cloudwatch_client, job_queue, cluster_name=None, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 max_finished_jobs=DEFAULT_MAX_FINISHED_JOBS):
+        self.batch_client = batch_client
+        self.cloudwatch_client = cloudwatch_client
+        self.job_queue = job_queue
+        self.cluster_name = cluster_name
+        self.refresh_interval = refresh_interval
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs = {}
+        self._series = {}
+        self._refreshed_at = {}
+        # Jobs whose metrics were fetched after they finished need no more
+        # calls; ordered from least to most recently used for eviction
+        self._complete = OrderedDict()
+        # Jobs another thread is refreshing right now
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def _resolve_cluster_name(self):
+        """Finds the ECS cluster behind the job queue's first compute environment."""
+        if self.cluster_name is None:
+            queue = self.batch_client.describe_job_queues(jobQueues=[self.job_queue])['jobQueues'][0]
+            compute_environment = queue['computeEnvironmentOrder'][0]['computeEnvironment']
+            environments = self.batch_client.describe_compute_environments(computeEnvironments=[compute_environment])
+            self.cluster_name = environments['computeEnvironments'][0]['ecsClusterArn'].rsplit('/', 1)[-1]
+        return self.cluster_name
+
+    def refresh(self, job_ids):
+        """
+        Fetches details and new metric samples for any of `job_ids` that are
+        stale. Jobs already being refreshed by another thread are skipped.
+        """
+        with self._lock:
+            now = time.time()
+            stale = [
+                job_id for job_id in dict.fromkeys(job_ids)
+                if job_id not in self._complete and job_id not in self._inflight
+                and now - self._refreshed_at.get(job_id, 0) >= self.refresh_interval
+            ]
+            if not stale:
+                return
+            self._inflight.update(stale)
+            # Newest stored sample per job and metric, so only newer samples are requested
+            last_timestamps = {
+                job_id: [series.last_timestamp for series in self._series[job_id].values()]
+                for job_id in stale if job_id in self._series
+            }
+
+        jobs = {}
+        samples = []
+        succeeded = False
+        try:
+            for batch in _batches(stale, DESCRIBE_JOBS_BATCH_SIZE):
+                for job in self.batch_client.describe_jobs(jobs=batch)['jobs']:
+                    jobs[job['jobId']] = job
+            measurable = [job_id for job_id in stale if jobs.get(job_id, {}).get('startedAt')]
+            for group in _batches(measurable, JOBS_PER_METRIC_CALL):
+                samples.extend(self._fetch_metrics(group, jobs, last_timestamps, now))
+            succeeded = True
+        finally:
+            with self._lock:
+                self._inflight.difference_update(stale)
+                self._jobs.update(jobs)
+                for job_id, name, timestamp, value in samples:
+                    job_series = self._series.setdefault(job_id, {series_name: RingSeries() for series_name, _ in JOB_METRICS})
+                    job_series[name].add(timestamp, value)
+                # After a failed call, the stale jobs are retried on the next refresh
+                for job_id in stale if succeeded else ():
+                    self._refreshed_at[job_id] = now
+                    if jobs.get(job_id, {}).get('status') in TERMINAL_STATUSES:
+                        self._complete[job_id] = None
+                self._evict()
+
+    def _evict(self):
+        """Drops the least recently used finished jobs beyond max_finished_jobs. Holds the lock."""
+        while len(self._complete) > self.max_finished_jobs:
+            job_id, _ = self._complete.popitem(last=False)
+            self._jobs.pop(job_id, None)
+            self._series.pop(job_id, None)
+            self._refreshed_at.pop(job_id, None)
+
+    def _fetch_metrics(self, job_ids, jobs, last_timestamps, now):
+        """
+        Issues a single get_metric_data call (plus its pages) for a group of
+        jobs. Runs without the lock.
+
+        Returns:
+            list: (job_id, series name, epoch seconds, percent) samples.
+        """
+        cluster_name = self._resolve_cluster_name()
+        queries = []
+        targets = {}
+        start_time = now
+        for index, job_id in enumerate(job_ids):
+            job = jobs[job_id]
+            task_arn = job.get('container', {}).get('taskArn')
+            if not task_arn:
+                continue
+            # Only ask for samples newer than the ones already stored for every metric
+            series_start = job['startedAt'] / 1000.0
+            stored = last_timestamps.get(job_id)
+            if stored and None not in stored:
+                series_start = max(series_start, min(stored))
+            for name, metric_name in JOB_METRICS:
+                query_id = f'j{index}_{name}'
+                targets[query_id] = (job_id, name)
+                queries.append({
+                    'Id': query_id,
+                    'MetricStat': {
+                        'Metric': {
+                            'Namespace': METRIC_NAMESPACE,
+                            'MetricName': metric_name,
+                            'Dimensions': [
+                                {'Name': 'ClusterName', 'Value': cluster_name},
+                                {'Name': 'TaskId', 'Value': task_arn.rsplit('/', 1)[-1]}
+                            ]
+                        },
+                        'Period': METRIC_PERIOD,
+                        'Stat': 'Average'
+                    }
+                })
+            start_time = min(start_time, series_start)
+        if not queries:
+            return []
+
+        kwargs = {
+            'MetricDataQueries': queries,
+            'StartTime': start_time - start_time % METRIC_PERIOD,
+            'EndTime': now,
+            'ScanBy': 'TimestampAscending'
+        }
+        samples = []
+        while True:
+            response = self.cloudwatch_client.get_metric_data(**kwargs)
+            for result in response['MetricDataResults']:
+                job_id, name = targets[result['Id']]
+                vcpus, memory = _job_resources(jobs[job_id])
+                # CpuUtilized is in CPU units (1024 per vCPU), MemoryUtilized in MiB
+                capacity = vcpus * 1024 if name == 'cpu_utilization' else memory
+                for timestamp, value in sorted(zip(result['Timestamps'], result['Values'])):
+                    epoch = timestamp.timestamp() if hasattr(timestamp, 'timestamp') else float(timestamp)
+                    samples.append((job_id, name, epoch, 100.0 * value / capacity if capacity else value))
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+        return samples
+
+    def job_metrics(self, job_id, tier='1m'):
+        """Returns the stored series and duration for one job."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job_id in self._complete:
+                self._complete.move_to_end(job_id)
+            started_at, stopped_at = job.get('startedAt'), job.get('stoppedAt')
+            duration = None
+            if started_at:
+                duration = ((stopped_at or time.time() * 1000) - started_at) / 1000.0
+            series = self._series.get(job_id, {})
+            return {
+                'job_id': job_id,
+                'status': job['status'],
+                'resolution': tier,
+                'duration_seconds': duration,
+                'metrics': {name: series[name].points(tier) if name in series else [] for name, _ in JOB_METRICS}
+            }
@@ -1,10 +1,687 @@
 import os
 import json
-import boto3
+import time
+import random
+import threading
 import csv
-from io import StringIO
+from collections import OrderedDict
 
-def generate_samplesheet(event, context, dynamodb=None, s3_client=None):
+# boto3, botocore, concurrent.futures and tracing are imported where they are
+# first used. Cold containers pay ~200 ms for boto3 alone, so keeping module
+# import cheap and doing no I/O at import time shortens the Lambda init phase.
+
+# Upper bound on concurrent get_object_tagging calls. Overridable per
+# deployment through the TAG_FETCH_CONCURRENCY environment variable.
+DEFAULT_TAG_FETCH_CONCURRENCY = 32
+TAG_FETCH_MAX_ATTEMPTS = 5
+TAG_FETCH_BASE_DELAY = 0.1
+# Adaptive retries rate-limit the shared S3 client itself once S3 throttles;
+# _fetch_tags backs off further if a call still fails
+S3_CLIENT_RETRIES = {'mode': 'adaptive', 'max_attempts': 3}
+# Samplesheets larger than this many bytes are spilled to S3 and returned as
+# an s3:// URI, keeping responses under the 6 MB Lambda payload limit.
+# Overridable through the SAMPLESHEET_INLINE_LIMIT environment variable.
+DEFAULT_SAMPLESHEET_INLINE_LIMIT = 4 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+SAMPLESHEET_SPILL_PREFIX = 'samplesheets/generated'
+# Completed spills are copied to {prefix}/{sha256}.csv, the key the launcher
+# uses for inline samplesheets, so identical content keeps the same URI
+SAMPLESHEET_CONTENT_PREFIX = 'samplesheets/sha256'
+THROTTLING_ERROR_CODES = {
+    'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+    'TooManyRequestsException', 'ServiceUnavailable', '503',
+}
+# Bounds for the warm-container tag cache. Overridable through the
+# TAG_CACHE_SIZE and TAG_CACHE_TTL_SECONDS environment variables.
+DEFAULT_TAG_CACHE_SIZE = 10000
+DEFAULT_TAG_CACHE_TTL_SECONDS = 300
+# Default header of the generated samplesheet. Requests can name their own
+# columns; any column other than these is read from the item attribute of the
+# same name, falling back to the S3 tag of that name.
+SAMPLESHEET_COLUMNS = ['sample', 'fastq_1', 'fastq_2', 'experimental_group', 'treatment']
+# Item attribute behind each standard column; fastq_2 comes from the S3 tags
+COLUMN_ATTRIBUTES = {'sample': 'sample_id', 'fastq_1': 's3_object_key', 'experimental_group': 'experimental_group', 'treatment': 'treatment'}
+# Attributes every projected read needs: the key, the object and the tag version
+REQUIRED_ATTRIBUTES = ['experiment_id', 'sample_id', 's3_object_key', 'updated_at', 's3_etag']
+# BatchGetItem accepts at most 100 keys per request
+BATCH_GET_MAX_KEYS = 100
+# Sample items are validated against this metadata/schemas record type when
+# METADATA_SCHEMA is set (e.g. experiment_contexts). With
+# METADATA_VALIDATION=strict an invalid item fails the request with 422.
+# With SAMPLESHEET_BACKEND=catalog, samples are read from a metadata_catalog
+# snapshot instead of DynamoDB and S3: either a local file at CATALOG_PATH or
+# an s3:// CATALOG_URI, downloaded to /tmp and re-checked for a newer version
+# at most every CATALOG_REFRESH_SECONDS.
+DEFAULT_CATALOG_REFRESH_SECONDS = 60
+CATALOG_LOCAL_PATH = '/tmp/metadata-catalog.db'
+
+
+class TagCache:
+    """
+    Thread-safe LRU cache of S3 tag sets with a per-entry TTL.
+
+    Every entry is stored with a version token taken from the DynamoDB item
+    (its `updated_at` attribute, or the recorded `s3_etag` of the object).
+    A lookup only hits when the caller presents the same token, so a
+    re-uploaded or re-tagged sample is never served from a stale entry.
+    """
+
+    def __init__(self, max_size=DEFAULT_TAG_CACHE_SIZE, ttl_seconds=DEFAULT_TAG_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_version, expires_at, tags = entry
+                if cached_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return tags
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, tags):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, tags)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Clients and caches live at module scope so warm invocations reuse them
+_dynamodb = None
+_s3_client = None
+_tracing = None
+_catalog = None
+_catalog_etag = None
+_catalog_checked_at = 0.0
+_table_indexes = {}
+_tag_cache = TagCache(
+    max_size=int(os.environ.get('TAG_CACHE_SIZE', DEFAULT_TAG_CACHE_SIZE)),
+    ttl_seconds=float(os.environ.get('TAG_CACHE_TTL_SECONDS', DEFAULT_TAG_CACHE_TTL_SECONDS))
+)
+
+
+def _get_tracing():
+    global _tracing
+    if _tracing is None:
+        try:
+            import tracing
+        except ImportError:
+            # Packaged without tracing.py (e.g. only lambda_function/): timings are not recorded
+            import contextlib
+            from types import SimpleNamespace
+            tracing = SimpleNamespace(
+                span=lambda name: contextlib.nullcontext(),
+                enabled=lambda: False,
+                instrument_client=lambda client: client,
+                snapshot=dict
+            )
+        _tracing = tracing
+    return _tracing
+
+
+def _traced(name):
+    """Times every call of the function as span `name`, importing tracing on the first call."""
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with _get_tracing().span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+def _get_dynamodb():
+    global _dynamodb
+    if _dynamodb is None:
+        import boto3
+        _dynamodb = boto3.resource('dynamodb')
+        _get_tracing().instrument_client(_dynamodb.meta.client)
+    return _dynamodb
+
+
+def _tag_fetch_concurrency():
+    return int(os.environ.get('TAG_FETCH_CONCURRENCY', DEFAULT_TAG_FETCH_CONCURRENCY))
+
+
+def _get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        from botocore.config import Config
+        # One pooled connection per tag-fetch worker; urllib3's default of 10
+        # would make the rest wait or open connections that are thrown away
+        config = Config(max_pool_connections=_tag_fetch_concurrency(), retries=S3_CLIENT_RETRIES)
+        _s3_client = _get_tracing().instrument_client(boto3.client('s3', config=config))
+    return _s3_client
+
+
+def _get_metadata_validator():
+    """Returns the compiled validator named by METADATA_SCHEMA, or None when validation is off."""
+    record_type = os.environ.get('METADATA_SCHEMA')
+    if not record_type:
+        return None
+    # Compiled once per container and cached by metadata_validation
+    from metadata_validation import get_validator
+    return get_validator(record_type)
+
+
+@_traced('samplesheet.catalog')
+def _get_catalog(s3_client):
+    """
+    Returns the metadata catalog named by CATALOG_URI or CATALOG_PATH, opened
+    read-only. An S3 catalog is downloaded again only when its ETag changes.
+    """
+    global _catalog, _catalog_etag, _catalog_checked_at
+    from metadata_catalog import MetadataCatalog
+
+    uri = os.environ.get('CATALOG_URI')
+    if not uri:
+        if _catalog is None:
+            path = os.environ.get('CATALOG_PATH')
+            if not path or not os.path.exists(path):
+                raise ValueError('SAMPLESHEET_BACKEND is catalog but no CATALOG_PATH or CATALOG_URI is available')
+            _catalog = MetadataCatalog(path, readonly=True)
+        return _catalog
+
+    refresh_seconds = float(os.environ.get('CATALOG_REFRESH_SECONDS', DEFAULT_CATALOG_REFRESH_SECONDS))
+    if _catalog is not None and time.monotonic() - _catalog_checked_at < refresh_seconds:
+        return _catalog
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    _catalog_checked_at = time.monotonic()
+    if _catalog is None or etag != _catalog_etag:
+        path = os.environ.get('CATALOG_PATH', CATALOG_LOCAL_PATH)
+        s3_client.download_file(bucket, key, f'{path}.download')
+        if _catalog is not None:
+            _catalog.close()
+        os.replace(f'{path}.download', path)
+        _catalog = MetadataCatalog(path, readonly=True)
+        _catalog_etag = etag
+    return _catalog
+
+
+def _item_version(item):
+    """Returns the token that identifies the current revision of a sample's tags."""
+    return item.get('updated_at') or item.get('s3_etag')
+
+
+def _fetch_tags(s3_client, bucket_name, key):
+    """
+    Fetches the tag set of a single S3 object as a dict, retrying with
+    exponential backoff and full jitter when S3 throttles the request.
+    """
+    from botocore.exceptions import ClientError
+
+    max_attempts = TAG_FETCH_MAX_ATTEMPTS
+    for attempt in range(max_attempts):
+        try:
+            response = s3_client.get_object_tagging(Bucket=bucket_name, Key=key)
+            return {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code not in THROTTLING_ERROR_CODES or attempt == max_attempts - 1:
+                raise
+            time.sleep(random.uniform(0, TAG_FETCH_BASE_DELAY * (2 ** attempt)))
+
+
+@_traced('samplesheet.fetch_tags')
+def fetch_tags_concurrently(s3_client, bucket_name, keys, max_workers=None, versions=None, cache=None):
+    """
+    Fetches tags for many S3 objects with a bounded worker pool.
+
+    Args:
+        s3_client: A boto3 S3 client object (clients are thread-safe).
+        bucket_name (str): Bucket holding the objects.
+        keys (list): Object keys to look up.
+        max_workers (int): Size of the worker pool. Defaults to the
+                           TAG_FETCH_CONCURRENCY environment variable.
+        versions (list): Optional version token per key. Keys with a token
+                         are served from and stored in `cache`.
+        cache (TagCache): Optional cache of previously fetched tag sets.
+
+    Returns:
+        list: One entry per key, in the same order as `keys`. Each entry is
+              either the tag dict or the exception raised for that key.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if max_workers is None:
+        max_workers = _tag_fetch_concurrency()
+    max_workers = max(1, min(max_workers, len(keys) or 1))
+
+    if versions is None:
+        versions = [None] * len(keys)
+
+    def fetch(key, version):
+        use_cache = cache is not None and version is not None
+        if use_cache:
+            tags = cache.get((bucket_name, key), version)
+            if tags is not None:
+                return tags
+        try:
+            tags = _fetch_tags(s3_client, bucket_name, key)
+        except Exception as e:
+            return e
+        if use_cache:
+            cache.put((bucket_name, key), version, tags)
+        return tags
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map() yields results in submission order, so rows keep the DynamoDB order
+        return list(executor.map(fetch, keys, versions))
+
+
+def get_table_indexes(table):
+    """
+    Returns the table's secondary indexes as
+    [{'name', 'hash', 'range', 'projection', 'attributes', 'local'}], described
+    once per container. A role without dynamodb:DescribeTable gets no indexes.
+    """
+    if table.name not in _table_indexes:
+        from botocore.exceptions import ClientError
+
+        indexes = []
+        try:
+            for local, descriptions in ((True, table.local_secondary_indexes), (False, table.global_secondary_indexes)):
+                for index in descriptions or []:
+                    keys = {key['KeyType']: key['AttributeName'] for key in index['KeySchema']}
+                    indexes.append({
+                        'name': index['IndexName'],
+                        'hash': keys['HASH'],
+                        'range': keys.get('RANGE'),
+                        'projection': index['Projection']['ProjectionType'],
+                        'attributes': set(index['Projection'].get('NonKeyAttributes', [])) | set(keys.values()),
+                        'local': local
+                    })
+        except ClientError as e:
+            print(f"Could not describe table {table.name}; querying without secondary indexes: {e}")
+        _table_indexes[table.name] = indexes
+    return _table_indexes[table.name]
+
+
+def _single_value(filters, name):
+    """Returns the value a filter pins `name` to, or None when it accepts several or none."""
+    value = filters.get(name)
+    if isinstance(value, (list, tuple)):
+        return value[0] if len(value) == 1 else None
+    return value
+
+
+def choose_index(indexes, filters, attributes=None):
+    """
+    Picks a secondary index whose key is pinned by `filters`, so that only
+    matching items are read. A local index needs its sort key filtered; a
+    global index needs its partition key filtered and, if it has a sort key,
+    that key must be experiment_id. The index must project every attribute
+    the read needs (all of them when `attributes` is None).
+
+    Returns:
+        dict: The chosen index, or None to query the table itself.
+    """
+    for index in indexes:
+        if index['local']:
+            pinned = index['range'] is not None and _single_value(filters, index['range']) is not None
+        else:
+            pinned = _single_value(filters, index['hash']) is not None and index['range'] in (None, 'experiment_id')
+        if not pinned:
+            continue
+        projected = index['projection'] == 'ALL' or (
+            attributes is not None and set(attributes) <= index['attributes'] | set(REQUIRED_ATTRIBUTES[:2])
+        )
+        if projected:
+            return index
+    return None
+
+
+def _condition(name, value):
+    from boto3.dynamodb.conditions import Attr
+
+    if isinstance(value, (list, tuple)):
+        return Attr(name).is_in(list(value))
+    return Attr(name).eq(value)
+
+
+def _projection_kwargs(attributes):
+    """Returns ProjectionExpression parameters reading only `attributes`, or {} for whole items."""
+    if attributes is None:
+        return {}
+    names = {f'#p{i}': name for i, name in enumerate(attributes)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+
+def query_experiment_pages(table, experiment_id, page_size=None, filters=None, attributes=None, indexes=()):
+    """
+    Yields pages of DynamoDB items for an experiment, following
+    LastEvaluatedKey until the query is exhausted.
+
+    Args:
+        table: A boto3 DynamoDB Table resource.
+        experiment_id (str): Partition key value to query.
+        page_size (int): Optional Limit for each query request.
+        filters (dict): Optional attribute name to a value or list of
+                        accepted values. Applied as a FilterExpression, or as
+                        the key condition of a matching index in `indexes`.
+        attributes (list): Optional attributes to read (ProjectionExpression).
+                           Whole items are read when None.
+        indexes (list): Secondary indexes from get_table_indexes.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    filters = dict(filters or {})
+    index = choose_index(indexes, filters, attributes)
+    if index is None:
+        key_condition = Key('experiment_id').eq(experiment_id)
+    elif index['local']:
+        key_condition = Key('experiment_id').eq(experiment_id) & Key(index['range']).eq(_single_value(filters, index['range']))
+        filters.pop(index['range'])
+    else:
+        key_condition = Key(index['hash']).eq(_single_value(filters, index['hash']))
+        filters.pop(index['hash'])
+        if index['range'] == 'experiment_id':
+            key_condition = key_condition & Key('experiment_id').eq(experiment_id)
+        else:
+            filters['experiment_id'] = experiment_id
+
+    query_kwargs = {'KeyConditionExpression': key_condition, **_projection_kwargs(attributes)}
+    if index is not None:
+        query_kwargs['IndexName'] = index['name']
+    if filters:
+        conditions = [_condition(name, value) for name, value in filters.items()]
+        filter_expression = conditions[0]
+        for condition in conditions[1:]:
+            filter_expression = filter_expression & condition
+        query_kwargs['FilterExpression'] = filter_expression
+    if page_size:
+        query_kwargs['Limit'] = page_size
+
+    while True:
+        response = table.query(**query_kwargs)
+        yield response.get('Items', [])
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        if not last_evaluated_key:
+            return
+        query_kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+
+def _matches(item, filters):
+    for name, value in filters.items():
+        accepted = value if isinstance(value, (list, tuple)) else [value]
+        if item.get(name) not in accepted:
+            return False
+    return True
+
+
+def get_sample_pages(dynamodb, table_name, experiment_id, sample_ids, filters=None, attributes=None):
+    """
+    Yields pages of the listed samples' items, read by key with BatchGetItem
+    rather than querying the whole experiment. Pages keep the order of
+    `sample_ids`; unknown samples and items not matching `filters` are
+    dropped.
+    """
+    sample_ids = list(dict.fromkeys(sample_ids))
+    if attributes is not None and filters:
+        # Filters are applied here, so their attributes must be read too
+        attributes = list(dict.fromkeys(list(attributes) + list(filters)))
+    for start in range(0, len(sample_ids), BATCH_GET_MAX_KEYS):
+        chunk = sample_ids[start:start + BATCH_GET_MAX_KEYS]
+        request = {'Keys': [{'experiment_id': experiment_id, 'sample_id': sample_id} for sample_id in chunk],
+                   **_projection_kwargs(attributes)}
+        found = {}
+        attempt = 0
+        while request:
+            response = dynamodb.batch_get_item(RequestItems={table_name: request})
+            for item in response.get('Responses', {}).get(table_name, []):
+                found[item['sample_id']] = item
+            request = response.get('UnprocessedKeys', {}).get(table_name)
+            if request:
+                time.sleep(random.uniform(0, TAG_FETCH_BASE_DELAY * (2 ** min(attempt, 6))))
+                attempt += 1
+        yield [found[sample_id] for sample_id in chunk
+               if sample_id in found and _matches(found[sample_id], filters or {})]
+
+
+def tagged_pages(pages, s3_client, bucket_name, tag_cache=None, fetch_tags=True):
+    """
+    Pairs each page of DynamoDB items with their S3 tags, fetched
+    concurrently. Yields lists of (item, tags); tags is None for items with
+    no S3 object and the raised exception when the lookup failed. With
+    `fetch_tags` False no tags are fetched and every item gets {}.
+    """
+    for items in pages:
+        if not fetch_tags:
+            yield [(item, {}) for item in items]
+            continue
+        tagged = [item for item in items if item.get('s3_object_key')]
+        tag_results = iter(fetch_tags_concurrently(
+            s3_client,
+            bucket_name,
+            [item['s3_object_key'] for item in tagged],
+            versions=[_item_version(item) for item in tagged],
+            cache=tag_cache
+        ))
+        yield [(item, next(tag_results) if item.get('s3_object_key') else None) for item in items]
+
+
+def columns_need_tags(columns):
+    """Whether any of the columns may be read from S3 tags."""
+    return any(column not in COLUMN_ATTRIBUTES for column in columns)
+
+
+def projected_attributes(columns):
+    """Returns the item attributes needed to fill `columns`."""
+    attributes = list(REQUIRED_ATTRIBUTES)
+    for column in columns:
+        attribute = COLUMN_ATTRIBUTES.get(column, column if column != 'fastq_2' else None)
+        if attribute and attribute not in attributes:
+            attributes.append(attribute)
+    return attributes
+
+
+def samplesheet_row(item, s3_tags, bucket_name, columns=SAMPLESHEET_COLUMNS):
+    """Combines a sample's DynamoDB item and S3 tags into one samplesheet row."""
+    s3_tags = s3_tags or {}
+    row = {}
+    for column in columns:
+        if column == 'sample':
+            row[column] = item.get('sample_id')
+        elif column == 'fastq_1':
+            row[column] = f"s3://{bucket_name}/{item['s3_object_key']}"
+        elif column == 'fastq_2':
+            row[column] = s3_tags.get('fastq_2', '') # Assumes fastq_2 path is in tags if it exists
+        else:
+            value = item.get(column)
+            row[column] = value if value is not None else s3_tags.get(column, '')
+    return row
+
+
+def _filter_value(name, value):
+    """
+    Validates one filter value (or list of values) from a request. JSON
+    floats become Decimals, the type DynamoDB stores numbers as and the only
+    one its serializer accepts.
+    """
+    from decimal import Decimal
+
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, (str, int, float, bool)) for v in values):
+        raise ValueError(f"filter '{name}' must be a value or a non-empty list of values")
+    converted = []
+    for v in values:
+        if isinstance(v, float):
+            v = Decimal(str(v))
+            if not v.is_finite():
+                raise ValueError(f"filter '{name}' must not be NaN or infinite")
+        converted.append(v)
+    return converted if isinstance(value, list) else converted[0]
+
+
+def _in_sample_order(pages, sample_ids):
+    """
+    Yields the rows of `pages` as one page ordered like `sample_ids`, as
+    get_sample_pages returns them; samples of the same ID in several
+    experiments keep their relative order.
+    """
+    position = {sample_id: n for n, sample_id in enumerate(dict.fromkeys(sample_ids))}
+    rows = [row for page in pages for row in page]
+    rows.sort(key=lambda row: position.get(row[0]['sample_id'], len(position)))
+    if rows:
+        yield rows
+
+
+def _parse_request(body, use_catalog):
+    """Returns (experiment_id, filters, sample_ids, columns) from a request body, raising ValueError when invalid."""
+    experiment_id = body.get('experiment_id')
+    filters = body.get('filters') or {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object of attribute names to values")
+    filters = {name: _filter_value(name, value) for name, value in filters.items()}
+    sample_ids = body.get('sample_ids')
+    if sample_ids is not None and (not isinstance(sample_ids, list) or not all(isinstance(v, str) for v in sample_ids)):
+        raise ValueError("sample_ids must be a list of strings")
+    columns = body.get('columns') or SAMPLESHEET_COLUMNS
+    if not isinstance(columns, list) or not all(isinstance(c, str) and c for c in columns) or len(set(columns)) != len(columns):
+        raise ValueError("columns must be a list of distinct column names")
+    if not experiment_id and not (use_catalog and (filters or sample_ids)):
+        if filters or sample_ids:
+            raise ValueError("Queries across experiments require SAMPLESHEET_BACKEND=catalog")
+        raise ValueError("experiment_id not found in request body")
+    return experiment_id, filters, sample_ids, columns
+
+
+class SpillingOutput:
+    """
+    File-like sink for the CSV writer. Rows are kept in memory until the
+    output grows past `inline_limit` bytes; from then on they are streamed
+    to S3 as a multipart upload, one part every `part_size` bytes.
+
+    The content is hashed as it is written. With a `content_prefix`, the
+    completed upload is copied to {content_prefix}/{sha256}.csv and the
+    temporary key is deleted, so relaunching the same samplesheet yields the
+    same URI (and Nextflow's -resume cache still applies).
+    """
+
+    def __init__(self, s3_client, bucket_name, key, inline_limit, part_size=MULTIPART_PART_SIZE, content_prefix=None):
+        import hashlib
+
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.inline_limit = inline_limit
+        self.part_size = part_size
+        self.content_prefix = content_prefix
+        self.upload_id = None
+        self._digest = hashlib.sha256()
+        self._chunks = []
+        self._buffered_bytes = 0
+        self._parts = []
+
+    @property
+    def spilled(self):
+        return self.upload_id is not None
+
+    @property
+    def uri(self):
+        return f's3://{self.bucket_name}/{self.key}'
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._chunks.append(text)
+        self._buffered_bytes += len(data)
+        self._digest.update(data)
+        if not self.spilled and self._buffered_bytes > self.inline_limit:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                ContentType='text/csv'
+            )
+            self.upload_id = response['UploadId']
+        if self.spilled and self._buffered_bytes >= self.part_size:
+            self._upload_part()
+        return len(text)
+
+    def _upload_part(self):
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=''.join(self._chunks).encode('utf-8')
+        )
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self._chunks = []
+        self._buffered_bytes = 0
+
+    def getvalue(self):
+        return ''.join(self._chunks)
+
+    def close(self):
+        """
+        Uploads any buffered rows and completes the multipart upload, then
+        moves it to its content-addressed key if a content_prefix is set.
+        """
+        if not self.spilled:
+            return
+        if self._chunks or not self._parts:
+            self._upload_part()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': self._parts}
+        )
+        if not self.content_prefix:
+            return
+
+        from botocore.exceptions import ClientError
+
+        final_key = f'{self.content_prefix}/{self._digest.hexdigest()}.csv'
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=final_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+            self.s3_client.copy_object(
+                Bucket=self.bucket_name,
+                Key=final_key,
+                CopySource={'Bucket': self.bucket_name, 'Key': self.key},
+                ContentType='text/csv',
+                MetadataDirective='REPLACE'
+            )
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=self.key)
+        self.key = final_key
+
+    def abort(self):
+        if self.spilled:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+
+
+def generate_samplesheet(event, context, dynamodb=None, s3_client=None, tag_cache=None, inline_limit=None):
     """
     Generates a Nextflow samplesheet by combining experimental context from DynamoDB
     with core sample metadata from S3 object tags.
@@ -12,27 +689,43 @@ def generate_samplesheet(event, context, dynamodb=None, s3_client=None):
     Args:
         event (dict): API Gateway Lambda Proxy Input Format
         context (dict): Lambda Context runtime methods and attributes
-        dynamodb: A boto3 DynamoDB resource object. If not provided, a new one
-                  will be created.
-        s3_client: A boto3 S3 client object. If not provided, a new one will
-                   be created.
+        dynamodb: A boto3 DynamoDB resource object. If not provided, the
+                  module-level resource is created once and reused.
+        s3_client: A boto3 S3 client object. If not provided, the
+                   module-level client is created once and reused.
+        tag_cache (TagCache): Cache of tag sets. Defaults to the module-level
+                              cache shared by warm invocations.
+        inline_limit (int): Bytes returned inline before spilling to S3.
+                            Defaults to SAMPLESHEET_INLINE_LIMIT.
+
+    With TRACING_ENABLED set, the span and AWS API call timings of this
+    container (cumulative over warm invocations) are logged after each call.
     """
+    tracing = _get_tracing()
+    with tracing.span('samplesheet.generate'):
+        response = _generate_samplesheet(event, dynamodb, s3_client, tag_cache, inline_limit)
+    if tracing.enabled():
+        print(f"Timings: {json.dumps(tracing.snapshot())}")
+    return response
+
+
+def _generate_samplesheet(event, dynamodb, s3_client, tag_cache, inline_limit):
     if not dynamodb:
-        dynamodb = boto3.resource('dynamodb')
+        dynamodb = _get_dynamodb()
     if not s3_client:
-        s3_client = boto3.client('s3')
-    """
-    Generates a Nextflow samplesheet by combining experimental context from DynamoDB
-    with core sample metadata from S3 object tags.
-    """
+        s3_client = _get_s3_client()
+    if tag_cache is None:
+        tag_cache = _tag_cache
     print(f"Received event: {event}")
     
-    # Extract experiment_id from the Lambda event payload
+    use_catalog = os.environ.get('SAMPLESHEET_BACKEND') == 'catalog'
+
+    # Extract experiment_id, and optionally filters, sample_ids and columns,
+    # from the Lambda event payload. The catalog backend can also select
+    # samples across experiments by filters alone.
     try:
         body = json.loads(event.get('body', '{}'))
-        experiment_id = body.get('experiment_id')
-        if not experiment_id:
-            raise ValueError("experiment_id not found in request body")
+        experiment_id, filters, sample_ids, columns = _parse_request(body, use_catalog)
     except (json.JSONDecodeError, ValueError) as e:
         return {
             'statusCode': 400,
@@ -49,65 +742,116 @@ def generate_samplesheet(event, context, dynamodb=None, s3_client=None):
             'body': json.dumps('Error: DYNAMODB_TABLE or S3_BUCKET environment variables not set.')
         }
 
+    import uuid
+
     table = dynamodb.Table(table_name)
+    if inline_limit is None:
+        inline_limit = int(os.environ.get('SAMPLESHEET_INLINE_LIMIT', DEFAULT_SAMPLESHEET_INLINE_LIMIT))
 
-    # Query DynamoDB for all samples in the experiment
+    # Prepare CSV output
+    output = SpillingOutput(
+        s3_client,
+        bucket_name,
+        f"{SAMPLESHEET_SPILL_PREFIX}/{experiment_id or 'catalog-query'}/{uuid.uuid4().hex}.csv",
+        inline_limit,
+        content_prefix=SAMPLESHEET_CONTENT_PREFIX
+    )
+    writer = csv.DictWriter(output, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+
+    hits_before, misses_before = tag_cache.hits, tag_cache.misses
+
+    validator = _get_metadata_validator()
+    if validator:
+        from metadata_validation import ValidationReport
+        report = ValidationReport(validator.record_type)
+
+    # Page through the samples so only one page is held in memory at a time
+    item_count = 0
+    row_count = 0
     try:
-        response = table.query(
-            KeyConditionExpression='experiment_id = :eid',
-            ExpressionAttributeValues={':eid': experiment_id}
-        )
-        items = response.get('Items', [])
+        if use_catalog:
+            catalog_filters = dict(filters, sample_id=sample_ids) if sample_ids is not None else filters
+            pages = _get_catalog(s3_client).query_pages(catalog_filters, experiment_id)
+            if sample_ids is not None:
+                # The catalog returns samples in key order; match the DynamoDB backend
+                pages = _in_sample_order(pages, sample_ids)
+        else:
+            # Validation needs whole items; otherwise only the attributes behind the columns are read
+            attributes = None if validator else projected_attributes(columns)
+            if sample_ids is not None:
+                items = get_sample_pages(dynamodb, table_name, experiment_id, sample_ids, filters, attributes)
+            else:
+                items = query_experiment_pages(table, experiment_id, filters=filters, attributes=attributes,
+                                               indexes=get_table_indexes(table) if filters else ())
+            pages = tagged_pages(items, s3_client, bucket_name, tag_cache, fetch_tags=columns_need_tags(columns))
+        for rows in pages:
+            item_count += len(rows)
+            if validator:
+                for item, _ in rows:
+                    report.add(item, validator.errors(item))
+
+            # Process each sample
+            for item, s3_tags in rows:
+                if not item.get('s3_object_key'):
+                    continue
+                if isinstance(s3_tags, Exception):
+                    print(f"Skipping sample {item.get('sample_id')} due to error: {str(s3_tags)}")
+                    continue
+
+                # Combine data from DynamoDB and S3 tags
+                writer.writerow(samplesheet_row(item, s3_tags, bucket_name, columns))
+                row_count += 1
+
+        if validator and report.invalid and os.environ.get('METADATA_VALIDATION') == 'strict':
+            output.abort()
+            return {
+                'statusCode': 422,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'Sample metadata failed validation', 'validation': report.to_dict()}, default=str)
+            }
+        if item_count:
+            output.close()
     except Exception as e:
+        output.abort()
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error querying DynamoDB: {str(e)}')
+            'body': json.dumps(f'Error generating samplesheet: {str(e)}')
         }
 
-    if not items:
+    if not item_count:
+        output.abort()
         return {
             'statusCode': 404,
-            'body': json.dumps(f'No samples found for experiment_id: {experiment_id}')
+            'body': json.dumps(
+                f'No samples found for experiment_id: {experiment_id}' if not filters and sample_ids is None
+                else f"No samples in {experiment_id or 'the catalog'} match filters: {json.dumps(filters, default=str)}, sample_ids: {json.dumps(sample_ids)}"
+            )
         }
 
-    # Prepare CSV output
-    output = StringIO()
-    # Define header based on expected data
-    header = ['sample', 'fastq_1', 'fastq_2', 'experimental_group', 'treatment'] # Add other fields as needed
-    writer = csv.DictWriter(output, fieldnames=header, extrasaction='ignore')
-    writer.writeheader()
-
-    # Process each sample
-    for item in items:
-        try:
-            s3_object_key = item.get('s3_object_key')
-            if not s3_object_key:
-                continue
-
-            # Fetch core metadata from S3 object tags
-            tags_response = s3_client.get_object_tagging(
-                Bucket=bucket_name,
-                Key=s3_object_key
-            )
-            s3_tags = {tag['Key']: tag['Value'] for tag in tags_response.get('TagSet', [])}
-
-            # Combine data from DynamoDB and S3 tags
-            row_data = {
-                'sample': item.get('sample_id'),
-                'fastq_1': f's3://{bucket_name}/{s3_object_key}',
-                'fastq_2': s3_tags.get('fastq_2', ''), # Assumes fastq_2 path is in tags if it exists
-                'experimental_group': item.get('experimental_group'),
-                'treatment': item.get('treatment')
-            }
-            writer.writerow(row_data)
+    # Report cache effectiveness for this invocation so the cache size can be tuned
+    cache_headers = {
+        'X-Tag-Cache-Hits': str(tag_cache.hits - hits_before),
+        'X-Tag-Cache-Misses': str(tag_cache.misses - misses_before),
+        'X-Tag-Cache-Size': str(len(tag_cache))
+    }
+    if validator:
+        cache_headers['X-Metadata-Invalid-Records'] = str(report.invalid)
+        if report.invalid:
+            print(f"{report.invalid} of {report.total} samples failed {validator.record_type} validation: {json.dumps(report.to_dict()['fields'], default=str)}")
 
-        except Exception as e:
-            print(f"Skipping sample {item.get('sample_id')} due to error: {str(e)}")
-            continue
+    # Large samplesheets are returned by reference rather than inline
+    if output.spilled:
+        print(f"Samplesheet exceeded {inline_limit} bytes; written to {output.uri}")
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', **cache_headers},
+            'body': json.dumps({'samplesheet_uri': output.uri, 'rows': row_count})
+        }
 
     # Return the CSV content
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'text/csv'},
+        'headers': {'Content-Type': 'text/csv', **cache_headers},
         'body': output.getvalue()
     }
@@ -3,67 +3,291 @@
 
 import boto3
 import argparse
+import atexit
+import contextlib
+import hashlib
 import json
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from sizing import HeadJobSizer
+import tracing
+
+# Connection pool size for the shared boto3 clients. Manifest mode runs up to
+# this many Lambda invocations and S3 uploads at once over the same clients.
+DEFAULT_MAX_POOL_CONNECTIONS = 32
+DEFAULT_MANIFEST_WORKERS = 16
+# AWS Batch throttles SubmitJob well below the rate a thread pool can reach
+DEFAULT_SUBMIT_RATE = 5.0
+DEFAULT_HEAD_JOB_SIZE = {'vcpus': 1, 'memory': 1024, 'reason': 'default head-job size'}
+# Watch mode polls every job with DescribeJobs, which takes at most 100 IDs.
+# Polling starts every WATCH_MIN_INTERVAL seconds, doubles after each poll
+# that sees no change up to WATCH_MAX_INTERVAL, and drops back to the minimum
+# as soon as any job changes state.
+DESCRIBE_JOBS_MAX_IDS = 100
+WATCH_MIN_INTERVAL = 2.0
+WATCH_MAX_INTERVAL = 60.0
+# Jobs in these states usually move on within seconds
+WATCH_TRANSITIONAL_STATUSES = {'SUBMITTED', 'STARTING'}
+WATCH_TRANSITIONAL_MAX_INTERVAL = 8.0
+TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED'}
+# Rounds a job may be missing from DescribeJobs before it is reported NOT_FOUND
+WATCH_NOT_FOUND_ROUNDS = 3
+THROTTLING_ERROR_CODES = {'TooManyRequestsException', 'ThrottlingException', 'Throttling'}
+# Exit codes of watch mode
+EXIT_SUCCEEDED = 0
+EXIT_FAILED = 1
+EXIT_TIMED_OUT = 3
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_manifest(manifest_path):
+    """
+    Loads a bulk submission manifest.
+
+    A `.json` manifest is a list whose entries are either experiment IDs or
+    objects with any of `experiment_id`, `params` (path to a params JSON file)
+    and `name`. Any other file is read as one entry per line: a path ending in
+    `.json` is taken as a params file, anything else as an experiment ID.
+    Blank lines and lines starting with `#` are ignored.
+    """
+    with open(manifest_path, 'r') as f:
+        if manifest_path.endswith('.json'):
+            raw_entries = json.load(f)
+        else:
+            raw_entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    entries = []
+    for raw in raw_entries:
+        if isinstance(raw, dict):
+            entries.append(raw)
+        elif raw.endswith('.json'):
+            entries.append({'params': raw})
+        else:
+            entries.append({'experiment_id': raw})
+    return entries
+
+
+def parse_size(value):
+    """
+    argparse type for --size: 'auto', or '<vcpus>x<memory MiB>' such as '4x8192'.
+
+    Returns:
+        'auto', or a {'vcpus', 'memory', 'reason'} dict with memory in MiB.
+    """
+    if value.strip().lower() == 'auto':
+        return 'auto'
+    parts = value.strip().lower().split('x')
+    if len(parts) != 2 or not all(part.isdigit() and int(part) > 0 for part in parts):
+        raise argparse.ArgumentTypeError(
+            f"invalid head-job size '{value}': expected 'auto' or '<vcpus>x<memory MiB>' with positive integers, such as '4x8192'"
+        )
+    return {'vcpus': int(parts[0]), 'memory': int(parts[1]), 'reason': 'requested with --size'}
+
+
+def watch_exit_code(statuses):
+    """Returns the exit code for the final statuses of watched jobs."""
+    if any(status not in TERMINAL_STATUSES | {'NOT_FOUND'} for status in statuses.values()):
+        return EXIT_TIMED_OUT
+    if all(status == 'SUCCEEDED' for status in statuses.values()):
+        return EXIT_SUCCEEDED
+    return EXIT_FAILED
+
 
 class NextflowLauncher:
-    def __init__(self, region='us-east-1'):
-        self.batch_client = boto3.client('batch', region_name=region)
-        self.s3_client = boto3.client('s3', region_name=region)
-        self.lambda_client = boto3.client('lambda', region_name=region)
-        
-    def submit_workflow(self, workflow_url, params_file, bucket_name, job_queue, job_definition, experiment_id=None, lambda_function_name=None, job_name=None):
-        if not job_name:
-            job_name = f"nextflow-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    def __init__(self, region='us-east-1', max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS):
+        # Clients are thread-safe and shared by every worker in manifest mode
+        config = Config(max_pool_connections=max_pool_connections, retries={'mode': 'standard'})
+        self.batch_client = tracing.instrument_client(boto3.client('batch', region_name=region, config=config))
+        self.s3_client = tracing.instrument_client(boto3.client('s3', region_name=region, config=config))
+        self.lambda_client = tracing.instrument_client(boto3.client('lambda', region_name=region, config=config))
+        # (bucket, key) pairs of content-addressed objects known to exist in S3
+        self._known_objects = set()
+        self._sizers = {}
+        self._sizers_lock = threading.Lock()
 
-        with open(params_file, 'r') as f:
-            params_data = json.load(f)
+    @tracing.traced('launcher.generate_samplesheet')
+    def generate_samplesheet(self, experiment_id, lambda_function_name):
+        """
+        Invokes the samplesheet Lambda for an experiment.
 
-        if experiment_id:
-            if not lambda_function_name:
-                raise ValueError("Lambda function name must be provided when using experiment_id")
+        Returns:
+            tuple: (content, uri, rows). Small samplesheets come back inline
+                   as CSV content with uri None; large ones are written to S3
+                   by the Lambda and come back as an s3:// uri with content
+                   None. rows is the number of samples in the samplesheet.
+        """
+        if not lambda_function_name:
+            raise ValueError("Lambda function name must be provided when using experiment_id")
 
-            print(f"Invoking Lambda {lambda_function_name} for experiment: {experiment_id}")
-            
-            # The payload for the Lambda function must be structured correctly
-            payload = {
-                'body': json.dumps({'experiment_id': experiment_id})
-            }
+        print(f"Invoking Lambda {lambda_function_name} for experiment: {experiment_id}")
+
+        # The payload for the Lambda function must be structured correctly
+        payload = {
+            'body': json.dumps({'experiment_id': experiment_id})
+        }
 
-            response = self.lambda_client.invoke(
-                FunctionName=lambda_function_name,
-                InvocationType='RequestResponse',
-                Payload=json.dumps(payload)
+        response = self.lambda_client.invoke(
+            FunctionName=lambda_function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(payload)
+        )
+
+        response_payload = json.loads(response['Payload'].read().decode('utf-8'))
+
+        if response_payload.get('statusCode') != 200:
+            raise Exception(f"Lambda function returned an error: {response_payload.get('body')}")
+
+        content_type = response_payload.get('headers', {}).get('Content-Type', 'text/csv')
+        if content_type == 'application/json':
+            # Large samplesheets are written to S3 by the Lambda and returned by reference
+            body = json.loads(response_payload.get('body'))
+            return None, body['samplesheet_uri'], body.get('rows')
+        content = response_payload.get('body')
+        return content, None, max(len(content.splitlines()) - 1, 0)
+
+    def prepare_params(self, params_data, bucket_name, experiment_id=None, lambda_function_name=None):
+        """
+        Returns a copy of `params_data` with `input` pointing at the experiment's
+        samplesheet in S3, and the samplesheet's sample count (None without an
+        experiment). Inline samplesheets are uploaded straight from memory to a
+        content-addressed key.
+        """
+        params_data = dict(params_data)
+        if not experiment_id:
+            return params_data, None
+
+        samplesheet_content, samplesheet_uri, sample_count = self.generate_samplesheet(experiment_id, lambda_function_name)
+        if samplesheet_uri:
+            print(f"Lambda wrote samplesheet to {samplesheet_uri}")
+        else:
+            samplesheet_uri = self.put_content_addressed(
+                samplesheet_content.encode('utf-8'), bucket_name, 'samplesheets', '.csv', 'text/csv'
             )
-            
-            response_payload = json.loads(response['Payload'].read().decode('utf-8'))
-            
-            if response_payload.get('statusCode') != 200:
-                raise Exception(f"Lambda function returned an error: {response_payload.get('body')}")
-
-            samplesheet_content = response_payload.get('body')
-            samplesheet_path = 'samplesheet.csv'
-            with open(samplesheet_path, 'w', newline='') as f:
-                f.write(samplesheet_content)
-
-            print(f"Successfully generated {samplesheet_path} from Lambda response.")
-
-            samplesheet_key = f"samplesheets/{job_name}.csv"
-            print(f"Uploading samplesheet to s3://{bucket_name}/{samplesheet_key}")
-            self.s3_client.upload_file(samplesheet_path, bucket_name, samplesheet_key)
-            
-            params_data['input'] = f's3://{bucket_name}/{samplesheet_key}'
-        
-        params_key = f"params/{job_name}.json"
+
+        params_data['input'] = samplesheet_uri
+        return params_data, sample_count
+
+    @tracing.traced('launcher.put_content_addressed')
+    def put_content_addressed(self, body, bucket_name, prefix, extension, content_type):
+        """
+        Stores `body` under a key derived from its SHA-256 digest and returns
+        the object's s3:// URI. The upload is skipped when the object is already
+        known to this launcher or a HEAD request finds it in the bucket, so
+        relaunching identical inputs reuses the same URI and Nextflow's cache.
+        """
+        key = f"{prefix}/sha256/{hashlib.sha256(body).hexdigest()}{extension}"
+        uri = f's3://{bucket_name}/{key}'
+
+        if (bucket_name, key) in self._known_objects:
+            print(f"Reusing {uri}")
+            return uri
+        try:
+            self.s3_client.head_object(Bucket=bucket_name, Key=key)
+            print(f"Reusing existing {uri}")
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+            print(f"Uploading {uri}")
+            self.s3_client.put_object(Body=body, Bucket=bucket_name, Key=key, ContentType=content_type)
+
+        self._known_objects.add((bucket_name, key))
+        return uri
+
+    def upload_params(self, params_data, bucket_name, params_key=None):
+        """
+        Uploads a params file and returns its s3:// URI. Without an explicit
+        `params_key` the file is stored content-addressed under params/sha256/.
+        """
+        # Sorted keys make the serialized form, and so its digest, stable
+        body = json.dumps(params_data, indent=4, sort_keys=True).encode('utf-8')
+        if not params_key:
+            return self.put_content_addressed(body, bucket_name, 'params', '.json', 'application/json')
+
         print(f"Uploading params to s3://{bucket_name}/{params_key}")
         self.s3_client.put_object(
-            Body=json.dumps(params_data, indent=4),
+            Body=body,
             Bucket=bucket_name,
             Key=params_key
         )
-        
-        params_s3_path = f's3://{bucket_name}/{params_key}'
+        return f's3://{bucket_name}/{params_key}'
+
+    @tracing.traced('launcher.resolve_size')
+    def resolve_size(self, size, bucket_name, sample_count):
+        """
+        Turns a --size value into head-job resources.
+
+        Args:
+            size (str|dict): None for the defaults, 'auto' to size from the
+                        sample count and past runs' trace files, or an
+                        explicit '<vcpus>x<memory MiB>' such as '4x8192'
+                        (a string, or already parsed by `parse_size`).
+            bucket_name (str): Bucket whose work/trace/ prefix holds past traces.
+            sample_count (int): Samplesheet rows, if known.
+
+        Returns:
+            dict: {'vcpus', 'memory', 'reason'} with memory in MiB.
+        """
+        if not size:
+            return dict(DEFAULT_HEAD_JOB_SIZE)
+        if isinstance(size, str):
+            size = parse_size(size)
+        if size == 'auto':
+            with self._sizers_lock:
+                if bucket_name not in self._sizers:
+                    self._sizers[bucket_name] = HeadJobSizer(self.s3_client, bucket_name)
+                sizer = self._sizers[bucket_name]
+            return sizer.choose(sample_count)
+        return dict(size)
+
+    def container_overrides(self, bucket_name, size=None, command=None, environment=None):
+        size = size or DEFAULT_HEAD_JOB_SIZE
+        overrides = {
+            'vcpus': size['vcpus'],
+            'memory': size['memory'], # in MiB
+            'environment': [
+                {'name': 'NXF_MODE', 'value': 'batch'},
+                {'name': 'NXF_WORK', 'value': f's3://{bucket_name}/work'}
+            ] + (environment or [])
+        }
+        if command:
+            overrides['command'] = command
+        return overrides
+
+    @tracing.traced('launcher.submit_workflow')
+    def submit_workflow(self, workflow_url, params_file, bucket_name, job_queue, job_definition, experiment_id=None, lambda_function_name=None, job_name=None, size=None):
+        if not job_name:
+            job_name = f"nextflow-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+        with open(params_file, 'r') as f:
+            params_data = json.load(f)
+
+        params_data, sample_count = self.prepare_params(params_data, bucket_name, experiment_id, lambda_function_name)
+        params_s3_path = self.upload_params(params_data, bucket_name)
+
+        head_job_size = self.resolve_size(size, bucket_name, sample_count)
+        print(f"Head job size: {head_job_size['vcpus']} vCPU, {head_job_size['memory']} MiB ({head_job_size['reason']})")
 
         print(f"Submitting job '{job_name}' to queue '{job_queue}' with definition '{job_definition}'")
         response = self.batch_client.submit_job(
@@ -74,40 +298,347 @@ class NextflowLauncher:
                 'workflow': workflow_url,
                 'params': params_s3_path
             },
-            containerOverrides={
-                'vcpus': 1,
-                'memory': 1024, # in MiB
-                'environment': [
-                    {'name': 'NXF_MODE', 'value': 'batch'},
-                    {'name': 'NXF_WORK', 'value': f's3://{bucket_name}/work'}
-                ]
-            }
+            containerOverrides=self.container_overrides(bucket_name, head_job_size)
         )
-        
+
         return response['jobId']
 
+    @tracing.traced('launcher.submit_manifest')
+    def submit_manifest(self, entries, workflow_url, bucket_name, job_queue, job_definition, lambda_function_name=None, default_params_file=None, job_name=None, max_workers=DEFAULT_MANIFEST_WORKERS, submit_rate=DEFAULT_SUBMIT_RATE, array=False, size=None):
+        """
+        Submits many experiments at once.
+
+        Samplesheets and params files are prepared concurrently in memory, so
+        parallel entries never share a local file. Jobs are then submitted
+        either one per entry, concurrently and rate limited to `submit_rate`
+        calls per second, or as a single Batch array job whose children look
+        up their params file by AWS_BATCH_JOB_ARRAY_INDEX.
+
+        Args:
+            entries (list): Manifest entries as returned by `load_manifest`.
+            default_params_file (str): Params file for entries without one.
+            job_name (str): Base name for the batch. Entry jobs are named
+                            `{job_name}-{index}` unless the entry has a name.
+            max_workers (int): Concurrent samplesheet/params preparations.
+            submit_rate (float): Maximum SubmitJob calls per second.
+            array (bool): Submit one array job instead of one job per entry.
+            size (str): Head-job size as accepted by `resolve_size`. Array
+                        jobs use the largest size chosen for any entry.
+
+        Returns:
+            dict: Machine-readable summary with one result per entry.
+        """
+        if not job_name:
+            job_name = f"nextflow-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+        # Entries often share a params file; parse each one only once
+        params_cache = {}
+        params_lock = threading.Lock()
+
+        def load_params(path):
+            with params_lock:
+                if path not in params_cache:
+                    with open(path, 'r') as f:
+                        params_cache[path] = json.load(f)
+                return params_cache[path]
+
+        def prepare(index):
+            entry = entries[index]
+            result = {
+                'index': index,
+                'experiment_id': entry.get('experiment_id'),
+                'job_name': entry.get('name') or f"{job_name}-{index}"
+            }
+            try:
+                params_file = entry.get('params') or default_params_file
+                if not params_file:
+                    raise ValueError("No params file given for entry and no --params default")
+                params_data, sample_count = self.prepare_params(
+                    load_params(params_file),
+                    bucket_name,
+                    entry.get('experiment_id'),
+                    lambda_function_name
+                )
+                # Array children look their params up by index; other jobs use content-addressed keys
+                params_key = f"params/{job_name}/{index}.json" if array else None
+                result['params'] = self.upload_params(params_data, bucket_name, params_key)
+                result['size'] = self.resolve_size(size, bucket_name, sample_count)
+            except Exception as e:
+                result['error'] = str(e)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(prepare, range(len(entries))))
+
+        summary = {'mode': 'array' if array else 'concurrent', 'job_name': job_name, 'jobs': results}
+        failed = [result for result in results if 'error' in result]
+
+        if array:
+            if failed:
+                summary['error'] = f"{len(failed)} entries failed preparation; array job not submitted"
+                return summary
+            # Children resolve their own params file from the array index
+            params_prefix = f's3://{bucket_name}/params/{job_name}'
+            head_job_size = max((result['size'] for result in results), key=lambda r: (r['memory'], r['vcpus']))
+            print(f"Head job size: {head_job_size['vcpus']} vCPU, {head_job_size['memory']} MiB ({head_job_size['reason']})")
+            print(f"Submitting array job '{job_name}' of size {len(entries)} to queue '{job_queue}'")
+            response = self.batch_client.submit_job(
+                jobName=job_name,
+                jobQueue=job_queue,
+                jobDefinition=job_definition,
+                arrayProperties={'size': len(entries)},
+                parameters={
+                    'workflow': workflow_url,
+                    'params': params_prefix
+                },
+                containerOverrides=self.container_overrides(
+                    bucket_name,
+                    head_job_size,
+                    command=['/bin/bash', '-c', 'nextflow run ${WORKFLOW_URL} -params-file ${PARAMS_PREFIX}/${AWS_BATCH_JOB_ARRAY_INDEX}.json -resume'],
+                    environment=[{'name': 'PARAMS_PREFIX', 'value': params_prefix}]
+                )
+            )
+            summary['array_job_id'] = response['jobId']
+            for result in results:
+                result['job_id'] = f"{response['jobId']}:{result['index']}"
+            return summary
+
+        rate_limiter = RateLimiter(submit_rate)
+
+        def submit(result):
+            if 'error' in result:
+                return result
+            rate_limiter.wait()
+            try:
+                response = self.batch_client.submit_job(
+                    jobName=result['job_name'],
+                    jobQueue=job_queue,
+                    jobDefinition=job_definition,
+                    parameters={
+                        'workflow': workflow_url,
+                        'params': result['params']
+                    },
+                    containerOverrides=self.container_overrides(bucket_name, result['size'])
+                )
+                result['job_id'] = response['jobId']
+            except Exception as e:
+                result['error'] = str(e)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            summary['jobs'] = list(executor.map(submit, results))
+        return summary
+
+    @tracing.traced('launcher.describe_jobs')
+    def describe_jobs(self, job_ids):
+        """Describes any number of jobs, DESCRIBE_JOBS_MAX_IDS per call; returns {job_id: job}."""
+        jobs = {}
+        for start in range(0, len(job_ids), DESCRIBE_JOBS_MAX_IDS):
+            response = self.batch_client.describe_jobs(jobs=job_ids[start:start + DESCRIBE_JOBS_MAX_IDS])
+            for job in response.get('jobs', []):
+                jobs[job['jobId']] = job
+        return jobs
+
+    def watch_jobs(self, job_ids, output=None, min_interval=WATCH_MIN_INTERVAL, max_interval=WATCH_MAX_INTERVAL, timeout=None):
+        """
+        Follows jobs until every one has finished, writing a JSON line to
+        `output` for each status change and a final summary line.
+
+        Each poll describes all unfinished jobs in batched DescribeJobs calls.
+        The poll interval resets to `min_interval` whenever a job changes
+        state, stays short while a job is SUBMITTED or STARTING, and otherwise
+        doubles up to `max_interval`. Throttled polls also double it.
+
+        Args:
+            job_ids (list): Batch job IDs, including array job IDs.
+            output: File-like object for the JSON lines. Defaults to stdout.
+            timeout (float): Stop watching after this many seconds.
+
+        Returns:
+            dict: {job_id: final status}. Jobs still running at the timeout keep
+                  their last status; jobs Batch does not know are NOT_FOUND.
+        """
+        if output is None:
+            output = sys.stdout
+        job_ids = list(dict.fromkeys(job_ids))
+        deadline = time.monotonic() + timeout if timeout else None
+        states = {job_id: None for job_id in job_ids}
+        statuses = {job_id: 'UNKNOWN' for job_id in job_ids}
+        missing_rounds = {}
+        pending = list(job_ids)
+        interval = min_interval
+
+        def emit(record):
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+
+        while pending:
+            changed = False
+            try:
+                jobs = self.describe_jobs(pending)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in THROTTLING_ERROR_CODES:
+                    raise
+                jobs = None
+                interval = min(interval * 2, max_interval)
+
+            if jobs is not None:
+                for job_id in pending:
+                    job = jobs.get(job_id)
+                    if job is None:
+                        missing_rounds[job_id] = missing_rounds.get(job_id, 0) + 1
+                        if missing_rounds[job_id] >= WATCH_NOT_FOUND_ROUNDS:
+                            statuses[job_id] = 'NOT_FOUND'
+                            emit({'event': 'status', 'job_id': job_id, 'status': 'NOT_FOUND', 'previous': None,
+                                  'at': datetime.now().isoformat(timespec='seconds')})
+                        continue
+                    summary = job.get('arrayProperties', {}).get('statusSummary')
+                    state = (job['status'], json.dumps(summary, sort_keys=True) if summary else None)
+                    if state == states[job_id]:
+                        continue
+                    record = {
+                        'event': 'status',
+                        'job_id': job_id,
+                        'job_name': job.get('jobName'),
+                        'status': job['status'],
+                        'previous': statuses[job_id] if states[job_id] else None,
+                        'at': datetime.now().isoformat(timespec='seconds')
+                    }
+                    if job.get('statusReason'):
+                        record['reason'] = job['statusReason']
+                    if 'exitCode' in job.get('container', {}):
+                        record['exit_code'] = job['container']['exitCode']
+                    if summary:
+                        record['array'] = summary
+                    emit(record)
+                    states[job_id] = state
+                    statuses[job_id] = job['status']
+                    changed = True
+                pending = [job_id for job_id in pending if statuses[job_id] not in TERMINAL_STATUSES | {'NOT_FOUND'}]
+
+                if changed:
+                    interval = min_interval
+                elif any(statuses[job_id] in WATCH_TRANSITIONAL_STATUSES for job_id in pending):
+                    interval = min(interval * 2, max(min_interval, WATCH_TRANSITIONAL_MAX_INTERVAL))
+                else:
+                    interval = min(interval * 2, max_interval)
+
+            if not pending:
+                break
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                interval = min(interval, remaining)
+            time.sleep(interval)
+
+        counts = {}
+        for status in statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        emit({'event': 'summary', 'jobs': len(job_ids), 'statuses': counts, 'exit_code': watch_exit_code(statuses)})
+        return statuses
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Submit a Nextflow workflow to AWS Batch.')
-    parser.add_argument('--workflow', required=True, help='URL of the Nextflow workflow git repository.')
-    parser.add_argument('--params', required=True, help='Path to the parameters JSON file.')
+    parser.add_argument('--workflow', required=False, help='URL of the Nextflow workflow git repository. Required unless --watch is given.')
+    parser.add_argument('--params', required=False, help='Path to the parameters JSON file. In manifest mode, the default for entries without their own params file.')
     parser.add_argument('--experiment-id', required=False, help='Experiment ID to generate a samplesheet for.')
     parser.add_argument('--lambda-function-name', required=False, help='Name of the Lambda function to generate the samplesheet.')
     parser.add_argument('--name', required=False, help='Name for the job.')
-    parser.add_argument('--bucket', required=True, help='S3 bucket for Nextflow work directory and parameters.')
-    parser.add_argument('--queue', required=True, help='AWS Batch Job Queue name.')
+    parser.add_argument('--bucket', required=False, help='S3 bucket for Nextflow work directory and parameters. Required unless --watch is given.')
+    parser.add_argument('--queue', required=False, help='AWS Batch Job Queue name. Required unless --watch is given.')
     parser.add_argument('--definition', default='nextflow-runner', help='AWS Batch Job Definition name.')
+    parser.add_argument('--manifest', required=False, help='Submit many experiments from a manifest of experiment IDs or params files.')
+    parser.add_argument('--array', action='store_true', help='In manifest mode, submit a single AWS Batch array job.')
+    parser.add_argument('--workers', default=DEFAULT_MANIFEST_WORKERS, type=int, help='In manifest mode, number of concurrent samplesheet/params preparations.')
+    parser.add_argument('--size', required=False, type=parse_size, help="Head-job size: 'auto' to size from the samplesheet and past trace files, or '<vcpus>x<memory MiB>' such as '4x8192'. Defaults to 1 vCPU / 1024 MiB.")
+    parser.add_argument('--submit-rate', default=DEFAULT_SUBMIT_RATE, type=float, help='In manifest mode, maximum SubmitJob calls per second.')
+    parser.add_argument('--wait', action='store_true', help='After submitting, watch the submitted jobs until they finish.')
+    parser.add_argument('--watch', nargs='+', metavar='JOB_ID', help="Watch existing jobs instead of submitting; '-' reads job IDs from stdin.")
+    parser.add_argument('--watch-timeout', type=float, help='Stop watching after this many seconds (exit code 3).')
+    parser.add_argument('--poll-interval', default=WATCH_MIN_INTERVAL, type=float, help='Shortest seconds between watch polls.')
+    parser.add_argument('--max-poll-interval', default=WATCH_MAX_INTERVAL, type=float, help='Longest seconds between watch polls.')
+    parser.add_argument('--timings', action='store_true', help='Print span and AWS API call timings to stderr on exit (also enabled by TRACING_ENABLED).')
 
     args = parser.parse_args()
-    
+
+    if args.timings:
+        tracing.enable()
+    if tracing.enabled():
+        atexit.register(lambda: print(f"Timings: {json.dumps(tracing.snapshot(), indent=4)}", file=sys.stderr))
+
+    def watch(launcher, job_ids):
+        """Streams status changes as JSON lines to stdout and exits with the aggregate status."""
+        statuses = launcher.watch_jobs(
+            job_ids,
+            min_interval=args.poll_interval,
+            max_interval=args.max_poll_interval,
+            timeout=args.watch_timeout
+        )
+        return watch_exit_code(statuses)
+
+    if args.watch:
+        job_ids = []
+        for job_id in args.watch:
+            if job_id == '-':
+                job_ids.extend(line.strip() for line in sys.stdin if line.strip())
+            else:
+                job_ids.append(job_id)
+        sys.exit(watch(NextflowLauncher(), job_ids))
+
+    for required in ('workflow', 'bucket', 'queue'):
+        if not getattr(args, required):
+            parser.error(f'--{required} is required unless --watch is given')
+
+    if args.manifest:
+        launcher = NextflowLauncher(max_pool_connections=max(args.workers, DEFAULT_MAX_POOL_CONNECTIONS))
+        # Progress messages go to stderr so stdout carries only the JSON summary
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = launcher.submit_manifest(
+                load_manifest(args.manifest),
+                args.workflow,
+                args.bucket,
+                args.queue,
+                args.definition,
+                lambda_function_name=args.lambda_function_name,
+                default_params_file=args.params,
+                job_name=args.name,
+                max_workers=args.workers,
+                submit_rate=args.submit_rate,
+                array=args.array,
+                size=args.size
+            )
+        submit_failed = bool(summary.get('error') or any('error' in job for job in summary['jobs']))
+        if not args.wait:
+            json.dump(summary, sys.stdout, indent=4)
+            print()
+            sys.exit(1 if submit_failed else 0)
+        # With --wait, stdout is JSON lines: the submission summary, then status changes
+        print(json.dumps(dict(summary, event='submitted')), flush=True)
+        if 'array_job_id' in summary:
+            job_ids = [summary['array_job_id']]
+        else:
+            job_ids = [job['job_id'] for job in summary['jobs'] if 'job_id' in job]
+        exit_code = watch(launcher, job_ids) if job_ids else EXIT_FAILED
+        sys.exit(EXIT_FAILED if submit_failed and exit_code == EXIT_SUCCEEDED else exit_code)
+
+    if not args.params:
+        parser.error('--params is required unless --manifest is given')
+
     launcher = NextflowLauncher()
-    job_id = launcher.submit_workflow(
-        args.workflow, 
-        args.params, 
-        args.bucket,
-        args.queue,
-        args.definition,
-        experiment_id=args.experiment_id,
-        lambda_function_name=args.lambda_function_name,
-        job_name=args.name
-    )
-    print(f"Successfully submitted job with ID: {job_id}")
+    # With --wait, progress goes to stderr so stdout carries only JSON lines
+    with contextlib.redirect_stdout(sys.stderr if args.wait else sys.stdout):
+        job_id = launcher.submit_workflow(
+            args.workflow,
+            args.params,
+            args.bucket,
+            args.queue,
+            args.definition,
+            experiment_id=args.experiment_id,
+            lambda_function_name=args.lambda_function_name,
+            job_name=args.name,
+            size=args.size
+        )
+        print(f"Successfully submitted job with ID: {job_id}")
+    if args.wait:
+        sys.exit(watch(launcher, [job_id]))
@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+# metadata_catalog.py
+"""
+Local, indexed mirror of the experiment-contexts table and the S3 tags of
+each sample, for metadata queries that span experiments.
+
+The catalog is a SQLite file. Every sample is one row holding its DynamoDB
+item and tag set as JSON; every scalar attribute of either is also written to
+an (attribute, value) index, so a query such as "tissue=liver and
+treatment=X in any experiment" is a few index lookups with no AWS calls.
+
+CatalogSync keeps the file current. The first sync is a parallel scan of the
+table; later syncs read only the table's DynamoDB stream from the shard
+positions stored in the catalog, so a sync costs work proportional to what
+changed. Tags are only fetched for items whose version token (`updated_at`,
+see upload_with_metadata.py) differs from the one already catalogued, or
+whose last fetch failed (`tags_pending`). When
+the stream is disabled, or the stored positions have aged out of its 24-hour
+retention, the sync falls back to a full scan.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from decimal import Decimal
+
+DEFAULT_CATALOG_PATH = os.environ.get('METADATA_CATALOG_PATH', 'metadata-catalog.db')
+DEFAULT_SCAN_SEGMENTS = 4
+# Stream records this much older than the start of a full scan are already
+# reflected in it and are not replayed
+STREAM_REPLAY_SLACK_SECONDS = 60
+# Errors meaning stored stream positions can no longer be read
+EXPIRED_CURSOR_ERROR_CODES = {'TrimmedDataAccessException', 'ExpiredIteratorException', 'ResourceNotFoundException'}
+QUERY_PAGE_SIZE = 500
+# An open shard can return empty GetRecords pages before later records; stop
+# reading it after this many empty pages in a row
+STREAM_MAX_EMPTY_POLLS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    experiment_id TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    s3_object_key TEXT,
+    version TEXT,
+    item TEXT NOT NULL,
+    tags TEXT NOT NULL DEFAULT '{}',
+    tags_pending INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (experiment_id, sample_id)
+);
+CREATE TABLE IF NOT EXISTS attributes (
+    experiment_id TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (experiment_id, sample_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attributes_by_value ON attributes (name, value);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class ExpiredCursor(Exception):
+    """The stored stream positions can no longer be read; a full sync is needed."""
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def _index_value(value):
+    """Returns the text stored in the attribute index for a scalar, or None for other values."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, Decimal):
+        return str(_json_default(value))
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    return None
+
+
+class MetadataCatalog:
+    def __init__(self, path=DEFAULT_CATALOG_PATH, readonly=False):
+        """
+        Args:
+            path (str): SQLite file, created if missing (':memory:' for a
+                        throwaway catalog).
+            readonly (bool): Open an existing file without write access, as
+                             the samplesheet Lambda does.
+        """
+        self.path = path
+        if readonly:
+            self._conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            if path != ':memory:':
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+        self._lock = threading.Lock()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(samples)')}
+        if 'tags_pending' not in columns:
+            # Catalogs from before tags_pending marked failed tag fetches with a NULL version
+            with self._conn:
+                self._conn.execute('ALTER TABLE samples ADD COLUMN tags_pending INTEGER NOT NULL DEFAULT 0')
+                self._conn.execute('UPDATE samples SET tags_pending = 1 WHERE version IS NULL AND s3_object_key IS NOT NULL')
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+
+    def get_state(self, name, default=None):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM sync_state WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, name, value):
+        with self._lock, self._conn:
+            self._set_state(name, value)
+
+    def _set_state(self, name, value):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)',
+            (name, json.dumps(value, default=_json_default))
+        )
+
+    def versions(self, keys):
+        """Returns {(experiment_id, sample_id): (version, tags, tags_pending)} for the keys already catalogued."""
+        found = {}
+        with self._lock:
+            for experiment_id, sample_id in keys:
+                row = self._conn.execute(
+                    'SELECT version, tags, tags_pending FROM samples WHERE experiment_id = ? AND sample_id = ?',
+                    (experiment_id, sample_id)
+                ).fetchone()
+                if row:
+                    found[(experiment_id, sample_id)] = (row[0], json.loads(row[1]), bool(row[2]))
+        return found
+
+    def keys(self):
+        with self._lock:
+            return set(self._conn.execute('SELECT experiment_id, sample_id FROM samples'))
+
+    def apply(self, upserts=(), removals=(), state=None):
+        """
+        Writes a batch of changes in one transaction.
+
+        Args:
+            upserts (list): (item, tags, version, tags_pending) per sample,
+                            where tags_pending marks tags that could not be
+                            fetched and are retried on the next sync.
+            removals (list): (experiment_id, sample_id) of deleted samples.
+            state (dict): Sync state entries committed with the changes, so a
+                          crash never records a cursor past unapplied changes.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            for item, tags, version, tags_pending in upserts:
+                key = (item['experiment_id'], item['sample_id'])
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO samples (experiment_id, sample_id, s3_object_key, version, item, tags, tags_pending, synced_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    key + (item.get('s3_object_key'), version, json.dumps(item, default=_json_default),
+                           json.dumps(tags or {}, default=_json_default), int(tags_pending), now)
+                )
+                self._conn.execute('DELETE FROM attributes WHERE experiment_id = ? AND sample_id = ?', key)
+                # Item attributes take precedence over tags of the same name
+                attributes = dict(tags or {}, **item)
+                self._conn.executemany(
+                    'INSERT INTO attributes (experiment_id, sample_id, name, value) VALUES (?, ?, ?, ?)',
+                    [key + (name, text) for name, text in
+                     ((name, _index_value(value)) for name, value in attributes.items()) if text is not None]
+                )
+            for key in removals:
+                self._conn.execute('DELETE FROM samples WHERE experiment_id = ? AND sample_id = ?', key)
+                self._conn.execute('DELETE FROM attributes WHERE experiment_id = ? AND sample_id = ?', key)
+            for name, value in (state or {}).items():
+                self._set_state(name, value)
+
+    def pending_tags(self):
+        """Returns the items whose tags could not be fetched on an earlier sync."""
+        with self._lock:
+            rows = self._conn.execute('SELECT item FROM samples WHERE tags_pending AND s3_object_key IS NOT NULL')
+            return [json.loads(row[0]) for row in rows]
+
+    def query_pages(self, filters=None, experiment_id=None, page_size=QUERY_PAGE_SIZE):
+        """
+        Yields pages of (item, tags) for the samples matching every filter,
+        ordered by experiment and sample. Each page is a separate keyset
+        query after the last key of the previous one, so only one page is
+        held in memory and the lock is not held between pages.
+
+        Args:
+            filters (dict): Attribute name to a value or list of accepted
+                            values. Names match item attributes and tags.
+            experiment_id (str): Optionally restrict to one experiment.
+        """
+        joins = []
+        conditions = []
+        params = []
+        for n, (name, accepted) in enumerate((filters or {}).items()):
+            if not isinstance(accepted, (list, tuple, set)):
+                accepted = [accepted]
+            values = [_index_value(value) for value in accepted]
+            joins.append(
+                f'JOIN attributes a{n} ON a{n}.experiment_id = s.experiment_id AND a{n}.sample_id = s.sample_id '
+                f"AND a{n}.name = ? AND a{n}.value IN ({', '.join('?' * len(values))})"
+            )
+            params.extend([name] + values)
+        if experiment_id is not None:
+            conditions.append('s.experiment_id = ?')
+            params.append(experiment_id)
+        sql = f"SELECT s.experiment_id, s.sample_id, s.item, s.tags FROM samples s {' '.join(joins)}"
+        conditions.append('(s.experiment_id, s.sample_id) > (?, ?)')
+        sql += f" WHERE {' AND '.join(conditions)} ORDER BY s.experiment_id, s.sample_id LIMIT ?"
+
+        last_key = ('', '')
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, params + list(last_key) + [page_size]).fetchall()
+            if not rows:
+                return
+            yield [(json.loads(item), json.loads(tags)) for _, _, item, tags in rows]
+            if len(rows) < page_size:
+                return
+            last_key = rows[-1][:2]
+
+    def query(self, filters=None, experiment_id=None):
+        return [row for page in self.query_pages(filters, experiment_id) for row in page]
+
+    def snapshot(self, path):
+        """Writes a consistent copy of the catalog to `path`, e.g. for publishing."""
+        if os.path.exists(path):
+            os.remove(path)
+        with self._lock:
+            self._conn.execute('VACUUM INTO ?', (path,))
+
+
+class CatalogSync:
+    def __init__(self, catalog, table, bucket_name, s3_client, streams_client=None,
+                 scan_segments=DEFAULT_SCAN_SEGMENTS, tag_workers=None):
+        """
+        Args:
+            catalog (MetadataCatalog): The catalog to keep current.
+            table: A boto3 DynamoDB Table resource for the experiment contexts.
+            bucket_name (str): Bucket holding the tagged sample objects.
+            s3_client: A boto3 S3 client object.
+            streams_client: A boto3 DynamoDB Streams client object. Required
+                            for incremental syncs.
+        """
+        self.catalog = catalog
+        self.table = table
+        self.bucket_name = bucket_name
+        self.s3_client = s3_client
+        self.streams_client = streams_client
+        self.scan_segments = scan_segments
+        self.tag_workers = tag_workers
+        self.stats = {}
+
+    def _stream_arn(self):
+        self.table.reload()
+        return self.table.latest_stream_arn if self.table.stream_specification else None
+
+    def sync(self, full=False):
+        """
+        Brings the catalog up to date and returns counts of what changed:
+        {'mode', 'upserted', 'removed', 'tags_fetched', 'tag_errors', 'seconds'}.
+        """
+        start = time.perf_counter()
+        self.stats = {'upserted': 0, 'removed': 0, 'tags_fetched': 0, 'tag_errors': 0}
+        stream_arn = self._stream_arn() if self.streams_client is not None else None
+        cursor = self.catalog.get_state('cursor')
+
+        mode = 'full'
+        if not full and stream_arn and cursor and cursor.get('stream_arn') == stream_arn:
+            try:
+                self._sync_stream(cursor)
+                mode = 'stream'
+            except ExpiredCursor as e:
+                print(f'Stream cursor expired ({e}); running a full sync.')
+        if mode == 'full':
+            if not stream_arn:
+                print('Table has no stream enabled; every sync will be a full scan.')
+            self._sync_full(stream_arn)
+
+        self._retry_pending_tags()
+        self.catalog.set_state('bucket', self.bucket_name)
+        return dict(self.stats, mode=mode, seconds=round(time.perf_counter() - start, 3))
+
+    def _upserts(self, items):
+        """
+        Pairs items with their tags, fetching tags only for new items, items
+        whose version changed and items whose last fetch failed. Items without
+        a version token keep the tags fetched when they were first catalogued.
+        """
+        from lambda_function.handler import _item_version, fetch_tags_concurrently
+
+        known = self.catalog.versions([(item['experiment_id'], item['sample_id']) for item in items])
+        upserts = []
+        to_fetch = []
+        for item in items:
+            version = _item_version(item)
+            previous = known.get((item['experiment_id'], item['sample_id']))
+            if not item.get('s3_object_key'):
+                upserts.append((item, {}, version, False))
+            elif previous and not previous[2] and previous[0] == version:
+                upserts.append((item, previous[1], version, False))
+            else:
+                to_fetch.append((item, previous[1] if previous else {}))
+        if to_fetch:
+            results = fetch_tags_concurrently(
+                self.s3_client, self.bucket_name, [item['s3_object_key'] for item, _ in to_fetch], max_workers=self.tag_workers
+            )
+            self.stats['tags_fetched'] += len(to_fetch)
+            for (item, previous_tags), tags in zip(to_fetch, results):
+                if isinstance(tags, Exception):
+                    # Kept with its old tags and retried on the next sync
+                    print(f"Could not fetch tags for {item['s3_object_key']}: {tags}")
+                    self.stats['tag_errors'] += 1
+                    upserts.append((item, previous_tags, _item_version(item), True))
+                else:
+                    upserts.append((item, tags, _item_version(item), False))
+        return upserts
+
+    def _sync_full(self, stream_arn):
+        """Scans the whole table in parallel segments and removes samples that no longer exist."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        started_at = time.time()
+        seen = set()
+        seen_lock = threading.Lock()
+
+        def scan_segment(segment):
+            scan_kwargs = {'Segment': segment, 'TotalSegments': self.scan_segments}
+            while True:
+                response = self.table.scan(**scan_kwargs)
+                items = response.get('Items', [])
+                if items:
+                    upserts = self._upserts(items)
+                    self.catalog.apply(upserts)
+                    with seen_lock:
+                        seen.update((item['experiment_id'], item['sample_id']) for item in items)
+                        self.stats['upserted'] += len(upserts)
+                if not response.get('LastEvaluatedKey'):
+                    return
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        with ThreadPoolExecutor(max_workers=self.scan_segments) as executor:
+            list(executor.map(scan_segment, range(self.scan_segments)))
+
+        removed = self.catalog.keys() - seen
+        # Stream records from before the scan are already reflected in it
+        cursor = {'stream_arn': stream_arn, 'shards': {}, 'replay_from': started_at - STREAM_REPLAY_SLACK_SECONDS}
+        self.catalog.apply(removals=removed, state={'cursor': cursor, 'last_full_sync': started_at})
+        self.stats['removed'] += len(removed)
+
+    def _list_shards(self, stream_arn):
+        shards = []
+        describe_kwargs = {'StreamArn': stream_arn}
+        while True:
+            description = self.streams_client.describe_stream(**describe_kwargs)['StreamDescription']
+            shards.extend(description.get('Shards', []))
+            if not description.get('LastEvaluatedShardId'):
+                return shards
+            describe_kwargs['ExclusiveStartShardId'] = description['LastEvaluatedShardId']
+
+    def _sync_stream(self, cursor):
+        """Applies the stream records after the stored position of every shard, parents first."""
+        from botocore.exceptions import ClientError
+
+        stream_arn = cursor['stream_arn']
+        positions = dict(cursor['shards'])
+        try:
+            shards = self._list_shards(stream_arn)
+        except ClientError as e:
+            raise ExpiredCursor(e.response.get('Error', {}).get('Code')) from e
+        shard_ids = {shard['ShardId'] for shard in shards}
+        lost = [shard_id for shard_id, position in positions.items() if position != 'closed' and shard_id not in shard_ids]
+        if lost:
+            raise ExpiredCursor(f'{len(lost)} partially read shards have been trimmed')
+        # Closed shards that have aged out of the stream no longer need tracking
+        positions = {shard_id: position for shard_id, position in positions.items() if shard_id in shard_ids}
+
+        done = {shard_id for shard_id, position in positions.items() if position == 'closed'}
+        pending = [shard for shard in shards if shard['ShardId'] not in done]
+        while pending:
+            # A child shard only holds changes made after its parent closed
+            ready = [
+                shard for shard in pending
+                if shard.get('ParentShardId') not in shard_ids or shard['ParentShardId'] in done
+            ] or pending
+            for shard in ready:
+                if self._read_shard(stream_arn, shard['ShardId'], positions, cursor):
+                    done.add(shard['ShardId'])
+            pending = [shard for shard in pending if shard not in ready]
+
+    def _read_shard(self, stream_arn, shard_id, positions, cursor):
+        """
+        Reads one shard up to its end; returns whether the shard is closed.
+
+        An open shard is read until it reports being caught up
+        (MillisBehindLatest of 0, when given) or returns
+        STREAM_MAX_EMPTY_POLLS empty pages in a row.
+        """
+        from botocore.exceptions import ClientError
+
+        position = positions.get(shard_id)
+        try:
+            if position:
+                iterator = self.streams_client.get_shard_iterator(
+                    StreamArn=stream_arn, ShardId=shard_id, ShardIteratorType='AFTER_SEQUENCE_NUMBER', SequenceNumber=position
+                )['ShardIterator']
+            else:
+                iterator = self.streams_client.get_shard_iterator(
+                    StreamArn=stream_arn, ShardId=shard_id, ShardIteratorType='TRIM_HORIZON'
+                )['ShardIterator']
+            empty_polls = 0
+            while iterator:
+                response = self.streams_client.get_records(ShardIterator=iterator)
+                records = response.get('Records', [])
+                iterator = response.get('NextShardIterator')
+                if records:
+                    positions[shard_id] = records[-1]['dynamodb']['SequenceNumber']
+                if not iterator:
+                    positions[shard_id] = 'closed'
+                if records or not iterator:
+                    self._apply_records(records, dict(cursor, shards=dict(positions)))
+                if records:
+                    empty_polls = 0
+                    continue
+                empty_polls += 1
+                if response.get('MillisBehindLatest', 1) <= 0 or empty_polls >= STREAM_MAX_EMPTY_POLLS:
+                    break
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in EXPIRED_CURSOR_ERROR_CODES:
+                raise ExpiredCursor(code) from e
+            raise
+        return positions.get(shard_id) == 'closed'
+
+    def _apply_records(self, records, cursor):
+        from boto3.dynamodb.types import TypeDeserializer
+
+        deserializer = TypeDeserializer()
+        replay_from = cursor.get('replay_from')
+        # Only the last record per sample matters
+        latest = {}
+        for record in records:
+            change = record['dynamodb']
+            created = change.get('ApproximateCreationDateTime')
+            if replay_from and created is not None:
+                created = created.timestamp() if hasattr(created, 'timestamp') else float(created)
+                if created < replay_from:
+                    continue
+            keys = {name: deserializer.deserialize(value) for name, value in change['Keys'].items()}
+            key = (keys['experiment_id'], keys['sample_id'])
+            if record['eventName'] == 'REMOVE':
+                latest[key] = None
+            elif 'NewImage' in change:
+                latest[key] = {name: deserializer.deserialize(value) for name, value in change['NewImage'].items()}
+            else:
+                # KEYS_ONLY streams carry no item image
+                latest[key] = self.table.get_item(Key=keys, ConsistentRead=True).get('Item')
+
+        items = [item for item in latest.values() if item is not None]
+        removals = [key for key, item in latest.items() if item is None]
+        upserts = self._upserts(items) if items else []
+        self.catalog.apply(upserts, removals, state={'cursor': cursor})
+        self.stats['upserted'] += len(upserts)
+        self.stats['removed'] += len(removals)
+
+    def _retry_pending_tags(self):
+        items = self.catalog.pending_tags()
+        if items:
+            self.catalog.apply(self._upserts(items))
+
+
+def publish(catalog, s3_client, uri):
+    """Uploads a snapshot of the catalog to an s3:// URI for the samplesheet Lambda."""
+    import tempfile
+
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'catalog.db')
+        catalog.snapshot(path)
+        s3_client.upload_file(path, bucket, key)
+    return uri
+
+
+def parse_filters(pairs):
+    """Parses NAME=VALUE strings into {name: [values]}."""
+    filters = {}
+    for pair in pairs or []:
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError(f"Filter '{pair}' is not in name=value form")
+        filters.setdefault(name, []).append(value)
+    return filters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mirror experiment metadata into a local catalog and query it.')
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG_PATH, help='SQLite catalog file.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser('sync', help='Bring the catalog up to date.')
+    sync_parser.add_argument('--table', required=True, help='Experiment contexts DynamoDB table.')
+    sync_parser.add_argument('--bucket', required=True, help='Bucket holding the tagged sample objects.')
+    sync_parser.add_argument('--full', action='store_true', help='Rescan the whole table instead of reading the stream.')
+    sync_parser.add_argument('--segments', type=int, default=DEFAULT_SCAN_SEGMENTS, help='Parallel scan segments for full syncs.')
+    sync_parser.add_argument('--publish', help='s3:// URI to upload a snapshot of the catalog to after syncing.')
+
+    query_parser = subparsers.add_parser('query', help='List samples matching filters.')
+    query_parser.add_argument('--filter', action='append', metavar='NAME=VALUE',
+                              help='Attribute filter; repeat a name to accept several values.')
+    query_parser.add_argument('--experiment-id', help='Restrict to one experiment.')
+    query_parser.add_argument('--format', choices=['samplesheet', 'jsonl'], default='samplesheet')
+    args = parser.parse_args(argv)
+
+    if args.command == 'sync':
+        import boto3
+
+        catalog = MetadataCatalog(args.catalog)
+        syncer = CatalogSync(
+            catalog,
+            boto3.resource('dynamodb').Table(args.table),
+            args.bucket,
+            boto3.client('s3'),
+            boto3.client('dynamodbstreams'),
+            scan_segments=args.segments
+        )
+        stats = syncer.sync(full=args.full)
+        print(json.dumps(stats))
+        if args.publish:
+            print(f'Published catalog to {publish(catalog, syncer.s3_client, args.publish)}')
+        return 0
+
+    try:
+        filters = parse_filters(args.filter)
+    except ValueError as e:
+        parser.error(str(e))
+    catalog = MetadataCatalog(args.catalog, readonly=True)
+    rows = catalog.query(filters, args.experiment_id)
+    if args.format == 'jsonl':
+        for item, tags in rows:
+            print(json.dumps({'item': item, 'tags': tags}))
+        return 0
+    from lambda_function.handler import SAMPLESHEET_COLUMNS, samplesheet_row
+
+    writer = csv.DictWriter(sys.stdout, fieldnames=SAMPLESHEET_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    bucket_name = catalog.get_state('bucket')
+    for item, tags in rows:
+        if item.get('s3_object_key'):
+            writer.writerow(samplesheet_row(item, tags, bucket_name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
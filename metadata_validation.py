@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# metadata_validation.py
+"""
+Validates metadata records against the documents in metadata/schemas.
+
+Each schema file holds an example record (or a list of them) under its record
+type, e.g. {"sample": {...}}. A validator is derived from the examples: a
+field present in every example is required, its type comes from the example
+values, and string fields whose examples are all dates, timestamps or UUIDs
+must match that format. Fields not in the examples are allowed. Validators
+are compiled once per schema into flat lists of checks and cached, so
+validating a record is a handful of dict lookups and isinstance calls.
+
+Records can be validated in bulk from JSON lines or a DynamoDB export
+(streamed, never fully loaded); errors are aggregated per field with a few
+sampled example records.
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import random
+import re
+import sys
+from decimal import Decimal
+
+SCHEMA_DIR = os.environ.get(
+    'METADATA_SCHEMA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metadata', 'schemas')
+)
+SCHEMA_SUFFIX = '_schema.json'
+# Example records kept per failing field
+DEFAULT_EXAMPLES_PER_FIELD = 5
+
+# Inferred string formats, checked in this order
+FORMATS = [
+    ('date', re.compile(r'^\d{4}-\d{2}-\d{2}$')),
+    ('date-time', re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?$')),
+    ('uuid', re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')),
+]
+FORMAT_PATTERNS = dict(FORMATS)
+
+_MISSING = object()
+
+
+def _type_name(value):
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, (float, Decimal)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, list):
+        return 'array'
+    if isinstance(value, dict):
+        return 'object'
+    return 'null'
+
+
+def infer_spec(examples):
+    """
+    Derives a field spec from example values of one field:
+    {'type', 'format'?, 'fields'? (objects), 'items'? (arrays)}.
+    """
+    types = {_type_name(value) for value in examples}
+    if types == {'integer', 'number'}:
+        types = {'number'}
+    if len(types) != 1:
+        return {'type': None}  # Mixed examples; accept anything
+    spec = {'type': types.pop()}
+    if spec['type'] == 'string':
+        for name, pattern in FORMATS:
+            if all(pattern.match(value) for value in examples):
+                spec['format'] = name
+                break
+    elif spec['type'] == 'object':
+        spec['fields'] = infer_fields(examples)
+    elif spec['type'] == 'array':
+        items = [item for value in examples for item in value]
+        if items:
+            spec['items'] = infer_spec(items)
+    return spec
+
+
+def infer_fields(records):
+    """Returns {field: spec} for example records; 'required' marks fields present in all of them."""
+    names = []
+    for record in records:
+        names.extend(name for name in record if name not in names)
+    fields = {}
+    for name in names:
+        values = [record[name] for record in records if name in record]
+        spec = infer_spec(values)
+        spec['required'] = len(values) == len(records)
+        fields[name] = spec
+    return fields
+
+
+def load_schemas(schema_dir=SCHEMA_DIR):
+    """Returns {record type: field specs} for every *_schema.json in `schema_dir`."""
+    schemas = {}
+    for path in sorted(glob.glob(os.path.join(schema_dir, f'*{SCHEMA_SUFFIX}'))):
+        with open(path) as f:
+            document = json.load(f)
+        for record_type, examples in document.items():
+            if isinstance(examples, dict):
+                examples = [examples]
+            schemas[record_type] = infer_fields(examples)
+    return schemas
+
+
+# Python types accepted for each spec type. DynamoDB returns every number as
+# Decimal, so Decimal counts as a number and, when integral, as an integer.
+_TYPE_CHECKS = {
+    'string': (str,),
+    'integer': (int, Decimal),
+    'number': (int, float, Decimal),
+    'boolean': (bool,),
+    'array': (list,),
+    'object': (dict,),
+}
+
+# Strings accepted as integer and number values by Validator.coerce
+_NUMERIC_STRINGS = {
+    'integer': re.compile(r'^[+-]?\d+$'),
+    'number': re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'),
+}
+
+
+def _compile(fields, prefix=''):
+    """Flattens field specs into (path, name, required, types, pattern, nested checks, item check) tuples."""
+    checks = []
+    for name, spec in fields.items():
+        path = f'{prefix}{name}'
+        checks.append((
+            path,
+            name,
+            spec.get('required', False),
+            _TYPE_CHECKS.get(spec['type']),
+            spec['type'],
+            FORMAT_PATTERNS.get(spec.get('format')),
+            spec.get('format'),
+            _compile(spec['fields'], f'{path}.') if spec['type'] == 'object' else None,
+            _compile_item(spec['items'], f'{path}[]') if spec.get('items') else None
+        ))
+    return checks
+
+
+def _compile_item(spec, path):
+    return (path, spec['type'], _TYPE_CHECKS.get(spec['type']), FORMAT_PATTERNS.get(spec.get('format')), spec.get('format'),
+            _compile(spec['fields'], f'{path}.') if spec['type'] == 'object' else None)
+
+
+def _check_value(value, path, type_name, types, pattern, format_name, errors):
+    """Appends a type or format error for one value; returns whether it passed."""
+    if types is None:
+        return True
+    if not isinstance(value, types) or (type_name != 'boolean' and isinstance(value, bool)):
+        errors.append((path, f'expected {type_name}'))
+        return False
+    if type_name == 'integer' and isinstance(value, Decimal) and value != value.to_integral_value():
+        errors.append((path, 'expected integer'))
+        return False
+    if pattern is not None and not pattern.match(value):
+        errors.append((path, f'expected {format_name} format'))
+        return False
+    return True
+
+
+def _run_checks(checks, record, errors):
+    for path, name, required, types, type_name, pattern, format_name, nested, item in checks:
+        value = record.get(name, _MISSING)
+        if value is _MISSING or value is None:
+            if required:
+                errors.append((path, 'missing required field'))
+            continue
+        if not _check_value(value, path, type_name, types, pattern, format_name, errors):
+            continue
+        if nested is not None:
+            _run_checks(nested, value, errors)
+        elif item is not None:
+            item_path, item_type, item_types, item_pattern, item_format, item_nested = item
+            for element in value:
+                if _check_value(element, item_path, item_type, item_types, item_pattern, item_format, errors) and item_nested:
+                    _run_checks(item_nested, element, errors)
+
+
+class Validator:
+    def __init__(self, record_type, fields):
+        self.record_type = record_type
+        self.fields = fields
+        self._checks = _compile(fields)
+
+    def errors(self, record):
+        """Returns a list of (field path, message) for one record; empty when it is valid."""
+        if not isinstance(record, dict):
+            return [('', 'expected object')]
+        errors = []
+        _run_checks(self._checks, record, errors)
+        return errors
+
+    def is_valid(self, record):
+        return not self.errors(record)
+
+    def coerce(self, record):
+        """
+        Returns a copy of a flat record whose values may all be strings (e.g. a
+        CSV row) with numeric strings in integer and number fields converted to
+        int and Decimal, so they validate and store as they would from JSON.
+        Other values, including non-numeric strings, are left for `errors` to report.
+        """
+        coerced = dict(record)
+        for name, value in record.items():
+            type_name = self.fields.get(name, {}).get('type')
+            if isinstance(value, str) and type_name in _NUMERIC_STRINGS and _NUMERIC_STRINGS[type_name].match(value.strip()):
+                coerced[name] = int(value) if type_name == 'integer' else Decimal(value.strip())
+        return coerced
+
+    def validate_many(self, records, examples_per_field=DEFAULT_EXAMPLES_PER_FIELD, seed=0):
+        """Validates an iterable of records (consumed lazily) and returns a ValidationReport."""
+        report = ValidationReport(self.record_type, examples_per_field, seed)
+        for record in records:
+            report.add(record, self.errors(record))
+        return report
+
+
+class ValidationReport:
+    """Error counts per field and message, with example records reservoir-sampled per field."""
+
+    def __init__(self, record_type, examples_per_field=DEFAULT_EXAMPLES_PER_FIELD, seed=0):
+        self.record_type = record_type
+        self.examples_per_field = examples_per_field
+        self.total = 0
+        self.invalid = 0
+        self.field_errors = {}
+        self._examples = {}
+        self._seen = {}
+        self._random = random.Random(seed)
+
+    def add(self, record, errors):
+        index = self.total
+        self.total += 1
+        if not errors:
+            return
+        self.invalid += 1
+        for path in dict.fromkeys(path for path, _ in errors):
+            seen = self._seen.get(path, 0) + 1
+            self._seen[path] = seen
+            examples = self._examples.setdefault(path, [])
+            if len(examples) < self.examples_per_field:
+                examples.append({'index': index, 'record': record})
+            else:
+                slot = self._random.randrange(seen)
+                if slot < self.examples_per_field:
+                    examples[slot] = {'index': index, 'record': record}
+        for path, message in errors:
+            messages = self.field_errors.setdefault(path, {})
+            messages[message] = messages.get(message, 0) + 1
+
+    @property
+    def valid(self):
+        return self.invalid == 0
+
+    def to_dict(self):
+        return {
+            'record_type': self.record_type,
+            'total': self.total,
+            'invalid': self.invalid,
+            'fields': {
+                path: {'errors': messages, 'examples': self._examples.get(path, [])}
+                for path, messages in sorted(self.field_errors.items(), key=lambda item: -sum(item[1].values()))
+            }
+        }
+
+
+_validators = {}
+
+
+def get_validator(record_type, schema_dir=SCHEMA_DIR):
+    """Returns the cached validator for a record type, compiling the schemas on first use."""
+    key = (record_type, schema_dir)
+    if key not in _validators:
+        schemas = load_schemas(schema_dir)
+        if record_type not in schemas:
+            raise ValueError(f"Unknown record type '{record_type}'; known types: {', '.join(sorted(schemas))}")
+        _validators[key] = Validator(record_type, schemas[record_type])
+    return _validators[key]
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path)
+
+
+def iter_jsonl(path):
+    """Yields one record per non-empty line of a (optionally gzipped) JSON lines file."""
+    with _open_text(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_dynamodb_export(path):
+    """Yields plain records from a DynamoDB export data file in DYNAMODB_JSON format."""
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    for line in iter_jsonl(path):
+        item = line.get('Item', line)
+        yield {name: deserializer.deserialize(value) for name, value in item.items()}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def print_report(report):
+    print(f"{report.record_type}: {report.total - report.invalid}/{report.total} records valid")
+    for path, details in report.to_dict()['fields'].items():
+        for message, count in details['errors'].items():
+            print(f"  {path}: {message} ({count} records)")
+        print(f"    e.g. records {', '.join(str(example['index']) for example in details['examples'])}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validate metadata records against metadata/schemas.')
+    parser.add_argument('record_type', help='Record type, e.g. sample, library, sequencing, experiment_contexts, audit_log.')
+    parser.add_argument('paths', nargs='+', help='JSON lines files (optionally .gz) of records.')
+    parser.add_argument('--dynamodb-export', action='store_true', help='Inputs are DynamoDB export data files (DYNAMODB_JSON).')
+    parser.add_argument('--schema-dir', default=SCHEMA_DIR, help='Directory of *_schema.json files.')
+    parser.add_argument('--examples', type=int, default=DEFAULT_EXAMPLES_PER_FIELD, help='Example records kept per failing field.')
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    args = parser.parse_args()
+
+    try:
+        validator = get_validator(args.record_type, args.schema_dir)
+    except ValueError as e:
+        parser.error(str(e))
+    reader = iter_dynamodb_export if args.dynamodb_export else iter_jsonl
+    records = (record for path in args.paths for record in reader(path))
+    report = validator.validate_many(records, args.examples)
+
+    if args.format == 'json':
+        print(json.dumps(report.to_dict(), indent=2, default=_json_default))
+    else:
+        print_report(report)
+    sys.exit(0 if report.valid else 1)
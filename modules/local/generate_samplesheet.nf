@@ -1,12 +1,30 @@
-// Nextflow process that reads S3 metadata
+// Nextflow process that builds the samplesheet for an experiment.
+//
+// generate-samplesheet (samplesheet.py, packaged by Dockerfile.samplesheet)
+// queries the experiment-contexts table by experiment_id and fetches the
+// samples' S3 tags concurrently, so its run time depends on the experiment's
+// size rather than the bucket's. The task role needs dynamodb:Query and
+// s3:GetObjectTagging, as the samplesheet Lambda does.
+//
+// params.samplesheet_container: the image built from containers.yaml, e.g.
+//     <account>.dkr.ecr.<region>.amazonaws.com/nextflow-containers:samplesheet-latest
+// params.metadata_table: the ExperimentContexts table from the stack outputs
+// params.bucket: the bucket holding the sample objects
 process generateSamplesheet {
+    container params.samplesheet_container
+
     input:
     val experiment_id
-    
+
+    output:
+    path 'samplesheet.csv', emit: samplesheet
+
     script:
     """
-    aws s3api list-objects-v2 --bucket ${params.bucket} \
-        --query "Contents[?contains(Metadata.experiment_contexts, '${experiment_id}')]" \
-        | orchestra-meta parse-to-samplesheet > samplesheet.csv
+    generate-samplesheet \\
+        --experiment-id '${experiment_id}' \\
+        --table '${params.metadata_table}' \\
+        --bucket '${params.bucket}' \\
+        --output samplesheet.csv
     """
 }
@@ -1,62 +1,513 @@
 # monitor.py
 import boto3
-from flask import Flask, render_template, jsonify
+from botocore.config import Config
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context
 import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from job_index import JobIndex
+from job_metrics import MetricsCollector, TIERS
+import tracing
 
 app = Flask(__name__)
 
+JOB_STATUSES = ['SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING', 'SUCCEEDED', 'FAILED']
+# HTTP connections each shared client keeps open; sized for concurrent request threads
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+# Adaptive retries back off and rate-limit the client itself when Batch throttles
+CLIENT_RETRIES = {'mode': 'adaptive', 'max_attempts': 10}
+# Seconds a status listing is served from memory before Batch is asked again
+DEFAULT_JOB_LIST_TTL = 10
+LIST_JOBS_PAGE_SIZE = 1000
+LOG_GROUP_NAME = '/aws/batch/job'
+# Seconds between incremental log fetches while tailing a job
+DEFAULT_LOG_POLL_INTERVAL = 2.0
+# Upper bound on get_log_events pages drained per fetch
+MAX_LOG_PAGES_PER_FETCH = 50
+TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED'}
+# Statuses in which a job's container has started, so it may have a log stream
+CONTAINER_STATUSES = {'RUNNING', 'SUCCEEDED', 'FAILED'}
+# Seconds a job description is shared by every log viewer of that job
+DEFAULT_JOB_DESCRIBE_TTL = 2.0
+# Descriptions kept before expired ones are dropped
+MAX_CACHED_DESCRIPTIONS = 1000
+# Seconds /jobs waits for the index's first poll before listing directly
+INDEX_READY_TIMEOUT = 30
+# Seconds between keep-alive comments on an idle job stream
+DEFAULT_STREAM_KEEPALIVE = 15.0
+
+
+class TTLCache:
+    """
+    In-process cache whose entries expire after `ttl` seconds. Concurrent
+    misses on the same key are collapsed: one caller runs the loader while
+    the others wait for its result instead of issuing their own API calls.
+    Once more than `max_entries` keys are held, expired entries are dropped.
+    """
+
+    def __init__(self, ttl, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight[key] = threading.Event()
+            if not leader:
+                # Another request is refreshing this key; reuse its result
+                event.wait()
+                continue
+            try:
+                value = loader()
+                with self._lock:
+                    now = time.monotonic()
+                    self._entries[key] = (now + self.ttl, value)
+                    if self.max_entries is not None and len(self._entries) > self.max_entries:
+                        self._entries = {k: e for k, e in self._entries.items() if e[0] > now}
+                return value
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_batch_client = None
+_logs_client = None
+_cloudwatch_client = None
+_metrics_collector = None
+_job_index = None
+_clients_lock = threading.Lock()
+_job_list_cache = TTLCache(DEFAULT_JOB_LIST_TTL)
+_job_description_cache = TTLCache(DEFAULT_JOB_DESCRIBE_TTL, max_entries=MAX_CACHED_DESCRIPTIONS)
+# One worker per status so a full listing pages every status at once
+_status_executor = ThreadPoolExecutor(max_workers=len(JOB_STATUSES))
+
+
+def _create_client(service_name):
+    max_pool_connections = int(os.environ.get('MONITOR_MAX_POOL_CONNECTIONS', DEFAULT_MAX_POOL_CONNECTIONS))
+    config = Config(max_pool_connections=max_pool_connections, retries=CLIENT_RETRIES)
+    return tracing.instrument_client(boto3.client(service_name, config=config))
+
+
+def get_batch_client():
+    """Returns the Batch client shared by all requests (boto3 clients are thread-safe)."""
+    global _batch_client
+    with _clients_lock:
+        if _batch_client is None:
+            _batch_client = _create_client('batch')
+        return _batch_client
+
+
+def get_logs_client():
+    """Returns the CloudWatch Logs client shared by all requests."""
+    global _logs_client
+    with _clients_lock:
+        if _logs_client is None:
+            _logs_client = _create_client('logs')
+        return _logs_client
+
+
+def get_cloudwatch_client():
+    """Returns the CloudWatch client shared by all requests."""
+    global _cloudwatch_client
+    with _clients_lock:
+        if _cloudwatch_client is None:
+            _cloudwatch_client = _create_client('cloudwatch')
+        return _cloudwatch_client
+
+
+def get_metrics_collector():
+    """Returns the process-wide collector that holds downsampled job metrics."""
+    global _metrics_collector
+    with _clients_lock:
+        if _metrics_collector is None:
+            _metrics_collector = MetricsCollector(
+                get_batch_client(),
+                get_cloudwatch_client(),
+                app.config.get('JOB_QUEUE'),
+                cluster_name=app.config.get('ECS_CLUSTER')
+            )
+        return _metrics_collector
+
+
+@tracing.traced('monitor.list_jobs_for_status')
+def list_jobs_for_status(batch, job_queue, status):
+    """Returns every job summary for one status, following nextToken."""
+    jobs = []
+    kwargs = {'jobQueue': job_queue, 'jobStatus': status, 'maxResults': LIST_JOBS_PAGE_SIZE}
+    while True:
+        response = batch.list_jobs(**kwargs)
+        jobs.extend(response['jobSummaryList'])
+        next_token = response.get('nextToken')
+        if not next_token:
+            return jobs
+        kwargs['nextToken'] = next_token
+
+
+def fetch_jobs(job_queue, statuses):
+    """Lists jobs in the given statuses in parallel, each through the TTL cache."""
+    batch = get_batch_client()
+
+    def cached_status(status):
+        return _job_list_cache.get(
+            (job_queue, status),
+            lambda: list_jobs_for_status(batch, job_queue, status)
+        )
+
+    all_jobs = []
+    for jobs in _status_executor.map(cached_status, statuses):
+        all_jobs.extend(jobs)
+    return all_jobs
+
+
+def start_job_index(job_queue, active_interval=None, idle_interval=None):
+    """
+    Starts the background poller that keeps the job index current. Once it
+    is running, /jobs and /jobs/stream are served from memory.
+    """
+    global _job_index
+    batch = get_batch_client()
+
+    @tracing.traced('monitor.index_poll')
+    def list_statuses(statuses):
+        all_jobs = []
+        for jobs in _status_executor.map(lambda status: list_jobs_for_status(batch, job_queue, status), statuses):
+            all_jobs.extend(jobs)
+        return all_jobs
+
+    kwargs = {}
+    if active_interval is not None:
+        kwargs['active_interval'] = active_interval
+    if idle_interval is not None:
+        kwargs['idle_interval'] = idle_interval
+    _job_index = JobIndex(list_statuses, JOB_STATUSES, **kwargs).start()
+    return _job_index
+
+
+def indexed_jobs(statuses):
+    """Returns the index's jobs in `statuses`, or None when the index is not serving."""
+    index = _job_index
+    if index is None or not index.wait_until_ready(INDEX_READY_TIMEOUT):
+        return None
+    _, jobs = index.snapshot()
+    wanted = set(statuses)
+    return [job for job in jobs if job['status'] in wanted]
+
+
+def _parse_since(value):
+    """Accepts epoch milliseconds or an ISO-8601 timestamp; returns epoch milliseconds."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_request_time(response):
+    # Streaming endpoints are timed until their response starts, not until the stream ends
+    start = g.pop('request_start', None)
+    if start is not None:
+        tracing.record(
+            tracing.HTTP_REQUEST_METRIC,
+            time.perf_counter() - start,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=str(response.status_code)
+        )
+    return response
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Exposes request, span and AWS API call timings in the Prometheus text
+    format. Empty unless tracing is enabled (--tracing or TRACING_ENABLED).
+    """
+    return Response(tracing.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 
 @app.route('/jobs')
 def list_jobs():
+    """
+    Lists jobs in the monitored queue, newest first.
+
+    Query parameters:
+        status: Comma-separated statuses to include (default: all).
+        since: Only jobs created at or after this time (epoch ms or ISO-8601).
+        limit, offset: Page through the sorted result. The total number of
+                       matching jobs is returned in the X-Total-Count header.
+    """
     job_queue = app.config.get('JOB_QUEUE')
-    # Fetch jobs from all statuses to get a complete picture
-    all_jobs = []
     try:
-        batch = boto3.client('batch')
-        for status in ['SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING', 'SUCCEEDED', 'FAILED']:
-            response = batch.list_jobs(jobQueue=job_queue, jobStatus=status)
-            all_jobs.extend(response['jobSummaryList'])
+        statuses = JOB_STATUSES
+        if request.args.get('status'):
+            statuses = [status.strip().upper() for status in request.args['status'].split(',')]
+            unknown = [status for status in statuses if status not in JOB_STATUSES]
+            if unknown:
+                return jsonify({'error': f"Unknown status: {', '.join(unknown)}"}), 400
+        since = _parse_since(request.args['since']) if request.args.get('since') else None
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', None, type=int)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    try:
+        all_jobs = indexed_jobs(statuses)
+        if all_jobs is None:
+            all_jobs = fetch_jobs(job_queue, statuses)
+        if since is not None:
+            all_jobs = [job for job in all_jobs if job.get('createdAt', 0) >= since]
         # Sort jobs by creation time
         all_jobs.sort(key=lambda x: x.get('createdAt', 0), reverse=True)
-        return jsonify(all_jobs)
+        page = all_jobs[offset:offset + limit if limit is not None else None]
+        response = jsonify(page)
+        response.headers['X-Total-Count'] = str(len(all_jobs))
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def describe_job(batch, job_id):
+    """Returns the job's status and log stream name (None until the container starts)."""
+    job = batch.describe_jobs(jobs=[job_id])['jobs'][0]
+    return job['status'], job.get('container', {}).get('logStreamName')
+
+
+def job_log_state(batch, job_id, log_stream_name=None):
+    """
+    Returns (status, log stream name) for a job whose logs are being read.
+
+    The status comes from the job index when it holds the job, so log viewers
+    add no Batch calls. The job is described only when the index misses it,
+    or when its container has started and `log_stream_name` is not yet known;
+    descriptions go through a short TTL cache shared by every viewer.
+    """
+    index = _job_index
+    job = index.get(job_id) if index is not None and index.wait_until_ready(0) else None
+    if job is not None and (log_stream_name or job['status'] not in CONTAINER_STATUSES):
+        return job['status'], log_stream_name
+    status, stream = _job_description_cache.get(job_id, lambda: describe_job(batch, job_id))
+    return status, log_stream_name or stream
+
+
+@tracing.traced('monitor.fetch_log_events')
+def fetch_log_events(logs_client, log_stream_name, cursor=None, max_pages=MAX_LOG_PAGES_PER_FETCH):
+    """
+    Reads log events after `cursor`, following nextForwardToken until the
+    stream is drained or `max_pages` pages have been read.
+
+    Returns:
+        tuple: (messages, cursor) where cursor is the token to resume from.
+    """
+    messages = []
+    for _ in range(max_pages):
+        kwargs = {'logGroupName': LOG_GROUP_NAME, 'logStreamName': log_stream_name, 'startFromHead': True}
+        if cursor:
+            kwargs['nextToken'] = cursor
+        response = logs_client.get_log_events(**kwargs)
+        messages.extend(event['message'] for event in response['events'])
+        next_cursor = response.get('nextForwardToken')
+        # CloudWatch returns the same token once the end of the stream is reached
+        if not next_cursor or next_cursor == cursor:
+            break
+        cursor = next_cursor
+    return messages, cursor
+
+
 @app.route('/jobs/<job_id>/logs')
 def get_job_logs(job_id):
+    """
+    Returns the job's log lines. Pass the returned `cursor` back as
+    ?cursor= to fetch only the lines written since the previous call.
+    """
     try:
-        batch = boto3.client('batch')
-        logs_client = boto3.client('logs')
-
-        # Get the job description to find the log stream name
-        job_desc = batch.describe_jobs(jobs=[job_id])
-        log_stream_name = job_desc['jobs'][0]['container']['logStreamName']
+        _, log_stream_name = job_log_state(get_batch_client(), job_id)
 
         if not log_stream_name:
             return jsonify({'logs': 'Log stream not available for this job yet.'})
 
-        log_events = logs_client.get_log_events(
-            logGroupName='/aws/batch/job',
-            logStreamName=log_stream_name,
-            startFromHead=True
-        )
-
-        return jsonify({'logs': [event['message'] for event in log_events['events']]})
+        messages, cursor = fetch_log_events(get_logs_client(), log_stream_name, request.args.get('cursor'))
+        return jsonify({'logs': messages, 'cursor': cursor})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+def _sse(data, event=None, event_id=None):
+    message = ''
+    if event_id:
+        message += f'id: {event_id}\n'
+    if event:
+        message += f'event: {event}\n'
+    return message + f'data: {json.dumps(data)}\n\n'
+
+
+@app.route('/jobs/<job_id>/logs/stream')
+def stream_job_logs(job_id):
+    """
+    Tails the job's log stream as Server-Sent Events.
+
+    Each `message` event carries {"lines": [...], "cursor": token}; the token
+    is also the SSE event id, so a reconnecting EventSource resumes from it via
+    Last-Event-ID. Clients may also start from ?cursor=. An `end` event is sent
+    once the job has finished and its log is drained. The job's status is
+    read from the job index where possible (see job_log_state), so Batch load
+    does not grow with the number of viewers.
+    """
+    cursor = request.args.get('cursor') or request.headers.get('Last-Event-ID')
+    poll_interval = app.config.get('LOG_POLL_INTERVAL', DEFAULT_LOG_POLL_INTERVAL)
+    batch = get_batch_client()
+    logs_client = get_logs_client()
+
+    def generate():
+        nonlocal cursor
+        log_stream_name = None
+        while True:
+            try:
+                status, log_stream_name = job_log_state(batch, job_id, log_stream_name)
+                if log_stream_name:
+                    lines, cursor = fetch_log_events(logs_client, log_stream_name, cursor)
+                    if lines:
+                        yield _sse({'lines': lines, 'cursor': cursor}, event_id=cursor)
+                if status in TERMINAL_STATUSES:
+                    yield _sse({'status': status, 'cursor': cursor}, event='end')
+                    return
+            except Exception as e:
+                yield _sse({'error': str(e)}, event='error')
+                return
+            # Comment line keeps idle connections open through proxies
+            yield ': keep-alive\n\n'
+            time.sleep(poll_interval)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/jobs/stream')
+def stream_jobs():
+    """
+    Pushes changes to the job index as Server-Sent Events.
+
+    The stream opens with a `snapshot` event ({"version", "jobs"}) followed by
+    `delta` events ({"version", "upserted", "removed"}) as the poller finds
+    changes. Event ids are index versions, so a reconnecting EventSource (or
+    ?version=) receives only the deltas it missed, or a fresh snapshot if they
+    are no longer retained.
+    """
+    index = _job_index
+    if index is None:
+        return jsonify({'error': 'Job index is not running.'}), 503
+    try:
+        version = request.args.get('version') or request.headers.get('Last-Event-ID')
+        version = int(version) if version else None
+    except ValueError:
+        return jsonify({'error': 'Invalid version'}), 400
+    keepalive = app.config.get('STREAM_KEEPALIVE', DEFAULT_STREAM_KEEPALIVE)
+
+    def generate():
+        nonlocal version
+        deltas = index.changes_since(version) if version is not None else None
+        while True:
+            if deltas is None:
+                version, jobs = index.snapshot()
+                yield _sse({'version': version, 'jobs': jobs}, event='snapshot', event_id=str(version))
+            else:
+                for delta in deltas:
+                    version = delta['version']
+                    yield _sse(delta, event='delta', event_id=str(version))
+            latest = index.wait_for_change(version, keepalive)
+            if index.stopped:
+                return
+            if latest == version:
+                # Comment line keeps idle connections open through proxies
+                yield ': keep-alive\n\n'
+                deltas = []
+            else:
+                deltas = index.changes_since(version)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _metrics_resolution():
+    resolution = request.args.get('resolution', '1m')
+    if resolution not in [name for name, _, _ in TIERS]:
+        raise ValueError(f'Unknown resolution: {resolution}')
+    return resolution
+
+
 @app.route('/jobs/<job_id>/metrics')
 def get_job_metrics(job_id):
-    # Placeholder for fetching performance metrics from CloudWatch Metrics
-    # This would involve using get_metric_data with the correct dimensions,
-    # which are best determined once the infrastructure is live.
-    return jsonify({
-        'message': 'Metrics feature not fully implemented.',
-        'metrics': {
-            'cpu_utilization': 'N/A',
-            'memory_utilization': 'N/A'
-        }
-    })
+    """
+    Returns CPU and memory utilization series (percent of the job's reserved
+    vCPUs and memory) and the job's duration. ?resolution= selects the 1m
+    (default) or 10m tier.
+    """
+    try:
+        resolution = _metrics_resolution()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        collector = get_metrics_collector()
+        collector.refresh([job_id])
+        metrics = collector.job_metrics(job_id, resolution)
+        if metrics is None:
+            return jsonify({'error': f'Job not found: {job_id}'}), 404
+        return jsonify(metrics)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/jobs/metrics')
+def get_jobs_metrics():
+    """
+    Returns metrics for many jobs at once (?ids=a,b,c). Jobs are described in
+    batches of 100 and measured with one get_metric_data call per group.
+    """
+    job_ids = [job_id for job_id in request.args.get('ids', '').split(',') if job_id]
+    try:
+        resolution = _metrics_resolution()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        collector = get_metrics_collector()
+        collector.refresh(job_ids)
+        return jsonify({job_id: collector.job_metrics(job_id, resolution) for job_id in job_ids})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def configure(job_queue, ecs_cluster=None, cache_ttl=DEFAULT_JOB_LIST_TTL, poll_interval=None, idle_poll_interval=None, index=True):
+    """Points the app at a job queue and, unless `index` is False, starts the job index."""
+    app.config['JOB_QUEUE'] = job_queue
+    app.config['ECS_CLUSTER'] = ecs_cluster
+    _job_list_cache.ttl = cache_ttl
+    if index:
+        start_job_index(job_queue, poll_interval, idle_poll_interval)
+    return app
 
 @app.route('/dashboard')
 def dashboard():
@@ -69,7 +520,17 @@ if __name__ == '__main__':
     parser.add_argument('--queue', required=True, help='AWS Batch Job Queue name to monitor.')
     parser.add_argument('--host', default='127.0.0.1', help='Host to run the Flask app on.')
     parser.add_argument('--port', default=5000, type=int, help='Port to run the Flask app on.')
+    parser.add_argument('--ecs-cluster', required=False, help="ECS cluster behind the queue's compute environment, for job metrics. Looked up from the queue if omitted.")
+    parser.add_argument('--cache-ttl', default=DEFAULT_JOB_LIST_TTL, type=float, help='Seconds to serve job listings from memory before refreshing (only without the job index).')
+    parser.add_argument('--poll-interval', default=None, type=float, help='Seconds between job index polls while jobs are active.')
+    parser.add_argument('--idle-poll-interval', default=None, type=float, help='Longest interval between job index polls while the queue is idle.')
+    parser.add_argument('--no-index', action='store_true', help='List jobs from Batch on each request instead of running the background job index.')
+    parser.add_argument('--tracing', action='store_true', help='Record request, span and AWS API call timings and serve them at /metrics.')
+    parser.add_argument('--debug', action='store_true', help="Run Flask's debugger. For production, serve wsgi:app with gunicorn instead (see wsgi.py).")
     args = parser.parse_args()
 
-    app.config['JOB_QUEUE'] = args.queue
-    app.run(host=args.host, port=args.port, debug=True)
+    if args.tracing:
+        tracing.enable()
+    configure(args.queue, args.ecs_cluster, args.cache_ttl, args.poll_interval, args.idle_poll_interval, index=not args.no_index)
+    # The reloader would start a second poller in its child process
+    app.run(host=args.host, port=args.port, debug=args.debug, use_reloader=False, threaded=True)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# samplesheet.py
+"""
+Generates a samplesheet from the command line, e.g. inside a Nextflow process.
+
+This runs the samplesheet Lambda's code (lambda_function/handler.py) in
+process. The experiment's items are queried from DynamoDB by experiment_id,
+and their S3 tags are fetched concurrently. There is no Lambda round trip and
+no bucket listing, so the run time depends on the size of the experiment,
+not of the bucket. Filters, sample IDs and columns work as in the Lambda
+request body. The Dockerfile.samplesheet image installs this script as
+`generate-samplesheet` for modules/local/generate_samplesheet.nf.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+from lambda_function.handler import generate_samplesheet
+from metadata_catalog import parse_filters
+
+# Exit codes
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_NO_SAMPLES = 2
+
+
+def _split_list(value):
+    """Parses 'a,b,c' or '@file' (one entry per line) into a list."""
+    if value.startswith('@'):
+        with open(value[1:], 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+    return [entry.strip() for entry in value.split(',') if entry.strip()]
+
+
+def build_request(args):
+    """Returns the Lambda request body for the parsed arguments."""
+    body = {}
+    if args.experiment_id:
+        body['experiment_id'] = args.experiment_id
+    if args.filter:
+        body['filters'] = parse_filters(args.filter)
+    if args.sample_ids:
+        body['sample_ids'] = _split_list(args.sample_ids)
+    if args.columns:
+        body['columns'] = _split_list(args.columns)
+    return body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a Nextflow samplesheet from DynamoDB and S3 tags.')
+    parser.add_argument('--experiment-id', help='Experiment to generate the samplesheet for.')
+    parser.add_argument('--table', default=os.environ.get('DYNAMODB_TABLE'), help='Experiment contexts table. Defaults to $DYNAMODB_TABLE.')
+    parser.add_argument('--bucket', default=os.environ.get('S3_BUCKET'), help='Bucket holding the sample objects. Defaults to $S3_BUCKET.')
+    parser.add_argument('--filter', action='append', metavar='NAME=VALUE',
+                        help='Only include samples with this attribute value; repeat a name to accept several values.')
+    parser.add_argument('--sample-ids', help="Comma-separated sample IDs, or '@file' with one per line.")
+    parser.add_argument('--columns', help="Comma-separated samplesheet columns, or '@file' with one per line.")
+    parser.add_argument('--tag-concurrency', type=int, help='Concurrent S3 tag lookups. Defaults to $TAG_FETCH_CONCURRENCY or 32.')
+    parser.add_argument('--output', default='-', help="Where to write the CSV; '-' for stdout.")
+    args = parser.parse_args(argv)
+
+    if not args.table or not args.bucket:
+        parser.error('--table and --bucket (or $DYNAMODB_TABLE and $S3_BUCKET) are required')
+    try:
+        body = build_request(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # The handler reads its settings from the environment, as in Lambda
+    os.environ['DYNAMODB_TABLE'] = args.table
+    os.environ['S3_BUCKET'] = args.bucket
+    if args.tag_concurrency:
+        os.environ['TAG_FETCH_CONCURRENCY'] = str(args.tag_concurrency)
+
+    # Nothing is spilled to S3: the whole samplesheet is written locally. The
+    # handler's log lines go to stderr so that stdout carries only the CSV.
+    with contextlib.redirect_stdout(sys.stderr):
+        response = generate_samplesheet({'body': json.dumps(body)}, None, inline_limit=sys.maxsize)
+    status = response['statusCode']
+    if status != 200:
+        print(f"Samplesheet generation failed ({status}): {response['body']}", file=sys.stderr)
+        return EXIT_NO_SAMPLES if status == 404 else EXIT_ERROR
+
+    headers = response.get('headers', {})
+    if 'X-Metadata-Invalid-Records' in headers:
+        print(f"{headers['X-Metadata-Invalid-Records']} samples failed metadata validation", file=sys.stderr)
+    if args.output == '-':
+        sys.stdout.write(response['body'])
+    else:
+        with open(args.output, 'w', newline='') as f:
+            f.write(response['body'])
+    print(f"Wrote {max(response['body'].count(chr(10)) - 1, 0)} samples to {args.output}", file=sys.stderr)
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,112 +3,418 @@ import boto3
 import docker
 import yaml
 import base64
+import glob
+import hashlib
+import io
+import json
 import os
+import shlex
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-# Set up argument parser
-parser = argparse.ArgumentParser(description="Build and push Docker containers to ECR based on a manifest file.")
-parser.add_argument("--account-id", required=True, help="Your AWS Account ID.")
-parser.add_argument("--region", required=True, help="The AWS region for the ECR repository.")
-parser.add_argument("--manifest", default="containers.yaml", help="Path to the container manifest file.")
-args = parser.parse_args()
-
-# Initialize clients
-# Assumes AWS credentials are configured in the environment (e.g., via aws configure)
-ecr_client = boto3.client("ecr", region_name=args.region)
-try:
-    docker_client = docker.from_env()
-except docker.errors.DockerException:
-    print("Error: Docker is not running or not installed. Please start Docker and try again.")
-    exit(1)
-
-def get_ecr_login():
-    """Gets ECR login credentials."""
-    try:
-        response = ecr_client.get_authorization_token()
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_BUILD_WORKERS = 4
+# ECR tag marking the image built from a given content hash
+CONTENT_TAG_FORMAT = "{name}-src-{digest}"
+CONTENT_TAG_LENGTH = 16
+CONTENT_HASH_LABEL = "build-manager.content-hash"
+# Seconds between push progress lines for a container
+PUSH_PROGRESS_INTERVAL = 5.0
+
+
+def load_manifest(path):
+    """Loads the container manifest and checks that its depends_on entries are valid."""
+    with open(path, "r") as f:
+        manifest = yaml.safe_load(f)
+    build_order(manifest["containers"])
+    return manifest
+
+
+def build_order(containers):
+    """
+    Returns the containers sorted so that every container comes after the
+    ones it depends on. Raises ValueError for unknown dependencies or cycles.
+    """
+    by_name = {container["name"]: container for container in containers}
+    ordered = []
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for dependency in by_name[name].get("depends_on", []):
+            if dependency not in by_name:
+                raise ValueError(f"Container {name} depends on unknown container {dependency}")
+            visit(dependency, path + [name])
+        state[name] = "done"
+        ordered.append(by_name[name])
+
+    for container in containers:
+        visit(container["name"], [])
+    return ordered
+
+
+def build_inputs(dockerfile_path, context_dir):
+    """
+    Returns the context files a Dockerfile reads: the local sources of its
+    COPY and ADD instructions, with globs and directories expanded.
+    """
+    inputs = set()
+    with open(dockerfile_path, "r") as f:
+        # Join continuation lines so each instruction is one line
+        instructions = f.read().replace("\\\n", " ").splitlines()
+    for instruction in instructions:
+        parts = instruction.strip().split(None, 1)
+        if len(parts) < 2 or parts[0].upper() not in ("COPY", "ADD"):
+            continue
+        arguments = parts[1].strip()
+        if arguments.startswith("["):
+            arguments = json.loads(arguments)
+        else:
+            arguments = shlex.split(arguments)
+        options = [argument for argument in arguments if argument.startswith("--")]
+        if any(option.startswith("--from") for option in options):
+            continue  # Copies from another image or stage, not the context
+        sources = [argument for argument in arguments if not argument.startswith("--")][:-1]
+        for source in sources:
+            if "://" in source:
+                continue
+            for match in glob.glob(os.path.join(context_dir, source)):
+                if os.path.isdir(match):
+                    for root, _, files in os.walk(match):
+                        inputs.update(os.path.join(root, name) for name in files)
+                else:
+                    inputs.add(match)
+    return sorted(os.path.relpath(path, context_dir) for path in inputs)
+
+
+def content_hash(dockerfile, inputs, context_dir, dependency_hashes):
+    """Hashes a Dockerfile, the context files it reads and the hashes of the images it builds on."""
+    digest = hashlib.sha256()
+    for path in [dockerfile] + inputs:
+        digest.update(path.encode("utf-8") + b"\0")
+        with open(os.path.join(context_dir, path), "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    for name, dependency_hash in sorted(dependency_hashes.items()):
+        digest.update(f"{name}={dependency_hash}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_context(dockerfile, inputs, context_dir):
+    """Packs only the Dockerfile and its inputs, so the build does not upload the whole project."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path in [dockerfile] + inputs:
+            tar.add(os.path.join(context_dir, path), arcname=path)
+    buffer.seek(0)
+    return buffer
+
+
+def _megabytes(count):
+    return f"{count / 1024 / 1024:.1f} MB"
+
+
+def stream_push(docker_client, repository, tag, label, interval=PUSH_PROGRESS_INTERVAL):
+    """
+    Pushes one tag, reporting per-layer progress from the push stream instead
+    of blocking silently until it ends. Raises docker.errors.APIError if the
+    registry reports an error.
+
+    Returns:
+        dict: layers, pushed (layers uploaded), existing (layers the registry
+              already had) and bytes (bytes uploaded).
+    """
+    layers = {}
+    last_report = time.monotonic()
+    for event in docker_client.images.push(repository, tag=tag, stream=True, decode=True):
+        if "error" in event:
+            raise docker.errors.APIError(f"Push of {repository}:{tag} failed: {event['error']}")
+        layer = event.get("id")
+        status = event.get("status", "")
+        if not layer or layer == tag:
+            continue
+        progress = layers.setdefault(layer, {"current": 0, "total": 0, "state": "waiting"})
+        if status == "Pushing":
+            detail = event.get("progressDetail") or {}
+            progress["current"] = detail.get("current", progress["current"])
+            progress["total"] = detail.get("total", progress["total"])
+            progress["state"] = "pushing"
+        elif status == "Pushed":
+            progress["state"] = "pushed"
+            progress["current"] = max(progress["current"], progress["total"])
+            print(f"{label}: layer {layer} pushed ({_megabytes(progress['current'])})")
+        elif status == "Layer already exists":
+            progress["state"] = "existing"
+        if time.monotonic() - last_report >= interval:
+            last_report = time.monotonic()
+            active = [
+                f"{layer_id} {_megabytes(p['current'])}/{_megabytes(p['total'])}"
+                for layer_id, p in layers.items() if p["state"] == "pushing"
+            ]
+            if active:
+                print(f"{label}: pushing {', '.join(active)}")
+    return {
+        "layers": len(layers),
+        "pushed": sum(1 for p in layers.values() if p["state"] == "pushed"),
+        "existing": sum(1 for p in layers.values() if p["state"] == "existing"),
+        "bytes": sum(p["current"] for p in layers.values() if p["state"] == "pushed")
+    }
+
+
+class BuildManager:
+    def __init__(self, ecr_client, docker_client, registry, repo_name, context_dir=PROJECT_ROOT, max_workers=DEFAULT_BUILD_WORKERS):
+        """
+        Args:
+            ecr_client: boto3 ECR client.
+            docker_client: docker-py client.
+            registry (str): Registry host, e.g. <account>.dkr.ecr.<region>.amazonaws.com.
+            repo_name (str): ECR repository holding every container as <name>-<tag>.
+            context_dir (str): Directory Dockerfiles and their inputs are relative to.
+            max_workers (int): Number of containers built at once.
+        """
+        self.ecr_client = ecr_client
+        self.docker_client = docker_client
+        self.registry = registry
+        self.repo_name = repo_name
+        self.context_dir = context_dir
+        self.max_workers = max_workers
+        self.remote_repository = f"{registry}/{repo_name}"
+        self._local_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def ensure_ecr_repo(self):
+        """Ensures the ECR repository exists."""
+        try:
+            self.ecr_client.create_repository(repositoryName=self.repo_name, imageScanningConfiguration={'scanOnPush': True})
+            print(f"Created ECR repository: {self.repo_name}")
+        except self.ecr_client.exceptions.RepositoryAlreadyExistsException:
+            print(f"ECR repository {self.repo_name} already exists.")
+
+    def login(self):
+        """Logs the Docker client in to ECR."""
+        response = self.ecr_client.get_authorization_token()
         auth_data = response["authorizationData"][0]
-        token = auth_data["authorizationToken"]
-        username, password = base64.b64decode(token).decode("utf-8").split(":")
-        registry = auth_data["proxyEndpoint"]
-        return username, password, registry
-    except Exception as e:
-        print(f"Error getting ECR credentials: {e}")
-        exit(1)
+        username, password = base64.b64decode(auth_data["authorizationToken"]).decode("utf-8").split(":")
+        self.docker_client.login(username=username, password=password, registry=auth_data["proxyEndpoint"])
+
+    def content_tag(self, name, digest):
+        return CONTENT_TAG_FORMAT.format(name=name, digest=digest[:CONTENT_TAG_LENGTH])
+
+    def remote_tags(self, tag):
+        """Returns every tag on the ECR image with this tag, or None if there is no such image."""
+        try:
+            response = self.ecr_client.describe_images(repositoryName=self.repo_name, imageIds=[{"imageTag": tag}])
+        except self.ecr_client.exceptions.ImageNotFoundException:
+            return None
+        return set(response["imageDetails"][0].get("imageTags", []))
 
-def ensure_ecr_repo(repo_name):
-    """Ensures the ECR repository exists."""
+    def add_tags(self, source_tag, tags):
+        """
+        Points extra tags at an image already in ECR by re-putting its
+        manifest, so no layers are uploaded again.
+        """
+        if not tags:
+            return
+        image = self.ecr_client.batch_get_image(
+            repositoryName=self.repo_name,
+            imageIds=[{"imageTag": source_tag}],
+            acceptedMediaTypes=[
+                "application/vnd.docker.distribution.manifest.v2+json",
+                "application/vnd.docker.distribution.manifest.list.v2+json",
+                "application/vnd.oci.image.manifest.v1+json",
+                "application/vnd.oci.image.index.v1+json"
+            ]
+        )["images"][0]
+        for tag in tags:
+            kwargs = {"repositoryName": self.repo_name, "imageManifest": image["imageManifest"], "imageTag": tag}
+            if image.get("imageManifestMediaType"):
+                kwargs["imageManifestMediaType"] = image["imageManifestMediaType"]
+            try:
+                self.ecr_client.put_image(**kwargs)
+            except self.ecr_client.exceptions.ImageAlreadyExistsException:
+                pass  # The tag already points at this manifest
+            print(f"Tagged {self.remote_repository}:{tag}")
+
+    def compute_hashes(self, containers):
+        """Returns {name: content hash}; a container's hash covers those of its dependencies."""
+        hashes = {}
+        for container in build_order(containers):
+            dockerfile = container["dockerfile"]
+            if not os.path.exists(os.path.join(self.context_dir, dockerfile)):
+                raise ValueError(f"Dockerfile not found at {dockerfile} for container {container['name']}")
+            inputs = build_inputs(os.path.join(self.context_dir, dockerfile), self.context_dir)
+            dependency_hashes = {name: hashes[name] for name in container.get("depends_on", [])}
+            hashes[container["name"]] = content_hash(dockerfile, inputs, self.context_dir, dependency_hashes)
+        return hashes
+
+    def ensure_local(self, name, digest):
+        """
+        Makes a dependency available locally under the tag Dockerfiles use in
+        FROM (<repo>:<name>), pulling it from ECR if it was not built in this run.
+        """
+        with self._locks_lock:
+            lock = self._local_locks.setdefault(name, threading.Lock())
+        with lock:
+            try:
+                image = self.docker_client.images.get(f"{self.repo_name}:{name}")
+                if image.labels.get(CONTENT_HASH_LABEL) == digest:
+                    return
+            except docker.errors.ImageNotFound:
+                pass
+            print(f"Pulling {name} for dependent builds...")
+            image = self.docker_client.images.pull(self.remote_repository, tag=self.content_tag(name, digest))
+            image.tag(self.repo_name, name)
+
+    def build_container(self, container, digest, hashes):
+        """Builds and pushes one container unless ECR already has its content hash. Returns 'built' or 'skipped'."""
+        name = container["name"]
+        dockerfile = container["dockerfile"]
+        content_tag = self.content_tag(name, digest)
+        tags = [f"{name}-{tag}" for tag in container["tags"]]
+
+        existing_tags = self.remote_tags(content_tag)
+        if existing_tags is not None:
+            print(f"{name}: unchanged ({content_tag} is in ECR), skipping build and push")
+            # Covers tags added to the manifest since the image was pushed
+            self.add_tags(content_tag, [tag for tag in tags if tag not in existing_tags])
+            return "skipped"
+
+        for dependency in container.get("depends_on", []):
+            self.ensure_local(dependency, hashes[dependency])
+
+        print(f"\n--- Building container: {name} ---")
+        inputs = build_inputs(os.path.join(self.context_dir, dockerfile), self.context_dir)
+        image, _ = self.docker_client.images.build(
+            fileobj=build_context(dockerfile, inputs, self.context_dir),
+            custom_context=True,
+            dockerfile=dockerfile,
+            tag=f"{self.repo_name}:{name}",  # Local tag referenced by dependents' FROM lines
+            labels={CONTENT_HASH_LABEL: digest},
+            rm=True
+        )
+        print(f"Successfully built {name} from {dockerfile}")
+
+        # Push the layers once, under the content tag, then add the manifest's
+        # tags registry-side. If tagging is interrupted the next run finds the
+        # content tag and only adds the missing tags.
+        ecr_tag = f"{self.remote_repository}:{content_tag}"
+        print(f"Pushing {ecr_tag}...")
+        image.tag(self.remote_repository, content_tag)
+        stats = stream_push(self.docker_client, self.remote_repository, content_tag, name)
+        print(
+            f"Successfully pushed {ecr_tag}: {stats['pushed']} of {stats['layers']} layers uploaded "
+            f"({_megabytes(stats['bytes'])}), {stats['existing']} already in ECR"
+        )
+        self.add_tags(content_tag, tags)
+        return "built"
+
+    def run(self, containers):
+        """
+        Builds containers in parallel, each starting once everything it
+        depends on is available. Returns {name: status}; a container whose
+        dependency failed is reported as 'blocked' and not attempted.
+        """
+        hashes = self.compute_hashes(containers)
+        by_name = {container["name"]: container for container in containers}
+        waiting = {name: set(container.get("depends_on", [])) for name, container in by_name.items()}
+        results = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+
+            def submit_ready():
+                for name in list(waiting):
+                    if waiting[name] & {n for n, status in results.items() if status in ("failed", "blocked")}:
+                        results[name] = "blocked"
+                        print(f"{name}: not built because a dependency failed")
+                        del waiting[name]
+                    elif all(results.get(dependency) in ("built", "skipped") for dependency in waiting[name]):
+                        del waiting[name]
+                        running[executor.submit(self.build_container, by_name[name], hashes[name], hashes)] = name
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except docker.errors.BuildError as e:
+                        print(f"\nError building {name}: {e}")
+                        for line in e.build_log:
+                            if 'stream' in line:
+                                print(line['stream'].strip())
+                        results[name] = "failed"
+                    except docker.errors.APIError as e:
+                        print(f"\nDocker API error for {name}: {e}")
+                        results[name] = "failed"
+                    except Exception as e:
+                        print(f"\nAn unexpected error occurred for {name}: {e}")
+                        results[name] = "failed"
+                # Blocked containers can unblock further ones, so repeat until stable
+                while True:
+                    before = len(waiting)
+                    submit_ready()
+                    if len(waiting) == before:
+                        break
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and push Docker containers to ECR based on a manifest file.")
+    parser.add_argument("--account-id", required=True, help="Your AWS Account ID.")
+    parser.add_argument("--region", required=True, help="The AWS region for the ECR repository.")
+    parser.add_argument("--manifest", default="containers.yaml", help="Path to the container manifest file.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BUILD_WORKERS, help="Number of containers built at once.")
+    args = parser.parse_args(argv)
+
+    # Assumes AWS credentials are configured in the environment (e.g., via aws configure)
+    ecr_client = boto3.client("ecr", region_name=args.region)
     try:
-        ecr_client.create_repository(repositoryName=repo_name, imageScanningConfiguration={'scanOnPush': True})
-        print(f"Created ECR repository: {repo_name}")
-    except ecr_client.exceptions.RepositoryAlreadyExistsException:
-        print(f"ECR repository {repo_name} already exists.")
-    except Exception as e:
-        print(f"Error creating ECR repository: {e}")
+        docker_client = docker.from_env()
+    except docker.errors.DockerException:
+        print("Error: Docker is not running or not installed. Please start Docker and try again.")
         exit(1)
 
-def main():
-    # Load the container manifest
-    manifest_path = os.path.join(os.path.dirname(__file__), '..', args.manifest)
+    manifest_path = os.path.join(PROJECT_ROOT, args.manifest)
     try:
-        with open(manifest_path, "r") as f:
-            manifest = yaml.safe_load(f)
+        manifest = load_manifest(manifest_path)
     except FileNotFoundError:
         print(f"Error: Manifest file not found at {manifest_path}")
         exit(1)
+    except ValueError as e:
+        print(f"Error: Invalid manifest: {e}")
+        exit(1)
 
-    repo_name = manifest["repository"]
-    containers = manifest["containers"]
-
-    # 1. Ensure the ECR repository exists
-    ensure_ecr_repo(repo_name)
+    registry = f"{args.account_id}.dkr.ecr.{args.region}.amazonaws.com"
+    manager = BuildManager(ecr_client, docker_client, registry, manifest["repository"], max_workers=args.workers)
 
-    # 2. Log in to ECR
-    print("\nLogging in to ECR...")
-    username, password, registry = get_ecr_login()
-    docker_client.login(username=username, password=password, registry=registry)
-    print("Login successful.")
+    try:
+        manager.ensure_ecr_repo()
+        print("\nLogging in to ECR...")
+        manager.login()
+        print("Login successful.")
+    except Exception as e:
+        print(f"Error preparing ECR: {e}")
+        exit(1)
 
-    # 3. Build and push each container
-    for container in containers:
-        name = container["name"]
-        dockerfile = container["dockerfile"]
-        tags = container["tags"]
-        
-        print(f"\n--- Building container: {name} ---")
-        
-        dockerfile_path = os.path.join(os.path.dirname(__file__), '..', dockerfile)
-        if not os.path.exists(dockerfile_path):
-            print(f"Error: Dockerfile not found at {dockerfile_path} for container {name}")
-            continue
+    try:
+        results = manager.run(manifest["containers"])
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+    print("\nSummary:")
+    for name, status in results.items():
+        print(f"  {name}: {status}")
+    if any(status in ("failed", "blocked") for status in results.values()):
+        sys.exit(1)
 
-        try:
-            # Build the image
-            image, build_logs = docker_client.images.build(
-                path=os.path.dirname(dockerfile_path),
-                dockerfile=dockerfile,
-                tag=f"{repo_name}/{name}:latest" # Initial local tag
-            )
-            print(f"Successfully built {name} from {dockerfile}")
-
-            # Tag and push for each tag in the manifest
-            for tag in tags:
-                ecr_tag = f"{args.account-id}.dkr.ecr.{args.region}.amazonaws.com/{repo_name}:{name}-{tag}"
-                print(f"Tagging image as: {ecr_tag}")
-                image.tag(ecr_tag)
-                
-                print(f"Pushing {ecr_tag}...")
-                # The push logs can be verbose, so we just confirm completion
-                docker_client.images.push(ecr_tag)
-                print(f"Successfully pushed {ecr_tag}")
-
-        except docker.errors.BuildError as e:
-            print(f"\nError building {name}: {e}")
-            for line in e.build_log:
-                if 'stream' in line:
-                    print(line['stream'].strip())
-        except docker.errors.APIError as e:
-            print(f"\nDocker API error for {name}: {e}")
-        except Exception as e:
-            print(f"\nAn unexpected error occurred for {name}: {e}")
 
 if __name__ == "__main__":
     main()
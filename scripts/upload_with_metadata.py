@@ -1,12 +1,246 @@
 import argparse
+import base64
+import csv
+import glob
+import hashlib
 import json
 import boto3
+import math
 import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
-def upload_with_metadata(file_path, bucket, key, table_name, experiment_id, context_json, core_metadata_json):
+# metadata_validation lives at the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from metadata_validation import ValidationReport, get_validator
+
+DEFAULT_BULK_WORKERS = 8
+# Parts uploaded in parallel per file; total connections are workers * this
+DEFAULT_PART_CONCURRENCY = 4
+DEFAULT_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNKSIZE = 64 * 1024 * 1024
+# BatchWriteItem accepts at most 25 items per request
+DYNAMODB_BATCH_SIZE = 25
+PROGRESS_INTERVAL = 5.0
+# Manifest columns that describe the upload itself rather than its metadata
+MANIFEST_FIELDS = ('file_path', 'key', 'experiment_id')
+TAG_COLUMN_PREFIX = 'tag:'
+DEFAULT_JOURNAL_DIR = '.upload-journal'
+# S3 limits a multipart upload to 10,000 parts
+MAX_PARTS = 10000
+
+
+def _context_item(experiment_id, key, core_metadata, context_data):
+    item = {
+        'experiment_id': experiment_id,
+        'sample_id': core_metadata.get('sample_id', os.path.basename(key)),
+        's3_object_key': key,
+        # Lets the samplesheet Lambda tell when its cached tags are stale
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    }
+    item.update(context_data)
+    return item
+
+
+def _tagging(core_metadata):
+    """Encodes core metadata as the URL-encoded tag set accepted in an upload request."""
+    return urlencode({k: str(v) for k, v in core_metadata.items()})
+
+
+def _b64(digest):
+    return base64.b64encode(digest).decode('ascii')
+
+
+class UploadJournal:
+    """
+    Local record of one object's multipart upload: the file it was started
+    from, its part checksums, the upload ID and the ETag of every completed
+    part. It is rewritten atomically after each part so an interrupted run
+    can resume where it stopped.
+    """
+
+    def __init__(self, journal_dir, bucket, key):
+        name = hashlib.sha256(f'{bucket}/{key}'.encode('utf-8')).hexdigest()
+        self.path = os.path.join(journal_dir, f'{name}.json')
+        self.state = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+
+    def save(self):
+        with self._lock:
+            self._write()
+
+    def record_part(self, part_number, etag):
+        with self._lock:
+            self.state['parts'][str(part_number)] = etag
+            self._write()
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _read_part(file_path, part_number, part_size):
+    with open(file_path, 'rb') as f:
+        f.seek((part_number - 1) * part_size)
+        return f.read(part_size)
+
+
+def _hash_parts(file_path, part_count, part_size, max_workers):
+    """Returns the base64 SHA-256 of every part, hashing parts in parallel."""
+    def digest(part_number):
+        return _b64(hashlib.sha256(_read_part(file_path, part_number, part_size)).digest())
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(digest, range(1, part_count + 1)))
+
+
+def _composite_checksum(part_checksums):
+    """The checksum S3 reports for a multipart object: SHA-256 over the part digests."""
+    return _b64(hashlib.sha256(b''.join(base64.b64decode(c) for c in part_checksums)).digest())
+
+
+def _retag(s3_client, bucket, key, tagging):
+    """Replaces the object's tags with the URL-encoded `tagging` if they differ; returns whether they did."""
+    wanted = dict(parse_qsl(tagging, keep_blank_values=True))
+    current = {tag['Key']: tag['Value'] for tag in s3_client.get_object_tagging(Bucket=bucket, Key=key)['TagSet']}
+    if current == wanted:
+        return False
+    s3_client.put_object_tagging(
+        Bucket=bucket, Key=key, Tagging={'TagSet': [{'Key': k, 'Value': v} for k, v in wanted.items()]}
+    )
+    return True
+
+
+def resumable_upload(s3_client, file_path, bucket, key, tagging=None, part_size=DEFAULT_MULTIPART_CHUNKSIZE,
+                     max_workers=DEFAULT_PART_CONCURRENCY, journal_dir=DEFAULT_JOURNAL_DIR, callback=None):
     """
-    Uploads a file to S3, attaches core metadata as tags, and records the
-    experimental context in a DynamoDB table.
+    Uploads a file as a SHA-256 checksummed multipart upload that survives
+    interruption.
+
+    Part checksums are computed in parallel and kept in a local journal with
+    the upload ID and completed parts. If the object already exists with the
+    same checksum, nothing is uploaded, but its tags are replaced when they
+    differ from `tagging` (e.g. after correcting the metadata). If a journal
+    from an earlier run
+    exists for the same unchanged file, only the parts S3 does not yet have
+    are sent.
+
+    :param s3_client: boto3 S3 client.
+    :param file_path: Path to the local file to upload.
+    :param bucket: Name of the S3 bucket.
+    :param key: S3 object key.
+    :param tagging: URL-encoded tag set applied when the upload is created, or
+                    to an existing identical object. None leaves an existing
+                    object's tags as they are.
+    :param part_size: Part size in bytes (raised if the file needs more than 10,000 parts).
+    :param max_workers: Parts hashed and uploaded at once.
+    :param journal_dir: Directory for upload journals.
+    :param callback: Called with the number of bytes sent after each part.
+    :return: A dict with skipped, retagged, resumed_parts, uploaded_parts and checksum_sha256.
+    """
+    stat = os.stat(file_path)
+    part_size = max(part_size, math.ceil(stat.st_size / MAX_PARTS))
+    part_count = max(1, math.ceil(stat.st_size / part_size))
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'part_size': part_size}
+
+    journal = UploadJournal(journal_dir, bucket, key)
+    if journal.state.get('file') != fingerprint:
+        if journal.state.get('upload_id'):
+            # The file changed since the interrupted run; its parts are useless
+            try:
+                s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=journal.state['upload_id'])
+            except ClientError:
+                pass
+        journal.state = {'file': fingerprint, 'file_path': file_path, 'checksums': None, 'upload_id': None, 'parts': {}}
+    if journal.state['checksums'] is None:
+        journal.state['checksums'] = _hash_parts(file_path, part_count, part_size, max_workers)
+        journal.save()
+    checksums = journal.state['checksums']
+    composite = _composite_checksum(checksums)
+
+    try:
+        existing = s3_client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+        # Multipart checksums are reported as "<checksum>-<part count>"
+        if existing.get('ChecksumSHA256', '').split('-')[0] == composite:
+            journal.delete()
+            retagged = tagging is not None and _retag(s3_client, bucket, key, tagging)
+            return {'skipped': True, 'retagged': retagged, 'resumed_parts': 0, 'uploaded_parts': 0, 'checksum_sha256': composite}
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+
+    resumed = {}
+    if journal.state['upload_id']:
+        try:
+            paginator = s3_client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=journal.state['upload_id']):
+                for part in page.get('Parts', []):
+                    # Trust only parts that both sides agree were completed
+                    if journal.state['parts'].get(str(part['PartNumber'])) == part['ETag']:
+                        resumed[part['PartNumber']] = part['ETag']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload':
+                raise
+            journal.state['upload_id'] = None
+    if not journal.state['upload_id']:
+        kwargs = {'Bucket': bucket, 'Key': key, 'ChecksumAlgorithm': 'SHA256'}
+        if tagging:
+            kwargs['Tagging'] = tagging
+        journal.state['upload_id'] = s3_client.create_multipart_upload(**kwargs)['UploadId']
+        resumed = {}
+    journal.state['parts'] = {str(number): etag for number, etag in resumed.items()}
+    journal.save()
+    upload_id = journal.state['upload_id']
+
+    def upload_part(part_number):
+        body = _read_part(file_path, part_number, part_size)
+        checksum = _b64(hashlib.sha256(body).digest())
+        if checksum != checksums[part_number - 1]:
+            raise ValueError(f'{file_path} changed during upload (part {part_number})')
+        response = s3_client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+            Body=body, ChecksumSHA256=checksum
+        )
+        journal.record_part(part_number, response['ETag'])
+        if callback:
+            callback(len(body))
+
+    remaining = [number for number in range(1, part_count + 1) if number not in resumed]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() re-raises the first failed part; the journal keeps the rest for the next run
+        list(executor.map(upload_part, remaining))
+
+    parts = [
+        {'PartNumber': number, 'ETag': journal.state['parts'][str(number)], 'ChecksumSHA256': checksums[number - 1]}
+        for number in range(1, part_count + 1)
+    ]
+    s3_client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+    journal.delete()
+    return {'skipped': False, 'retagged': False, 'resumed_parts': len(resumed), 'uploaded_parts': len(remaining), 'checksum_sha256': composite}
+
+
+def upload_with_metadata(file_path, bucket, key, table_name, experiment_id, context_json, core_metadata_json,
+                         resumable=False, journal_dir=DEFAULT_JOURNAL_DIR, validate_schema=None):
+    """
+    Uploads a file to S3 with its core metadata attached as tags, and records
+    the experimental context in a DynamoDB table.
 
     :param file_path: Path to the local file to upload.
     :param bucket: Name of the S3 bucket.
@@ -15,6 +249,11 @@ def upload_with_metadata(file_path, bucket, key, table_name, experiment_id, cont
     :param experiment_id: The ID of the experiment this sample belongs to.
     :param context_json: A JSON string of the experimental context (e.g., '{"treatment": "drug_a"}').
     :param core_metadata_json: A JSON string of the core metadata to be stored as S3 tags.
+    :param resumable: Upload with `resumable_upload`, resuming an interrupted upload and
+                      skipping the upload if the object already has the same checksum.
+    :param journal_dir: Directory for resumable upload journals.
+    :param validate_schema: metadata/schemas record type (e.g. 'experiment_contexts') the
+                            context record must satisfy before anything is uploaded.
     """
     s3_client = boto3.client('s3')
     dynamodb = boto3.resource('dynamodb')
@@ -28,63 +267,340 @@ def upload_with_metadata(file_path, bucket, key, table_name, experiment_id, cont
         print(f"Error: Invalid JSON provided. {e}")
         return
 
-    # 2. Upload file to S3
+    if validate_schema:
+        errors = get_validator(validate_schema).errors(_context_item(experiment_id, key, core_metadata, context_data))
+        if errors:
+            print(f"Error: Context does not match the {validate_schema} schema: " + '; '.join(f'{path}: {message}' for path, message in errors))
+            return
+
+    # 2. Upload file to S3 with the core metadata as tags, in one request
     print(f"Uploading {file_path} to s3://{bucket}/{key}...")
     try:
-        s3_client.upload_file(file_path, bucket, key)
-        print("Upload successful.")
+        if resumable:
+            result = resumable_upload(s3_client, file_path, bucket, key, _tagging(core_metadata), journal_dir=journal_dir)
+            if result['skipped']:
+                print(f"Skipped: object already exists with SHA-256 {result['checksum_sha256']}"
+                      f"{'; its tags were updated' if result['retagged'] else ''}.")
+            else:
+                print(f"Upload successful ({result['uploaded_parts']} parts sent, {result['resumed_parts']} resumed).")
+        else:
+            s3_client.upload_file(file_path, bucket, key, ExtraArgs={'Tagging': _tagging(core_metadata)})
+            print("Upload successful.")
     except Exception as e:
         print(f"Error uploading to S3: {e}")
         return
 
-    # 3. Attach core metadata as S3 tags
-    print("Attaching core metadata as S3 tags...")
-    try:
-        tag_set = [{'Key': k, 'Value': str(v)} for k, v in core_metadata.items()]
-        s3_client.put_object_tagging(
-            Bucket=bucket,
-            Key=key,
-            Tagging={'TagSet': tag_set}
-        )
-        print("Tagging successful.")
-    except Exception as e:
-        print(f"Error attaching S3 tags: {e}")
-        return
-
-    # 4. Record experimental context in DynamoDB
+    # 3. Record experimental context in DynamoDB
     print(f"Recording experimental context in DynamoDB table {table_name}...")
     try:
-        item = {
-            'experiment_id': experiment_id,
-            'sample_id': core_metadata.get('sample_id', os.path.basename(key)),
-            's3_object_key': key
-        }
-        item.update(context_data)
-
-        table.put_item(Item=item)
+        table.put_item(Item=_context_item(experiment_id, key, core_metadata, context_data))
         print("DynamoDB record created successfully.")
     except Exception as e:
         print(f"Error writing to DynamoDB: {e}")
         return
 
+
+def load_upload_manifest(path):
+    """
+    Reads bulk upload entries from a JSON or CSV manifest.
+
+    A JSON manifest is a list of objects with `file_path` and optionally
+    `key`, `experiment_id`, `core_metadata` and `context`; retry manifests
+    written by `bulk_upload` use the same format. In a CSV manifest, columns
+    named `tag:<name>` become core metadata tags and any column other than
+    file_path, key and experiment_id becomes experimental context.
+
+    :param path: Path to a .json or .csv manifest.
+    :return: A list of entry dicts.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        entries = []
+        for row in csv.DictReader(f):
+            entry = {'core_metadata': {}, 'context': {}}
+            for column, value in row.items():
+                if value in (None, ''):
+                    continue
+                if column in MANIFEST_FIELDS:
+                    entry[column] = value
+                elif column.startswith(TAG_COLUMN_PREFIX):
+                    entry['core_metadata'][column[len(TAG_COLUMN_PREFIX):]] = value
+                else:
+                    entry['context'][column] = value
+            entries.append(entry)
+        return entries
+
+
+def glob_entries(pattern, key_prefix, core_metadata=None, context=None):
+    """
+    Builds bulk upload entries for every file matching `pattern`. Each file's
+    key is `key_prefix` plus its basename, and its sample_id tag defaults to
+    the basename up to the first '.'.
+    """
+    entries = []
+    for file_path in sorted(glob.glob(pattern, recursive=True)):
+        if not os.path.isfile(file_path):
+            continue
+        name = os.path.basename(file_path)
+        entry_metadata = {'sample_id': name.split('.', 1)[0]}
+        entry_metadata.update(core_metadata or {})
+        entries.append({
+            'file_path': file_path,
+            'key': f"{key_prefix.rstrip('/')}/{name}" if key_prefix else name,
+            'core_metadata': entry_metadata,
+            'context': dict(context or {})
+        })
+    return entries
+
+
+class UploadProgress:
+    """Thread-safe byte counter for upload callbacks that reports throughput periodically."""
+
+    def __init__(self, total_files, total_bytes, interval=PROGRESS_INTERVAL, stream=None):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.bytes_done = 0
+        self.files_done = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_done += count
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def skip(self, count):
+        """Drops a file that needed no transfer from the byte total."""
+        with self._lock:
+            self.total_bytes -= count
+
+    def file_done(self):
+        with self._lock:
+            self.files_done += 1
+
+    def throughput(self):
+        """Returns MiB/s since the upload started."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return self.bytes_done / 1024 / 1024 / elapsed
+
+    def report(self):
+        percent = 100.0 * self.bytes_done / self.total_bytes if self.total_bytes else 100.0
+        print(
+            f"{self.files_done}/{self.total_files} files, "
+            f"{self.bytes_done / 1024 ** 3:.2f}/{self.total_bytes / 1024 ** 3:.2f} GiB ({percent:.1f}%), "
+            f"{self.throughput():.1f} MiB/s",
+            file=self.stream
+        )
+
+
+def bulk_upload(entries, bucket, table_name, experiment_id=None, max_workers=DEFAULT_BULK_WORKERS,
+                transfer_config=None, retry_manifest=None, s3_client=None, dynamodb=None, progress_interval=PROGRESS_INTERVAL,
+                resumable=False, journal_dir=DEFAULT_JOURNAL_DIR, validate_schema=None):
+    """
+    Uploads many files concurrently and records their contexts in batches.
+
+    Each file is uploaded with a managed (multipart above the threshold)
+    transfer that carries its tags in the same request. Context records are
+    written with DynamoDB's batch writer as uploads finish. Failures do not
+    stop the run; they are collected and, if `retry_manifest` is given,
+    written there as a JSON manifest that can be passed back in.
+
+    :param entries: Upload entries (see `load_upload_manifest`).
+    :param bucket: Name of the S3 bucket.
+    :param table_name: Name of the DynamoDB table for experimental contexts.
+    :param experiment_id: Experiment ID for entries that do not set their own.
+    :param max_workers: Number of files uploaded at once.
+    :param transfer_config: boto3 TransferConfig for each file's transfer.
+    :param retry_manifest: Path to write failed entries to.
+    :param resumable: Upload each file with `resumable_upload`, using the transfer
+                      config's chunk size and concurrency.
+    :param journal_dir: Directory for resumable upload journals.
+    :param validate_schema: metadata/schemas record type each context record must satisfy;
+                            entries that do not are not uploaded and go to the retry manifest.
+    :return: A summary dict with uploaded/skipped/failed counts, bytes and throughput.
+    """
+    transfer_config = transfer_config or TransferConfig(
+        multipart_threshold=DEFAULT_MULTIPART_THRESHOLD,
+        multipart_chunksize=DEFAULT_MULTIPART_CHUNKSIZE,
+        max_concurrency=DEFAULT_PART_CONCURRENCY
+    )
+    if s3_client is None:
+        # One shared client; its pool must cover every part in flight
+        config = Config(max_pool_connections=max_workers * transfer_config.max_concurrency + 10, retries={'mode': 'standard'})
+        s3_client = boto3.client('s3', config=config)
+    table = (dynamodb or boto3.resource('dynamodb')).Table(table_name)
+
+    failures = []
+    runnable = []
+    validator = get_validator(validate_schema) if validate_schema else None
+    report = ValidationReport(validate_schema) if validator else None
+    for entry in entries:
+        entry = dict(entry, experiment_id=entry.get('experiment_id') or experiment_id)
+        entry.setdefault('key', os.path.basename(entry['file_path']))
+        if not entry['experiment_id']:
+            failures.append(dict(entry, stage='validate', error='No experiment_id'))
+        elif not os.path.isfile(entry['file_path']):
+            failures.append(dict(entry, stage='validate', error='File not found'))
+        else:
+            if validator:
+                # CSV manifests give every context value as a string
+                entry['context'] = validator.coerce(entry.get('context', {}))
+                record = _context_item(entry['experiment_id'], entry['key'], entry.get('core_metadata', {}), entry['context'])
+                errors = validator.errors(record)
+                report.add(record, errors)
+                if errors:
+                    failures.append(dict(entry, stage='validate', error='; '.join(f'{path}: {message}' for path, message in errors)))
+                    continue
+            runnable.append(entry)
+    if report and report.invalid:
+        print(f"{report.invalid} of {report.total} entries failed {validate_schema} validation:")
+        for path, details in report.to_dict()['fields'].items():
+            print(f"  {path}: " + ', '.join(f'{message} ({count})' for message, count in details['errors'].items()))
+
+    progress = UploadProgress(len(runnable), sum(os.path.getsize(e['file_path']) for e in runnable), progress_interval)
+
+    skipped = []
+
+    def upload(entry):
+        if resumable:
+            result = resumable_upload(
+                s3_client, entry['file_path'], bucket, entry['key'], _tagging(entry.get('core_metadata', {})),
+                part_size=transfer_config.multipart_chunksize, max_workers=transfer_config.max_concurrency,
+                journal_dir=journal_dir, callback=progress.add_bytes
+            )
+            if result['skipped']:
+                skipped.append(entry['key'])
+                progress.skip(os.path.getsize(entry['file_path']))
+            progress.file_done()
+            return entry
+        s3_client.upload_file(
+            entry['file_path'], bucket, entry['key'],
+            ExtraArgs={'Tagging': _tagging(entry.get('core_metadata', {}))},
+            Config=transfer_config,
+            Callback=progress.add_bytes
+        )
+        progress.file_done()
+        return entry
+
+    def write_contexts(batch):
+        try:
+            with table.batch_writer(overwrite_by_pkeys=['experiment_id', 'sample_id']) as writer:
+                for entry in batch:
+                    writer.put_item(Item=_context_item(
+                        entry['experiment_id'], entry['key'], entry.get('core_metadata', {}), entry.get('context', {})
+                    ))
+        except Exception as e:
+            failures.extend(dict(entry, stage='dynamodb', error=str(e)) for entry in batch)
+            return 0
+        return len(batch)
+
+    recorded = 0
+    pending = []
+    # The batch writer is not thread-safe, so records are written from this thread only
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(upload, entry): entry for entry in runnable}
+        for future in as_completed(futures):
+            try:
+                pending.append(future.result())
+            except Exception as e:
+                entry = futures[future]
+                print(f"Error uploading {entry['file_path']}: {e}")
+                failures.append(dict(entry, stage='upload', error=str(e)))
+                continue
+            if len(pending) >= DYNAMODB_BATCH_SIZE:
+                recorded += write_contexts(pending)
+                pending = []
+    if pending:
+        recorded += write_contexts(pending)
+    progress.report()
+
+    if failures and retry_manifest:
+        with open(retry_manifest, 'w') as f:
+            json.dump(failures, f, indent=2, default=str)
+        print(f"Wrote {len(failures)} failed entries to {retry_manifest}")
+
+    elapsed = time.monotonic() - progress.started
+    return {
+        'uploaded': recorded,
+        'skipped': len(skipped),
+        'failed': len(failures),
+        'bytes': progress.bytes_done,
+        'seconds': round(elapsed, 2),
+        'throughput_mib_s': round(progress.throughput(), 2),
+        'retry_manifest': retry_manifest if failures else None
+    }
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Upload a file to S3 with associated metadata.')
-    parser.add_argument('--file-path', required=True, help='Path to the local file.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file-path', help='Path to the local file.')
+    source.add_argument('--manifest', help='Bulk mode: JSON or CSV manifest of files to upload (see load_upload_manifest).')
+    source.add_argument('--glob', help="Bulk mode: upload every file matching this pattern (e.g. 'run1/*.fastq.gz').")
     parser.add_argument('--bucket', required=True, help='S3 bucket name.')
-    parser.add_argument('--key', required=True, help='S3 object key.')
+    parser.add_argument('--key', help='S3 object key (single-file mode).')
+    parser.add_argument('--key-prefix', default='', help='S3 key prefix for files matched by --glob.')
     parser.add_argument('--table-name', required=True, help='DynamoDB table name for contexts.')
-    parser.add_argument('--experiment-id', required=True, help='Experiment ID.')
-    parser.add_argument('--context-json', required=True, help='JSON string for experimental context.')
-    parser.add_argument('--core-metadata-json', required=True, help='JSON string for core metadata (S3 tags).')
+    parser.add_argument('--experiment-id', help='Experiment ID (default for manifest entries without one).')
+    parser.add_argument('--context-json', default='{}', help='JSON string for experimental context.')
+    parser.add_argument('--core-metadata-json', default='{}', help='JSON string for core metadata (S3 tags).')
+    parser.add_argument('--workers', type=int, default=DEFAULT_BULK_WORKERS, help='Bulk mode: files uploaded at once.')
+    parser.add_argument('--part-concurrency', type=int, default=DEFAULT_PART_CONCURRENCY, help='Bulk mode: parts uploaded at once per file.')
+    parser.add_argument('--multipart-threshold-mb', type=int, default=DEFAULT_MULTIPART_THRESHOLD // 1024 // 1024, help='Bulk mode: files larger than this use multipart uploads.')
+    parser.add_argument('--multipart-chunksize-mb', type=int, default=DEFAULT_MULTIPART_CHUNKSIZE // 1024 // 1024, help='Bulk mode: multipart part size.')
+    parser.add_argument('--resumable', action='store_true', help='Use checksummed multipart uploads that resume after interruption and skip objects that already match.')
+    parser.add_argument('--journal-dir', default=DEFAULT_JOURNAL_DIR, help='Directory for resumable upload journals.')
+    parser.add_argument('--validate-schema', help='Reject contexts that do not match this metadata/schemas record type (e.g. experiment_contexts).')
+    parser.add_argument('--retry-manifest', default='upload-retry.json', help='Bulk mode: where to write entries that failed.')
 
     args = parser.parse_args()
 
-    upload_with_metadata(
-        args.file_path,
-        args.bucket,
-        args.key,
-        args.table_name,
-        args.experiment_id,
-        args.context_json,
-        args.core_metadata_json
-    )
+    if args.file_path:
+        if not args.key or not args.experiment_id:
+            parser.error('--key and --experiment-id are required with --file-path')
+        upload_with_metadata(
+            args.file_path,
+            args.bucket,
+            args.key,
+            args.table_name,
+            args.experiment_id,
+            args.context_json,
+            args.core_metadata_json,
+            resumable=args.resumable,
+            journal_dir=args.journal_dir,
+            validate_schema=args.validate_schema
+        )
+    else:
+        try:
+            context = json.loads(args.context_json)
+            core_metadata = json.loads(args.core_metadata_json)
+        except json.JSONDecodeError as e:
+            parser.error(f'Invalid JSON provided. {e}')
+        if args.manifest:
+            entries = load_upload_manifest(args.manifest)
+            for entry in entries:
+                entry['core_metadata'] = dict(core_metadata, **entry.get('core_metadata', {}))
+                entry['context'] = dict(context, **entry.get('context', {}))
+        else:
+            entries = glob_entries(args.glob, args.key_prefix, core_metadata, context)
+        transfer_config = TransferConfig(
+            multipart_threshold=args.multipart_threshold_mb * 1024 * 1024,
+            multipart_chunksize=args.multipart_chunksize_mb * 1024 * 1024,
+            max_concurrency=args.part_concurrency
+        )
+        summary = bulk_upload(
+            entries, args.bucket, args.table_name, args.experiment_id,
+            max_workers=args.workers, transfer_config=transfer_config, retry_manifest=args.retry_manifest,
+            resumable=args.resumable, journal_dir=args.journal_dir, validate_schema=args.validate_schema
+        )
+        print(json.dumps(summary, indent=2))
+        if summary['failed']:
+            sys.exit(1)
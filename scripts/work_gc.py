@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# scripts/work_gc.py
+"""
+Garbage collector for the Nextflow work directory in S3.
+
+launcher.py points every run's NXF_WORK at s3://{bucket}/work, where Nextflow
+keeps one directory per task under work/<2 hex>/<30 hex>/. Task directories
+whose hash is not listed in any retained trace file under work/trace/, and
+whose objects are all older than a minimum age, are deleted.
+
+The 256 two-character hash prefixes (optionally split further) are listed in
+parallel. Each worker streams its listing one task directory at a time and
+deletes in delete_objects batches of up to 1,000 keys, so memory stays
+bounded by the referenced hash set rather than by the size of the bucket.
+Dry-run mode deletes nothing and reports the reclaimable objects and bytes.
+
+Deleting a run's task directories means `-resume` can no longer reuse them;
+keep the trace files of every run that may be resumed.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_WORK_PREFIX = 'work/'
+DEFAULT_TRACE_PREFIX = 'work/trace/'
+DEFAULT_WORKERS = 16
+# Task directories with any object newer than this may belong to a running
+# workflow whose trace has not been written yet
+DEFAULT_MIN_AGE_DAYS = 7
+DELETE_BATCH_SIZE = 1000
+HEX_DIGITS = '0123456789abcdef'
+# A task directory below the work prefix: <2 hex>/<30 hex>/
+TASK_DIR_PATTERN = re.compile(r'^([0-9a-f]{2}/[0-9a-f]{30})/')
+# Trace files record abbreviated hashes such as "ab/cdef01"
+TRACE_HASH_LENGTH = 9
+
+
+def shard_prefixes(extra_chars=0):
+    """Returns the hash prefixes listed in parallel: 'ab/' (256 shards) or 'ab/c' (4,096) and so on."""
+    prefixes = [f'{a}{b}/' for a in HEX_DIGITS for b in HEX_DIGITS]
+    for _ in range(extra_chars):
+        prefixes = [prefix + digit for prefix in prefixes for digit in HEX_DIGITS]
+    return prefixes
+
+
+def trace_hashes(lines):
+    """Yields the task hashes of one tab-separated trace file, normalized to 'ab/cdef01'."""
+    lines = iter(lines)
+    header = next(lines, '').rstrip('\n').split('\t')
+    if 'hash' not in header:
+        return
+    index = header.index('hash')
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) > index and '/' in fields[index]:
+            yield fields[index][:TRACE_HASH_LENGTH]
+
+
+def load_referenced_hashes(s3_client, bucket_name, trace_prefix=DEFAULT_TRACE_PREFIX, keep_runs=None, paths=()):
+    """
+    Collects the task hashes of retained runs.
+
+    Args:
+        trace_prefix (str): Prefix holding trace files (names starting with
+                            "trace"), as written by nextflow.config.
+        keep_runs (int): Only the most recent trace files count as retained.
+                         All of them count when None.
+        paths (list): Additional local trace files.
+
+    Returns:
+        tuple: (set of hashes, list of trace sources read, list of sources
+               that yielded no hashes: no hash column, empty or truncated).
+    """
+    trace_objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=trace_prefix):
+        trace_objects.extend(
+            obj for obj in page.get('Contents', [])
+            if obj['Key'].rsplit('/', 1)[-1].startswith('trace')
+        )
+    trace_objects.sort(key=lambda obj: obj['LastModified'], reverse=True)
+    if keep_runs is not None:
+        trace_objects = trace_objects[:keep_runs]
+
+    hashes = set()
+    sources = []
+    unusable = []
+
+    def add(source, source_hashes):
+        found = set(source_hashes)
+        hashes.update(found)
+        sources.append(source)
+        if not found:
+            unusable.append(source)
+
+    for obj in trace_objects:
+        body = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])['Body']
+        add(f"s3://{bucket_name}/{obj['Key']}", trace_hashes(line.decode('utf-8') for line in body.iter_lines()))
+    for path in paths:
+        with open(path, 'r') as f:
+            add(path, trace_hashes(f))
+    return hashes, sources, unusable
+
+
+def iter_task_dirs(s3_client, bucket_name, prefix, work_prefix=DEFAULT_WORK_PREFIX):
+    """
+    Streams the listing of `prefix` and yields (task dir, objects) one task
+    directory at a time. Keys arrive sorted, so a directory's objects are
+    contiguous. Keys that are not inside a task directory are skipped.
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    current = None
+    objects = []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=work_prefix + prefix):
+        for obj in page.get('Contents', []):
+            match = TASK_DIR_PATTERN.match(obj['Key'][len(work_prefix):])
+            if not match:
+                continue
+            task_dir = match.group(1)
+            if task_dir != current:
+                if objects:
+                    yield current, objects
+                current = task_dir
+                objects = []
+            objects.append(obj)
+    if objects:
+        yield current, objects
+
+
+class WorkDirCollector:
+    def __init__(self, s3_client, bucket_name, referenced, work_prefix=DEFAULT_WORK_PREFIX,
+                 min_age_days=DEFAULT_MIN_AGE_DAYS, dry_run=True, max_workers=DEFAULT_WORKERS,
+                 batch_size=DELETE_BATCH_SIZE, now=None):
+        """
+        Args:
+            s3_client: A boto3 S3 client object (clients are thread-safe).
+            bucket_name (str): Bucket holding the work directory.
+            referenced (set): Task hashes to keep, as from load_referenced_hashes.
+            min_age_days (float): Keep directories with any object newer than this.
+            dry_run (bool): Report what would be deleted without deleting.
+            batch_size (int): Keys per delete_objects call (S3 allows 1,000).
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.referenced = referenced
+        self.work_prefix = work_prefix
+        self.cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=min_age_days)
+        self.dry_run = dry_run
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'task_dirs': 0, 'referenced_dirs': 0, 'recent_dirs': 0,
+            'collected_dirs': 0, 'collected_objects': 0, 'collected_bytes': 0,
+            'kept_objects': 0, 'kept_bytes': 0, 'delete_calls': 0, 'delete_errors': 0
+        }
+
+    def _delete(self, keys, stats):
+        response = self.s3_client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+        stats['delete_calls'] += 1
+        for error in response.get('Errors', []):
+            stats['delete_errors'] += 1
+            print(f"Could not delete {error.get('Key')}: {error.get('Code')} {error.get('Message')}", file=sys.stderr)
+
+    def collect_shard(self, prefix):
+        """Collects one hash prefix; returns its stats."""
+        stats = self._empty_stats()
+        batch = []
+        for task_dir, objects in iter_task_dirs(self.s3_client, self.bucket_name, prefix, self.work_prefix):
+            stats['task_dirs'] += 1
+            size = sum(obj['Size'] for obj in objects)
+            keep = None
+            if task_dir[:TRACE_HASH_LENGTH] in self.referenced:
+                keep = 'referenced_dirs'
+            elif any(obj['LastModified'] > self.cutoff for obj in objects):
+                keep = 'recent_dirs'
+            if keep:
+                stats[keep] += 1
+                stats['kept_objects'] += len(objects)
+                stats['kept_bytes'] += size
+                continue
+            stats['collected_dirs'] += 1
+            stats['collected_objects'] += len(objects)
+            stats['collected_bytes'] += size
+            if self.dry_run:
+                continue
+            for obj in objects:
+                batch.append(obj['Key'])
+                if len(batch) >= self.batch_size:
+                    self._delete(batch, stats)
+                    batch = []
+        if batch:
+            self._delete(batch, stats)
+        with self._lock:
+            for name, value in stats.items():
+                self.stats[name] += value
+        return stats
+
+    def run(self, prefixes=None):
+        """
+        Collects every shard in parallel.
+
+        Returns:
+            dict: Totals over all shards, plus 'dry_run' and 'seconds'.
+        """
+        start = time.perf_counter()
+        self.stats = self._empty_stats()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self.collect_shard, prefixes or shard_prefixes()))
+        return dict(self.stats, dry_run=self.dry_run, seconds=round(time.perf_counter() - start, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Delete Nextflow task directories that no retained trace references.')
+    parser.add_argument('--bucket', required=True, help='Bucket holding the work directory.')
+    parser.add_argument('--work-prefix', default=DEFAULT_WORK_PREFIX, help='Work directory prefix in the bucket.')
+    parser.add_argument('--trace-prefix', default=DEFAULT_TRACE_PREFIX, help='Prefix holding the trace files of retained runs.')
+    parser.add_argument('--trace', action='append', default=[], help='Additional local trace file of a retained run.')
+    parser.add_argument('--keep-runs', type=int, help='Only the most recent N trace files count as retained.')
+    parser.add_argument('--min-age-days', type=float, default=DEFAULT_MIN_AGE_DAYS, help='Keep task directories with any object newer than this.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Hash-prefix shards listed at once.')
+    parser.add_argument('--shard-depth', type=int, default=0, help='Extra hex characters per shard (0: 256 shards, 1: 4,096).')
+    parser.add_argument('--delete', action='store_true', help='Delete objects. Without it, only report what would be reclaimed.')
+    parser.add_argument('--allow-no-traces', action='store_true', help='Delete even when no task hashes are found, or some trace files list none.')
+    args = parser.parse_args(argv)
+
+    import boto3
+    from botocore.config import Config
+
+    work_prefix = args.work_prefix if args.work_prefix.endswith('/') else args.work_prefix + '/'
+    s3_client = boto3.client('s3', config=Config(
+        max_pool_connections=args.workers, retries={'mode': 'adaptive', 'max_attempts': 10}
+    ))
+    referenced, sources, unusable = load_referenced_hashes(s3_client, args.bucket, args.trace_prefix, args.keep_runs, args.trace)
+    print(f'{len(referenced)} task hashes referenced by {len(sources)} trace file(s)', file=sys.stderr)
+    for source in unusable:
+        print(f'Warning: {source} lists no task hashes (no hash column, or empty or truncated)', file=sys.stderr)
+    if args.delete and not args.allow_no_traces:
+        # Deleting with a missing or partial reference set would remove directories retained runs still need
+        if not referenced:
+            parser.error('no task hashes found in trace files; refusing to delete every task directory without --allow-no-traces')
+        if unusable:
+            parser.error(f'{len(unusable)} trace file(s) list no task hashes; refusing to delete without --allow-no-traces')
+
+    collector = WorkDirCollector(
+        s3_client,
+        args.bucket,
+        referenced,
+        work_prefix=work_prefix,
+        min_age_days=args.min_age_days,
+        dry_run=not args.delete,
+        max_workers=args.workers
+    )
+    summary = collector.run(shard_prefixes(args.shard_depth))
+    json.dump(summary, sys.stdout, indent=4)
+    print()
+    return 1 if summary['delete_errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
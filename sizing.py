@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# sizing.py
+"""
+Chooses vCPU and memory for the nextflow-runner head job.
+
+The head job's load is driven by how many tasks it schedules and tracks. The
+expected task count is estimated from the samplesheet row count and the
+tasks-per-sample ratio observed in past runs' trace files, which
+nextflow.config writes to ${workDir}/trace/ (s3://{bucket}/work/trace/ when
+launched through launcher.py).
+"""
+import re
+import statistics
+import threading
+
+# Used when no usable trace history exists
+DEFAULT_TASKS_PER_SAMPLE = 10
+# Number of most recent trace files consulted
+DEFAULT_HISTORY_LIMIT = 20
+DEFAULT_TRACE_PREFIX = 'work/trace/'
+
+# (max expected tasks, vcpus, memory in MiB), smallest tier first
+SIZE_TIERS = [
+    (200, 1, 768),
+    (2000, 1, 2048),
+    (10000, 2, 4096),
+    (50000, 4, 8192),
+    (None, 8, 16384),
+]
+
+# Matches the tag Nextflow appends to task names, e.g. "FASTQC (SAM001)"
+TASK_TAG_PATTERN = re.compile(r'\((.+)\)\s*$')
+
+
+def trace_tasks_per_sample(lines):
+    """
+    Returns the tasks-per-sample ratio of one trace file, or None when the
+    file has no tagged tasks. Samples are counted as distinct task tags.
+
+    Args:
+        lines: Iterable of text lines of a tab-separated trace file.
+    """
+    lines = iter(lines)
+    header = next(lines, '').rstrip('\n').split('\t')
+    if 'name' not in header:
+        return None
+    name_index = header.index('name')
+
+    task_count = 0
+    tags = set()
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) <= name_index:
+            continue
+        task_count += 1
+        match = TASK_TAG_PATTERN.search(fields[name_index])
+        if match:
+            tags.add(match.group(1))
+
+    if not tags:
+        return None
+    return task_count / len(tags)
+
+
+class HeadJobSizer:
+    def __init__(self, s3_client, bucket_name, trace_prefix=DEFAULT_TRACE_PREFIX, history_limit=DEFAULT_HISTORY_LIMIT):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.trace_prefix = trace_prefix
+        self.history_limit = history_limit
+        self._history = None
+        self._lock = threading.Lock()
+
+    def history(self):
+        """Tasks-per-sample ratios of the most recent trace files, loaded once."""
+        with self._lock:
+            if self._history is None:
+                self._history = self._load_history()
+            return self._history
+
+    def _load_history(self):
+        trace_objects = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.trace_prefix):
+            trace_objects.extend(
+                obj for obj in page.get('Contents', [])
+                if obj['Key'].rsplit('/', 1)[-1].startswith('trace')
+            )
+        trace_objects.sort(key=lambda obj: obj['LastModified'], reverse=True)
+
+        history = []
+        for obj in trace_objects[:self.history_limit]:
+            body = self.s3_client.get_object(Bucket=self.bucket_name, Key=obj['Key'])['Body']
+            ratio = trace_tasks_per_sample(line.decode('utf-8') for line in body.iter_lines())
+            if ratio is not None:
+                history.append(ratio)
+        return history
+
+    def choose(self, sample_count):
+        """
+        Picks head-job resources for a run over `sample_count` samples.
+
+        Returns:
+            dict: {'vcpus', 'memory', 'reason'} with memory in MiB.
+        """
+        if not sample_count:
+            return {'vcpus': 1, 'memory': 1024, 'reason': 'sample count unknown; using the default 1 vCPU / 1024 MiB'}
+
+        history = self.history()
+        if history:
+            tasks_per_sample = statistics.median(history)
+            basis = f"median of {len(history)} past run(s) = {tasks_per_sample:.1f} tasks/sample"
+        else:
+            tasks_per_sample = DEFAULT_TASKS_PER_SAMPLE
+            basis = f"no trace history under s3://{self.bucket_name}/{self.trace_prefix}; assuming {tasks_per_sample} tasks/sample"
+
+        expected_tasks = int(round(sample_count * tasks_per_sample))
+        for max_tasks, vcpus, memory in SIZE_TIERS:
+            if max_tasks is None or expected_tasks <= max_tasks:
+                break
+        limit = f"<= {max_tasks}" if max_tasks is not None else f"> {SIZE_TIERS[-2][0]}"
+        reason = f"{sample_count} samples x ({basis}) ~ {expected_tasks} tasks; tier {limit} tasks"
+        return {'vcpus': vcpus, 'memory': memory, 'reason': reason}
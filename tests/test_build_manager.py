@@ -0,0 +1,200 @@
+import pytest
+import boto3
+import os
+import json
+import sys
+import threading
+import time
+import docker
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from build_manager import BuildManager, build_inputs, build_order, stream_push
+
+REGISTRY = '123456789012.dkr.ecr.us-east-1.amazonaws.com'
+# What docker-py's push(stream=True, decode=True) yields for a two-layer image
+PUSH_EVENTS = [
+    {'status': 'The push refers to repository [registry/nextflow-containers]'},
+    {'id': 'aaa', 'status': 'Preparing'},
+    {'id': 'bbb', 'status': 'Preparing'},
+    {'id': 'aaa', 'status': 'Layer already exists'},
+    {'id': 'bbb', 'status': 'Pushing', 'progressDetail': {'current': 512, 'total': 2048}},
+    {'id': 'bbb', 'status': 'Pushing', 'progressDetail': {'current': 2048, 'total': 2048}},
+    {'id': 'bbb', 'status': 'Pushed', 'progressDetail': {}},
+    {'status': 'tag: digest: sha256:abc size: 1234'}
+]
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+class FakeImage:
+    def __init__(self, docker_client, image_id, labels):
+        self.docker_client = docker_client
+        self.id = image_id
+        self.labels = labels
+
+    def tag(self, repository, tag):
+        self.docker_client.local[f'{repository}:{tag}'] = self
+
+class FakeImages:
+    def __init__(self, docker_client):
+        self.docker_client = docker_client
+
+    def build(self, fileobj, custom_context, dockerfile, tag, labels, rm):
+        return self.docker_client.build(dockerfile, tag, labels)
+
+    def get(self, name):
+        if name not in self.docker_client.local:
+            raise docker.errors.ImageNotFound(name)
+        return self.docker_client.local[name]
+
+    def push(self, repository, tag, stream, decode):
+        return self.docker_client.push(repository, tag)
+
+    def pull(self, repository, tag):
+        self.docker_client.pulls.append(tag)
+        return FakeImage(self.docker_client, f'pulled-{tag}', {})
+
+class FakeDocker:
+    """Builds take `build_time` seconds; pushes register the tag in (moto) ECR."""
+
+    def __init__(self, ecr, build_time=0.05, fail=()):
+        self.ecr = ecr
+        self.build_time = build_time
+        self.fail = set(fail)
+        self.images = FakeImages(self)
+        self.local = {}
+        self.builds = []
+        self.pushes = []
+        self.pulls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def build(self, dockerfile, tag, labels):
+        name = tag.split(':')[1]
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            # A dependent build must find its base image locally
+            self.builds.append((name, sorted(self.local)))
+        time.sleep(self.build_time)
+        with self._lock:
+            self.active -= 1
+        if name in self.fail:
+            raise docker.errors.BuildError(f'{name} failed', [{'stream': 'boom'}])
+        image = FakeImage(self, f'image-{name}-{labels}', labels)
+        self.local[tag] = image
+        return image, []
+
+    def push(self, repository, tag):
+        image = self.local[f'{repository}:{tag}']
+        with self._lock:
+            self.pushes.append(tag)
+        manifest = {'schemaVersion': 2, 'mediaType': 'application/vnd.docker.distribution.manifest.v2+json', 'config': {'digest': image.id}}
+        self.ecr.put_image(repositoryName='nextflow-containers', imageManifest=json.dumps(manifest), imageTag=tag)
+        return iter(PUSH_EVENTS)
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / 'Dockerfile.base').write_text('FROM debian:buster-slim\nCOPY scripts/ /opt/scripts/\n')
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'scripts' / 'entry.sh').write_text('echo hi\n')
+    for tool in ['bwa', 'samtools', 'gatk']:
+        (tmp_path / f'Dockerfile.{tool}').write_text(f'FROM nextflow-containers:base\nRUN echo {tool}\n')
+    containers = [{'name': 'base', 'dockerfile': 'Dockerfile.base', 'tags': ['latest']}] + [
+        {'name': tool, 'dockerfile': f'Dockerfile.{tool}', 'depends_on': ['base'], 'tags': ['latest']}
+        for tool in ['bwa', 'samtools', 'gatk']
+    ]
+    return tmp_path, containers
+
+@pytest.fixture
+def ecr(aws_credentials):
+    with mock_aws():
+        client = boto3.client('ecr', region_name='us-east-1')
+        client.create_repository(repositoryName='nextflow-containers')
+        yield client
+
+def test_build_order_and_inputs(project):
+    context, containers = project
+    assert [c['name'] for c in build_order(list(reversed(containers)))][0] == 'base'
+    assert build_inputs(str(context / 'Dockerfile.base'), str(context)) == ['scripts/entry.sh']
+    with pytest.raises(ValueError):
+        build_order([{'name': 'a', 'depends_on': ['b']}, {'name': 'b', 'depends_on': ['a']}])
+
+def test_builds_in_dependency_order_in_parallel_then_skips(project, ecr):
+    context, containers = project
+    fake = FakeDocker(ecr)
+    manager = BuildManager(ecr, fake, REGISTRY, 'nextflow-containers', context_dir=str(context), max_workers=4)
+
+    results = manager.run(containers)
+
+    assert results == {'base': 'built', 'bwa': 'built', 'samtools': 'built', 'gatk': 'built'}
+    assert fake.builds[0][0] == 'base'
+    assert all('nextflow-containers:base' in local for name, local in fake.builds[1:])
+    assert fake.max_active == 3
+    # Layers are pushed once per image; the manifest's tags are added in ECR
+    assert sorted(tag.split('-src-')[0] for tag in fake.pushes) == ['base', 'bwa', 'gatk', 'samtools']
+    tags = ecr.describe_images(repositoryName='nextflow-containers', imageIds=[{'imageTag': 'bwa-latest'}])['imageDetails'][0]['imageTags']
+    assert 'bwa-latest' in tags
+    assert any(tag.startswith('bwa-src-') for tag in tags)
+
+    # Nothing changed: no builds or pushes at all
+    fake = FakeDocker(ecr)
+    manager = BuildManager(ecr, fake, REGISTRY, 'nextflow-containers', context_dir=str(context))
+    assert set(manager.run(containers).values()) == {'skipped'}
+    assert fake.builds == [] and fake.pushes == []
+
+def test_changed_input_rebuilds_dependents_only_when_needed(project, ecr):
+    context, containers = project
+    BuildManager(ecr, FakeDocker(ecr), REGISTRY, 'nextflow-containers', context_dir=str(context)).run(containers)
+
+    # A change to one tool rebuilds it alone, pulling the unchanged base
+    (context / 'Dockerfile.gatk').write_text('FROM nextflow-containers:base\nRUN echo gatk 2\n')
+    fake = FakeDocker(ecr)
+    results = BuildManager(ecr, fake, REGISTRY, 'nextflow-containers', context_dir=str(context)).run(containers)
+    assert results == {'base': 'skipped', 'bwa': 'skipped', 'samtools': 'skipped', 'gatk': 'built'}
+    assert len(fake.pulls) == 1 and fake.pulls[0].startswith('base-src-')
+
+    # A change to a file the base copies in rebuilds everything
+    (context / 'scripts' / 'entry.sh').write_text('echo changed\n')
+    fake = FakeDocker(ecr)
+    results = BuildManager(ecr, fake, REGISTRY, 'nextflow-containers', context_dir=str(context)).run(containers)
+    assert set(results.values()) == {'built'}
+
+def test_failed_dependency_blocks_dependents(project, ecr):
+    context, containers = project
+    fake = FakeDocker(ecr, fail=['base'])
+    results = BuildManager(ecr, fake, REGISTRY, 'nextflow-containers', context_dir=str(context)).run(containers)
+    assert results == {'base': 'failed', 'bwa': 'blocked', 'samtools': 'blocked', 'gatk': 'blocked'}
+    assert [name for name, _ in fake.builds] == ['base']
+
+def test_new_manifest_tag_is_added_without_a_push(project, ecr):
+    context, containers = project
+    BuildManager(ecr, FakeDocker(ecr), REGISTRY, 'nextflow-containers', context_dir=str(context)).run(containers)
+
+    containers[1]['tags'].append('0.7.17')
+    fake = FakeDocker(ecr)
+    results = BuildManager(ecr, fake, REGISTRY, 'nextflow-containers', context_dir=str(context)).run(containers)
+
+    assert results['bwa'] == 'skipped'
+    assert fake.pushes == []
+    ecr.describe_images(repositoryName='nextflow-containers', imageIds=[{'imageTag': 'bwa-0.7.17'}])
+
+def test_stream_push_counts_layers_and_raises_errors(mocker):
+    client = mocker.Mock()
+    client.images.push.return_value = iter(PUSH_EVENTS)
+    assert stream_push(client, 'repo', 'tag', 'bwa') == {'layers': 2, 'pushed': 1, 'existing': 1, 'bytes': 2048}
+
+    client.images.push.return_value = iter([{'error': 'denied: not authorized'}])
+    with pytest.raises(docker.errors.APIError):
+        stream_push(client, 'repo', 'tag', 'bwa')
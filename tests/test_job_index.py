@@ -0,0 +1,85 @@
+import pytest
+import os
+import sys
+import threading
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from job_index import JobIndex
+
+class StubQueue:
+    """Job listings keyed by job ID; counts how often the queue is listed."""
+
+    def __init__(self, jobs):
+        self.jobs = {job_id: {'jobId': job_id, 'jobName': job_id, 'status': status, 'createdAt': 1} for job_id, status in jobs.items()}
+        self.calls = 0
+
+    def list_jobs(self, statuses):
+        self.calls += 1
+        return [dict(job) for job in self.jobs.values() if job['status'] in statuses]
+
+    def set_status(self, job_id, status):
+        self.jobs[job_id]['status'] = status
+
+STATUSES = ['RUNNING', 'SUCCEEDED', 'FAILED']
+
+def test_poll_publishes_only_changes():
+    queue = StubQueue({'a': 'RUNNING', 'b': 'RUNNING'})
+    index = JobIndex(queue.list_jobs, STATUSES)
+
+    assert index.poll() == 1
+    assert index.poll() == 1  # nothing changed, no new version
+    queue.set_status('a', 'SUCCEEDED')
+    del queue.jobs['b']
+    assert index.poll() == 2
+
+    [delta] = index.changes_since(1)
+    assert [job['jobId'] for job in delta['upserted']] == ['a']
+    assert delta['removed'] == ['b']
+    assert [entry['status'] for entry in delta['upserted'][0]['statusHistory']] == ['RUNNING', 'SUCCEEDED']
+    _, jobs = index.snapshot()
+    assert [job['status'] for job in jobs] == ['SUCCEEDED']
+
+def test_changes_since_requires_resync_when_history_is_gone():
+    queue = StubQueue({'a': 'RUNNING'})
+    index = JobIndex(queue.list_jobs, STATUSES, delta_history=2)
+    for status in ['RUNNING', 'FAILED', 'SUCCEEDED', 'FAILED']:
+        queue.set_status('a', status)
+        index.poll()
+
+    assert index.version == 4
+    assert [delta['version'] for delta in index.changes_since(2)] == [3, 4]
+    assert index.changes_since(1) is None
+    assert index.changes_since(4) == []
+    assert index.changes_since(9) is None  # version from before a restart
+
+def test_poll_interval_backs_off_while_idle():
+    queue = StubQueue({'a': 'RUNNING'})
+    index = JobIndex(queue.list_jobs, STATUSES, active_interval=1, idle_interval=8)
+
+    index.poll()
+    assert index.interval == 1
+    queue.set_status('a', 'SUCCEEDED')
+    index.poll()  # the transition itself counts as activity
+    assert index.interval == 1
+    intervals = []
+    for _ in range(5):
+        index.poll()
+        intervals.append(index.interval)
+    assert intervals == [2, 4, 8, 8, 8]
+
+    queue.jobs['b'] = {'jobId': 'b', 'jobName': 'b', 'status': 'RUNNING', 'createdAt': 2}
+    index.poll()
+    assert index.interval == 1
+
+def test_wait_for_change_wakes_on_new_version():
+    queue = StubQueue({'a': 'RUNNING'})
+    index = JobIndex(queue.list_jobs, STATUSES)
+    index.poll()
+
+    assert index.wait_for_change(1, timeout=0.01) == 1
+    timer = threading.Timer(0.05, lambda: (queue.set_status('a', 'SUCCEEDED'), index.poll()))
+    timer.start()
+    assert index.wait_for_change(1, timeout=5) == 2
+    timer.join()
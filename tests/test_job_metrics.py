@@ -0,0 +1,141 @@
+import pytest
+import os
+import sys
+from datetime import datetime, timezone
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+
+from job_metrics import MAX_METRIC_QUERIES_PER_CALL, MetricsCollector, RingSeries
+
+STARTED_AT = 1700000000
+
+class StubBatch:
+    def __init__(self, job_count, status='SUCCEEDED'):
+        self.status = status
+        self.jobs = {
+            f'job-{i}': {
+                'jobId': f'job-{i}',
+                'status': status,
+                'startedAt': STARTED_AT * 1000,
+                'stoppedAt': (STARTED_AT + 600) * 1000,
+                'container': {'taskArn': f'arn:aws:ecs:us-east-1:123:task/cluster/task{i}', 'vcpus': 2, 'memory': 4096}
+            }
+            for i in range(job_count)
+        }
+        self.describe_calls = []
+
+    def describe_jobs(self, jobs):
+        assert len(jobs) <= 100
+        self.describe_calls.append(list(jobs))
+        return {'jobs': [dict(self.jobs[job_id], status=self.status) for job_id in jobs]}
+
+class StubCloudWatch:
+    """Local stand-in for get_metric_data: ten one-minute samples per task, two pages per call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, ScanBy, NextToken=None):
+        assert len(MetricDataQueries) <= MAX_METRIC_QUERIES_PER_CALL
+        if NextToken is None:
+            self.calls.append(MetricDataQueries)
+        half = len(MetricDataQueries) // 2
+        queries = MetricDataQueries[half:] if NextToken else MetricDataQueries[:half]
+        results = []
+        for query in queries:
+            metric = query['MetricStat']['Metric']['MetricName']
+            # 1024 CPU units (half of 2 vCPUs) and 1024 MiB (a quarter of 4096 MiB)
+            value = 1024.0
+            timestamps = [datetime.fromtimestamp(STARTED_AT + 60 * i, tz=timezone.utc) for i in range(10)]
+            results.append({'Id': query['Id'], 'Timestamps': timestamps, 'Values': [value] * 10})
+        response = {'MetricDataResults': results}
+        if not NextToken:
+            response['NextToken'] = 'page-2'
+        return response
+
+def test_ring_series_downsamples_into_tiers():
+    series = RingSeries()
+    for second in range(0, 1200, 10):
+        series.add(STARTED_AT - STARTED_AT % 600 + second, float(second % 60))
+    series.add(STARTED_AT, 999.0)  # older than the newest sample; ignored
+
+    assert len(series.points('1m')) == 20
+    assert series.points('1m')[0][1] == pytest.approx(25.0)
+    assert len(series.points('10m')) == 2
+
+def test_collector_batches_api_calls():
+    batch = StubBatch(300)
+    cloudwatch = StubCloudWatch()
+    collector = MetricsCollector(batch, cloudwatch, 'queue', cluster_name='cluster')
+
+    collector.refresh([f'job-{i}' for i in range(300)])
+
+    assert [len(call) for call in batch.describe_calls] == [100, 100, 100]
+    # Two metrics per job, 250 jobs per call
+    assert [len(call) for call in cloudwatch.calls] == [500, 100]
+    metrics = collector.job_metrics('job-7', '1m')
+    assert metrics['duration_seconds'] == 600
+    assert [value for _, value in metrics['metrics']['cpu_utilization']] == [50.0] * 10
+    assert [value for _, value in metrics['metrics']['memory_utilization']] == [25.0] * 10
+    # The ten minutes of samples straddle a 10-minute boundary
+    assert [value for _, value in collector.job_metrics('job-7', '10m')['metrics']['cpu_utilization']] == [50.0, 50.0]
+
+    # Finished jobs are served from memory afterwards
+    collector.refresh([f'job-{i}' for i in range(300)])
+    assert len(batch.describe_calls) == 3
+    assert len(cloudwatch.calls) == 2
+
+def test_collector_requeries_running_jobs_after_interval():
+    batch = StubBatch(2, status='RUNNING')
+    cloudwatch = StubCloudWatch()
+    collector = MetricsCollector(batch, cloudwatch, 'queue', cluster_name='cluster', refresh_interval=0)
+
+    collector.refresh(['job-0', 'job-1'])
+    collector.refresh(['job-0', 'job-1'])
+
+    assert len(cloudwatch.calls) == 2
+    # Overlapping windows do not duplicate samples
+    assert len(collector.job_metrics('job-0', '1m')['metrics']['cpu_utilization']) == 10
+
+def test_collector_evicts_least_recently_used_finished_jobs():
+    batch = StubBatch(5)
+    collector = MetricsCollector(batch, StubCloudWatch(), 'queue', cluster_name='cluster', max_finished_jobs=3)
+
+    collector.refresh(['job-0', 'job-1', 'job-2'])
+    # Reading job-0 makes job-1 the least recently used
+    assert collector.job_metrics('job-0') is not None
+    collector.refresh(['job-3'])
+
+    assert collector.job_metrics('job-1') is None
+    assert all(collector.job_metrics(job_id) is not None for job_id in ('job-0', 'job-2', 'job-3'))
+
+def test_collector_calls_aws_outside_its_lock():
+    batch = StubBatch(2)
+    cloudwatch = StubCloudWatch()
+    collector = MetricsCollector(batch, cloudwatch, 'queue', cluster_name='cluster')
+    entered = threading.Event()
+    release = threading.Event()
+    describe_jobs = batch.describe_jobs
+
+    def slow_describe_jobs(jobs):
+        if jobs == ['job-0']:
+            entered.set()
+            release.wait(5)
+        return describe_jobs(jobs)
+
+    batch.describe_jobs = slow_describe_jobs
+    slow = threading.Thread(target=collector.refresh, args=(['job-0'],))
+    slow.start()
+    assert entered.wait(5)
+    # Another job is refreshed and served while the first call is still waiting on AWS
+    collector.refresh(['job-1'])
+    assert collector.job_metrics('job-1')['status'] == 'SUCCEEDED'
+    # A concurrent refresh of the job in flight does not call AWS again
+    collector.refresh(['job-0'])
+    assert batch.describe_calls == [['job-1']]
+    release.set()
+    slow.join()
+    assert collector.job_metrics('job-0')['status'] == 'SUCCEEDED'
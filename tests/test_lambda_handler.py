@@ -1,14 +1,18 @@
 import pytest
 import boto3
+import hashlib
 import os
 import json
 import sys
+import time
+from botocore.exceptions import ClientError
 from moto import mock_aws
 
 # Add the project root to the Python path to allow for absolute imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from lambda_function.handler import generate_samplesheet
+import lambda_function.handler as handler
+from lambda_function.handler import TagCache, generate_samplesheet, query_experiment_pages
 
 @pytest.fixture
 def aws_credentials():
@@ -109,3 +113,388 @@ def test_generate_samplesheet_not_found(mock_env_vars):
 
     assert response['statusCode'] == 404
     assert 'No samples found' in response['body']
+
+
+def _create_experiment(s3_client, dynamodb, experiment_id, sample_count):
+    """Creates the bucket and table and registers `sample_count` tagged samples."""
+    bucket_name = os.environ['S3_BUCKET']
+    s3_client.create_bucket(Bucket=bucket_name)
+    table = dynamodb.create_table(
+        TableName=os.environ['DYNAMODB_TABLE'],
+        KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    )
+    for i in range(sample_count):
+        sample_id = f'SAM{i:05d}'
+        s3_key = f'raw_data/{experiment_id}/{sample_id}.fastq.gz'
+        table.put_item(Item={
+            'experiment_id': experiment_id,
+            'sample_id': sample_id,
+            's3_object_key': s3_key,
+            'experimental_group': 'control',
+            'treatment': 'none'
+        })
+        s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body='dummy-content')
+        s3_client.put_object_tagging(
+            Bucket=bucket_name,
+            Key=s3_key,
+            Tagging={'TagSet': [{'Key': 'fastq_2', 'Value': f'raw_data/{experiment_id}/{sample_id}_R2.fastq.gz'}]}
+        )
+    return table
+
+
+@mock_aws
+def test_generate_samplesheet_tag_fetch_scales_flat(mock_env_vars, monkeypatch):
+    """Tag lookups run concurrently, so wall-clock time barely grows with sample count."""
+    monkeypatch.setenv('TAG_FETCH_CONCURRENCY', '64')
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    _create_experiment(s3_client, dynamodb, 'EXP_SMALL', 4)
+    table = dynamodb.Table(os.environ['DYNAMODB_TABLE'])
+    for i in range(60):
+        table.put_item(Item={
+            'experiment_id': 'EXP_LARGE',
+            'sample_id': f'SAM{i:05d}',
+            's3_object_key': 'raw_data/EXP_SMALL/SAM00000.fastq.gz'
+        })
+
+    # Simulate a realistic S3 round trip on every tag lookup
+    latency = 0.2
+    s3_client.meta.events.register(
+        'before-call.s3.GetObjectTagging', lambda **kwargs: time.sleep(latency)
+    )
+
+    def timed(experiment_id):
+        event = {'body': json.dumps({'experiment_id': experiment_id})}
+        start = time.perf_counter()
+        response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+        assert response['statusCode'] == 200
+        return time.perf_counter() - start, response
+
+    small_elapsed, _ = timed('EXP_SMALL')
+    large_elapsed, large_response = timed('EXP_LARGE')
+
+    assert len(large_response['body'].splitlines()) == 61
+    # 60 sequential lookups would take 12s; concurrently they take about one round trip
+    assert large_elapsed < 60 * latency / 5
+    assert large_elapsed < small_elapsed * 4
+
+
+@mock_aws
+def test_generate_samplesheet_retries_throttled_tag_lookups(mock_env_vars, monkeypatch):
+    """Throttled lookups are retried and rows keep the DynamoDB order."""
+    monkeypatch.setattr('lambda_function.handler.TAG_FETCH_BASE_DELAY', 0.001)
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    _create_experiment(s3_client, dynamodb, 'EXP001', 20)
+
+    failures = {}
+
+    def throttle_first_attempt(params, **kwargs):
+        if params['Key'] not in failures:
+            failures[params['Key']] = True
+            raise ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}}, 'GetObjectTagging')
+
+    s3_client.meta.events.register('provide-client-params.s3.GetObjectTagging', throttle_first_attempt)
+
+    event = {'body': json.dumps({'experiment_id': 'EXP001'})}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+
+    assert response['statusCode'] == 200
+    assert len(failures) == 20
+    samples = [line.split(',')[0] for line in response['body'].splitlines()[1:]]
+    assert samples == [f'SAM{i:05d}' for i in range(20)]
+
+
+@mock_aws
+def test_generate_samplesheet_spills_large_output_to_s3(mock_env_vars, monkeypatch):
+    """Samplesheets over the inline limit are streamed to S3 and returned as a URI."""
+    monkeypatch.setenv('SAMPLESHEET_INLINE_LIMIT', '200')
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    _create_experiment(s3_client, dynamodb, 'EXP001', 10)
+
+    event = {'body': json.dumps({'experiment_id': 'EXP001'})}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+
+    assert response['statusCode'] == 200
+    assert response['headers']['Content-Type'] == 'application/json'
+    samplesheet_uri = json.loads(response['body'])['samplesheet_uri']
+    assert json.loads(response['body'])['rows'] == 10
+
+    key = samplesheet_uri[len('s3://test-bucket/'):]
+    body = s3_client.get_object(Bucket='test-bucket', Key=key)['Body'].read()
+    lines = body.decode('utf-8').splitlines()
+    assert lines[0] == 'sample,fastq_1,fastq_2,experimental_group,treatment'
+    assert [line.split(',')[0] for line in lines[1:]] == [f'SAM{i:05d}' for i in range(10)]
+
+    # The spill is content-addressed, so a relaunch gets the same URI and no temporary object is left
+    assert key == f'samplesheets/sha256/{hashlib.sha256(body).hexdigest()}.csv'
+    second = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+    assert json.loads(second['body'])['samplesheet_uri'] == samplesheet_uri
+    assert s3_client.list_objects_v2(Bucket='test-bucket', Prefix='samplesheets/generated/')['KeyCount'] == 0
+
+
+def test_s3_client_pools_a_connection_per_tag_fetch_worker(mock_env_vars, monkeypatch):
+    monkeypatch.setenv('TAG_FETCH_CONCURRENCY', '24')
+    monkeypatch.setattr(handler, '_s3_client', None)
+
+    config = handler._get_s3_client().meta.config
+
+    assert config.max_pool_connections == 24
+    assert config.retries['mode'] == 'adaptive'
+
+@mock_aws
+def test_query_experiment_pages_follows_last_evaluated_key(mock_env_vars):
+    """Every page of a partition is returned, not just the first."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    table = _create_experiment(s3_client, dynamodb, 'EXP001', 7)
+
+    pages = list(query_experiment_pages(table, 'EXP001', page_size=3))
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [item['sample_id'] for page in pages for item in page] == [f'SAM{i:05d}' for i in range(7)]
+
+
+@mock_aws
+def test_generate_samplesheet_caches_tags_by_version(mock_env_vars):
+    """Warm invocations reuse cached tags until the item's updated_at changes."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    table = _create_experiment(s3_client, dynamodb, 'EXP001', 3)
+    for i in range(3):
+        table.update_item(
+            Key={'experiment_id': 'EXP001', 'sample_id': f'SAM{i:05d}'},
+            UpdateExpression='SET updated_at = :ts',
+            ExpressionAttributeValues={':ts': '2024-01-01T00:00:00+00:00'}
+        )
+    tag_cache = TagCache(max_size=100, ttl_seconds=60)
+    event = {'body': json.dumps({'experiment_id': 'EXP001'})}
+
+    first = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=tag_cache)
+    assert first['headers']['X-Tag-Cache-Hits'] == '0'
+    assert first['headers']['X-Tag-Cache-Misses'] == '3'
+
+    second = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=tag_cache)
+    assert second['headers']['X-Tag-Cache-Hits'] == '3'
+    assert second['body'] == first['body']
+
+    # Re-tag one sample and bump its updated_at; only that entry is refetched
+    s3_key = 'raw_data/EXP001/SAM00001.fastq.gz'
+    s3_client.put_object_tagging(
+        Bucket='test-bucket',
+        Key=s3_key,
+        Tagging={'TagSet': [{'Key': 'fastq_2', 'Value': 'raw_data/EXP001/SAM00001_R2_v2.fastq.gz'}]}
+    )
+    table.update_item(
+        Key={'experiment_id': 'EXP001', 'sample_id': 'SAM00001'},
+        UpdateExpression='SET updated_at = :ts',
+        ExpressionAttributeValues={':ts': '2024-02-01T00:00:00+00:00'}
+    )
+
+    third = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=tag_cache)
+    assert third['headers']['X-Tag-Cache-Hits'] == '2'
+    assert third['headers']['X-Tag-Cache-Misses'] == '1'
+    assert 'SAM00001_R2_v2.fastq.gz' in third['body']
+
+@mock_aws
+def test_generate_samplesheet_validates_metadata(mock_env_vars, monkeypatch):
+    """Items are checked against METADATA_SCHEMA; strict mode rejects invalid experiments."""
+    monkeypatch.setenv('METADATA_SCHEMA', 'experiment_contexts')
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    _create_experiment(s3_client, dynamodb, 'EXP001', 3)
+    event = {'body': json.dumps({'experiment_id': 'EXP001'})}
+
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+    assert response['statusCode'] == 200
+    # The test items carry no pi_name, project_id, ... which the schema requires
+    assert response['headers']['X-Metadata-Invalid-Records'] == '3'
+
+    monkeypatch.setenv('METADATA_VALIDATION', 'strict')
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+    assert response['statusCode'] == 422
+    validation = json.loads(response['body'])['validation']
+    assert validation['fields']['pi_name']['errors'] == {'missing required field': 3}
+
+
+def _capture_calls(dynamodb, operation):
+    """Records the parameters of every call to a DynamoDB operation."""
+    calls = []
+    dynamodb.meta.client.meta.events.register(
+        f'provide-client-params.dynamodb.{operation}', lambda params, **kwargs: calls.append(dict(params))
+    )
+    return calls
+
+
+def _add_cohort(s3_client, table, experiment_id):
+    """Adds treated and control samples with a wide context record and a tissue tag."""
+    for i, (group, treatment) in enumerate([('treated', 'drug_x'), ('control', 'none'), ('treated', 'drug_y'), ('treated', 'drug_x')]):
+        sample_id = f'S{i}'
+        s3_key = f'raw_data/{experiment_id}/{sample_id}.fastq.gz'
+        s3_client.put_object(Bucket=os.environ['S3_BUCKET'], Key=s3_key, Body='dummy-content')
+        s3_client.put_object_tagging(Bucket=os.environ['S3_BUCKET'], Key=s3_key, Tagging={'TagSet': [
+            {'Key': 'fastq_2', 'Value': s3_key.replace('.fastq.gz', '_R2.fastq.gz')},
+            {'Key': 'tissue', 'Value': 'liver'}
+        ]})
+        table.put_item(Item={
+            'experiment_id': experiment_id,
+            'sample_id': sample_id,
+            's3_object_key': s3_key,
+            'experimental_group': group,
+            'treatment': treatment,
+            'batch': f'B{i % 2}',
+            'notes': 'x' * 1000
+        })
+
+
+@mock_aws
+def test_generate_samplesheet_filters_and_projects_columns(mock_env_vars, monkeypatch):
+    """Filters become a FilterExpression and only the requested columns' attributes are read."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    s3_client.create_bucket(Bucket=os.environ['S3_BUCKET'])
+    table = dynamodb.create_table(
+        TableName=os.environ['DYNAMODB_TABLE'],
+        KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    )
+    _add_cohort(s3_client, table, 'EXP001')
+    monkeypatch.setattr(handler, '_table_indexes', {})
+    queries = _capture_calls(dynamodb, 'Query')
+
+    event = {'body': json.dumps({
+        'experiment_id': 'EXP001',
+        'filters': {'experimental_group': 'treated', 'treatment': ['drug_x', 'drug_y']},
+        'columns': ['sample', 'fastq_1', 'treatment', 'batch', 'tissue']
+    })}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=TagCache())
+
+    assert response['statusCode'] == 200
+    assert response['body'] == (
+        'sample,fastq_1,treatment,batch,tissue\r\n'
+        'S0,s3://test-bucket/raw_data/EXP001/S0.fastq.gz,drug_x,B0,liver\r\n'
+        'S2,s3://test-bucket/raw_data/EXP001/S2.fastq.gz,drug_y,B0,liver\r\n'
+        'S3,s3://test-bucket/raw_data/EXP001/S3.fastq.gz,drug_x,B1,liver\r\n'
+    )
+    assert 'IndexName' not in queries[0]
+    assert 'FilterExpression' in queries[0]
+    projected = set(queries[0]['ExpressionAttributeNames'][name] for name in queries[0]['ProjectionExpression'].split(', '))
+    assert 'notes' not in projected
+    assert {'treatment', 'batch', 'tissue', 's3_object_key'} <= projected
+
+    # Columns that never come from tags skip the tag lookups entirely
+    monkeypatch.setattr(handler, '_fetch_tags', lambda *args: pytest.fail('tags fetched'))
+    event = {'body': json.dumps({'experiment_id': 'EXP001', 'columns': ['sample', 'fastq_1', 'experimental_group']})}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=TagCache())
+    assert response['statusCode'] == 200
+    assert response['body'].splitlines()[:2] == ['sample,fastq_1,experimental_group', 'S0,s3://test-bucket/raw_data/EXP001/S0.fastq.gz,treated']
+
+
+@mock_aws
+def test_generate_samplesheet_queries_matching_secondary_index(mock_env_vars, monkeypatch):
+    """A filter on a local secondary index's sort key becomes the index's key condition."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    s3_client.create_bucket(Bucket=os.environ['S3_BUCKET'])
+    table = dynamodb.create_table(
+        TableName=os.environ['DYNAMODB_TABLE'],
+        KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'experiment_id', 'AttributeType': 'S'},
+            {'AttributeName': 'sample_id', 'AttributeType': 'S'},
+            {'AttributeName': 'experimental_group', 'AttributeType': 'S'}
+        ],
+        LocalSecondaryIndexes=[{
+            'IndexName': 'by-group',
+            'KeySchema': [{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'experimental_group', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    )
+    _add_cohort(s3_client, table, 'EXP001')
+    monkeypatch.setattr(handler, '_table_indexes', {})
+    queries = _capture_calls(dynamodb, 'Query')
+
+    event = {'body': json.dumps({'experiment_id': 'EXP001', 'filters': {'experimental_group': 'control'}})}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=TagCache())
+
+    assert response['statusCode'] == 200
+    assert response['body'].splitlines()[1:] == ['S1,s3://test-bucket/raw_data/EXP001/S1.fastq.gz,raw_data/EXP001/S1_R2.fastq.gz,control,none']
+    assert queries[0]['IndexName'] == 'by-group'
+    assert 'FilterExpression' not in queries[0]
+
+
+@mock_aws
+def test_generate_samplesheet_reads_sample_ids_by_key(mock_env_vars):
+    """A sample ID list is read with BatchGetItem, in request order, instead of querying the experiment."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    _create_experiment(s3_client, dynamodb, 'EXP001', 5)
+    queries = _capture_calls(dynamodb, 'Query')
+
+    event = {'body': json.dumps({'experiment_id': 'EXP001', 'sample_ids': ['SAM00003', 'SAM00001', 'SAM09999'], 'columns': ['sample', 'fastq_2']})}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=TagCache())
+
+    assert response['statusCode'] == 200
+    assert response['body'] == (
+        'sample,fastq_2\r\n'
+        'SAM00003,raw_data/EXP001/SAM00003_R2.fastq.gz\r\n'
+        'SAM00001,raw_data/EXP001/SAM00001_R2.fastq.gz\r\n'
+    )
+    assert queries == []
+
+
+@mock_aws
+def test_generate_samplesheet_accepts_float_filters(mock_env_vars):
+    """JSON floats are compared as DynamoDB numbers instead of failing serialization."""
+    from decimal import Decimal
+
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    table = _create_experiment(s3_client, dynamodb, 'EXP001', 3)
+    for i, concentration in enumerate([Decimal('0.5'), Decimal('2.5'), Decimal('0.5')]):
+        table.update_item(
+            Key={'experiment_id': 'EXP001', 'sample_id': f'SAM{i:05d}'},
+            UpdateExpression='SET concentration = :c',
+            ExpressionAttributeValues={':c': concentration}
+        )
+
+    for body in ({'filters': {'concentration': 0.5}},
+                 {'filters': {'concentration': [0.5]}, 'sample_ids': ['SAM00002', 'SAM00001', 'SAM00000']}):
+        event = {'body': json.dumps(dict(body, experiment_id='EXP001', columns=['sample']))}
+        response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=TagCache())
+        assert response['statusCode'] == 200
+        assert sorted(response['body'].splitlines()[1:]) == ['SAM00000', 'SAM00002']
+
+    event = {'body': '{"experiment_id": "EXP001", "filters": {"concentration": NaN}}'}
+    response = generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client, tag_cache=TagCache())
+    assert response['statusCode'] == 400
+
+
+def test_generate_samplesheet_rejects_invalid_columns(mock_env_vars):
+    event = {'body': json.dumps({'experiment_id': 'EXP001', 'columns': ['sample', 'sample']})}
+    response = generate_samplesheet(event, {}, dynamodb=object(), s3_client=object())
+    assert response['statusCode'] == 400
+
+
+def test_handler_imports_from_lambda_package_alone(tmp_path):
+    """A package built from lambda_function/ alone has no repo-root modules such as tracing."""
+    import shutil
+    import subprocess
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    shutil.copytree(os.path.join(project_root, 'lambda_function'), tmp_path / 'lambda_function',
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+    env.pop('DYNAMODB_TABLE', None)
+    script = (
+        'import json, lambda_function.handler as h\n'
+        'r = h.generate_samplesheet({"body": json.dumps({"experiment_id": "EXP1"})}, None, dynamodb=object(), s3_client=object())\n'
+        'print(r["statusCode"])\n'
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == '500'
@@ -0,0 +1,246 @@
+import pytest
+import argparse
+import boto3
+import os
+import io
+import json
+import subprocess
+import sys
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import launcher as launcher_module
+from botocore.exceptions import ClientError
+from launcher import NextflowLauncher, load_manifest, parse_size, watch_exit_code
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+@pytest.fixture
+def launcher(aws_credentials, mocker):
+    """A launcher with moto-backed S3 and stubbed Lambda and Batch clients."""
+    with mock_aws():
+        launcher = NextflowLauncher()
+        launcher.s3_client.create_bucket(Bucket='test-bucket')
+
+        def invoke(FunctionName, InvocationType, Payload):
+            experiment_id = json.loads(json.loads(Payload)['body'])['experiment_id']
+            body = f'sample,fastq_1\r\n{experiment_id}_S1,s3://test-bucket/{experiment_id}.fastq.gz\r\n'
+            payload = {'statusCode': 200, 'headers': {'Content-Type': 'text/csv'}, 'body': body}
+            return {'Payload': io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+        launcher.lambda_client = mocker.Mock()
+        launcher.lambda_client.invoke.side_effect = invoke
+        launcher.batch_client = mocker.Mock()
+        launcher.batch_client.submit_job.side_effect = lambda **kwargs: {'jobId': f"id-{kwargs['jobName']}"}
+        yield launcher
+
+@pytest.fixture
+def params_file(tmp_path):
+    path = tmp_path / 'params.json'
+    path.write_text(json.dumps({'outdir': 's3://test-bucket/results'}))
+    return str(path)
+
+def _read_text(s3_client, uri):
+    key = uri[len('s3://test-bucket/'):]
+    return s3_client.get_object(Bucket='test-bucket', Key=key)['Body'].read().decode('utf-8')
+
+def _read_json(s3_client, uri):
+    return json.loads(_read_text(s3_client, uri))
+
+def test_load_manifest_mixes_experiment_ids_and_params_files(tmp_path):
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text('# cohort A\nEXP001\n\nruns/EXP002.json\n')
+
+    assert load_manifest(str(manifest)) == [{'experiment_id': 'EXP001'}, {'params': 'runs/EXP002.json'}]
+
+def test_submit_manifest_concurrent(launcher, params_file):
+    """Each entry gets its own samplesheet and job, reported in manifest order."""
+    entries = [{'experiment_id': f'EXP{i:03d}'} for i in range(12)]
+
+    summary = launcher.submit_manifest(
+        entries, 'nf-core/rnaseq', 'test-bucket', 'queue', 'nextflow-runner',
+        lambda_function_name='samplesheet-fn', default_params_file=params_file,
+        job_name='bulk', submit_rate=1000
+    )
+
+    assert summary['mode'] == 'concurrent'
+    assert [job['job_id'] for job in summary['jobs']] == [f'id-bulk-{i}' for i in range(12)]
+    assert launcher.batch_client.submit_job.call_count == 12
+    for i, job in enumerate(summary['jobs']):
+        params = _read_json(launcher.s3_client, job['params'])
+        assert params['outdir'] == 's3://test-bucket/results'
+        assert params['input'].startswith('s3://test-bucket/samplesheets/sha256/')
+        assert f'EXP{i:03d}_S1' in _read_text(launcher.s3_client, params['input'])
+
+def test_submit_manifest_array_job(launcher, params_file):
+    """Array mode submits once and writes params under the array index."""
+    entries = [{'experiment_id': 'EXP001'}, {'experiment_id': 'EXP002'}, {'params': params_file}]
+
+    summary = launcher.submit_manifest(
+        entries, 'nf-core/rnaseq', 'test-bucket', 'queue', 'nextflow-runner',
+        lambda_function_name='samplesheet-fn', default_params_file=params_file,
+        job_name='bulk', array=True
+    )
+
+    assert summary['array_job_id'] == 'id-bulk'
+    assert [job['job_id'] for job in summary['jobs']] == ['id-bulk:0', 'id-bulk:1', 'id-bulk:2']
+    launcher.batch_client.submit_job.assert_called_once()
+    call = launcher.batch_client.submit_job.call_args.kwargs
+    assert call['arrayProperties'] == {'size': 3}
+    assert call['parameters']['params'] == 's3://test-bucket/params/bulk'
+    assert 'EXP002_S1' in _read_text(launcher.s3_client, _read_json(launcher.s3_client, 's3://test-bucket/params/bulk/1.json')['input'])
+    assert 'input' not in _read_json(launcher.s3_client, 's3://test-bucket/params/bulk/2.json')
+
+def test_submit_manifest_collects_entry_errors(launcher):
+    """An entry without params is reported instead of stopping the batch."""
+    summary = launcher.submit_manifest(
+        [{'experiment_id': 'EXP001'}], 'nf-core/rnaseq', 'test-bucket', 'queue', 'nextflow-runner',
+        lambda_function_name='samplesheet-fn', job_name='bulk'
+    )
+
+    assert 'No params file' in summary['jobs'][0]['error']
+    launcher.batch_client.submit_job.assert_not_called()
+
+def test_submit_workflow_reuses_content_addressed_inputs(launcher, params_file, mocker):
+    """Relaunching identical inputs references the same URIs without re-uploading."""
+    first_id = launcher.submit_workflow('nf-core/rnaseq', params_file, 'test-bucket', 'queue', 'nextflow-runner',
+                                        experiment_id='EXP001', lambda_function_name='samplesheet-fn', job_name='run-1')
+    first_params = launcher.batch_client.submit_job.call_args.kwargs['parameters']['params']
+
+    # A fresh launcher has no local index, so the HEAD check must find the objects
+    relauncher = NextflowLauncher()
+    relauncher.lambda_client = launcher.lambda_client
+    relauncher.batch_client = launcher.batch_client
+    put_object = mocker.spy(relauncher.s3_client, 'put_object')
+    second_id = relauncher.submit_workflow('nf-core/rnaseq', params_file, 'test-bucket', 'queue', 'nextflow-runner',
+                                           experiment_id='EXP001', lambda_function_name='samplesheet-fn', job_name='run-2')
+    second_params = launcher.batch_client.submit_job.call_args.kwargs['parameters']['params']
+
+    assert first_id != second_id
+    assert first_params == second_params
+    assert first_params.startswith('s3://test-bucket/params/sha256/')
+    put_object.assert_not_called()
+
+def test_submit_workflow_auto_size(launcher, params_file):
+    """--size auto sizes the head job from the samplesheet row count."""
+    launcher.submit_workflow('nf-core/rnaseq', params_file, 'test-bucket', 'queue', 'nextflow-runner',
+                             experiment_id='EXP001', lambda_function_name='samplesheet-fn', size='auto')
+    overrides = launcher.batch_client.submit_job.call_args.kwargs['containerOverrides']
+    assert (overrides['vcpus'], overrides['memory']) == (1, 768)
+
+    launcher.submit_workflow('nf-core/rnaseq', params_file, 'test-bucket', 'queue', 'nextflow-runner', size='4x8192')
+    overrides = launcher.batch_client.submit_job.call_args.kwargs['containerOverrides']
+    assert (overrides['vcpus'], overrides['memory']) == (4, 8192)
+
+
+@pytest.mark.parametrize('value', ['4', '4x', 'fourx8g', '0x1024', '4x8192x2'])
+def test_parse_size_rejects_malformed_sizes(value):
+    with pytest.raises(argparse.ArgumentTypeError, match="expected 'auto' or '<vcpus>x<memory MiB>'"):
+        parse_size(value)
+
+def test_malformed_size_is_rejected_before_anything_is_uploaded():
+    launcher_path = os.path.join(os.path.dirname(__file__), '..', 'launcher.py')
+    result = subprocess.run(
+        [sys.executable, launcher_path, '--workflow', 'nf-core/rnaseq', '--params', 'missing.json',
+         '--bucket', 'test-bucket', '--queue', 'queue', '--size', '4x'],
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 2
+    assert "argument --size: invalid head-job size '4x'" in result.stderr
+
+
+def _events(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_watch_jobs_batches_describe_calls_and_streams_changes(launcher, monkeypatch):
+    job_ids = [f'job-{i}' for i in range(250)]
+    rounds = [
+        {job_id: 'RUNNING' for job_id in job_ids},
+        {job_id: 'RUNNING' for job_id in job_ids},
+        {job_id: 'SUCCEEDED' if i < 200 else 'RUNNING' for i, job_id in enumerate(job_ids)},
+        {job_id: 'SUCCEEDED' for job_id in job_ids},
+    ]
+    calls = []
+    sleeps = []
+
+    def describe_jobs(jobs):
+        calls.append(list(jobs))
+        return {'jobs': [{'jobId': job_id, 'jobName': job_id, 'status': rounds[0][job_id]} for job_id in jobs]}
+
+    launcher.batch_client.describe_jobs.side_effect = describe_jobs
+    monkeypatch.setattr(launcher_module.time, 'sleep', lambda seconds: (sleeps.append(seconds), rounds.pop(0)))
+    output = io.StringIO()
+
+    statuses = launcher.watch_jobs(job_ids, output=output, min_interval=1, max_interval=30)
+
+    assert set(statuses.values()) == {'SUCCEEDED'}
+    # Every poll covers the unfinished jobs in calls of at most 100 IDs
+    assert [len(call) for call in calls] == [100, 100, 50, 100, 100, 50, 100, 100, 50, 50]
+    events = _events(output)
+    assert sum(1 for event in events if event['event'] == 'status' and event['status'] == 'RUNNING') == 250
+    assert sum(1 for event in events if event['event'] == 'status' and event['status'] == 'SUCCEEDED') == 250
+    assert events[-1] == {'event': 'summary', 'jobs': 250, 'statuses': {'SUCCEEDED': 250}, 'exit_code': 0}
+    # Quiet polls back off; polls that saw changes reset to the minimum
+    assert sleeps == [1, 2, 1]
+
+
+def test_watch_jobs_backs_off_when_throttled_and_reports_failures(launcher, monkeypatch):
+    script = [
+        None,
+        {'a': 'STARTING', 'b': 'RUNNING'},
+        {'a': 'STARTING', 'b': 'RUNNING'},
+        {'a': 'STARTING', 'b': 'RUNNING'},
+        {'a': 'STARTING', 'b': 'RUNNING'},
+        {'a': 'FAILED', 'b': 'RUNNING'},
+        {'b': 'SUCCEEDED'},
+    ]
+    sleeps = []
+
+    def describe_jobs(jobs):
+        statuses = script[0]
+        if statuses is None:
+            raise ClientError({'Error': {'Code': 'TooManyRequestsException'}}, 'DescribeJobs')
+        return {'jobs': [
+            {'jobId': job_id, 'jobName': job_id, 'status': statuses[job_id], 'statusReason': 'Essential container exited'}
+            for job_id in jobs if job_id in statuses
+        ]}
+
+    launcher.batch_client.describe_jobs.side_effect = describe_jobs
+    monkeypatch.setattr(launcher_module.time, 'sleep', lambda seconds: (sleeps.append(seconds), script.pop(0)))
+    output = io.StringIO()
+
+    statuses = launcher.watch_jobs(['a', 'b', 'missing'], output=output, min_interval=2, max_interval=60)
+
+    assert statuses == {'a': 'FAILED', 'b': 'SUCCEEDED', 'missing': 'NOT_FOUND'}
+    assert watch_exit_code(statuses) == 1
+    # Throttling doubles the interval; a STARTING job caps the back-off at 8 seconds
+    assert sleeps == [4, 2, 4, 8, 8, 2]
+    events = _events(output)
+    failed = next(event for event in events if event.get('status') == 'FAILED')
+    assert failed['previous'] == 'STARTING'
+    assert failed['reason'] == 'Essential container exited'
+    assert events[-1]['exit_code'] == 1
+
+
+def test_watch_jobs_stops_at_timeout(launcher, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(launcher_module.time, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(launcher_module.time, 'sleep', lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+    launcher.batch_client.describe_jobs.side_effect = lambda jobs: {'jobs': [{'jobId': 'a', 'status': 'RUNNABLE'}]}
+    output = io.StringIO()
+
+    statuses = launcher.watch_jobs(['a'], output=output, min_interval=2, max_interval=60, timeout=10)
+
+    assert statuses == {'a': 'RUNNABLE'}
+    assert watch_exit_code(statuses) == 3
+    assert clock[0] == 10
@@ -0,0 +1,341 @@
+import pytest
+import boto3
+import os
+import json
+import sys
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import lambda_function.handler as handler
+import metadata_catalog
+from metadata_catalog import CatalogSync, MetadataCatalog
+
+BUCKET = 'test-bucket'
+TABLE = 'test-table'
+
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+class CountingS3:
+    """Wraps an S3 client and counts get_object_tagging calls."""
+
+    def __init__(self, client):
+        self.client = client
+        self.tag_calls = 0
+
+    def get_object_tagging(self, **kwargs):
+        self.tag_calls += 1
+        return self.client.get_object_tagging(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class EmptyPagesFirst:
+    """Wraps a DynamoDB Streams client so each shard iterator first returns empty pages."""
+
+    def __init__(self, client, empty_pages):
+        self.client = client
+        self.empty_pages = empty_pages
+        self.get_records_calls = 0
+
+    def get_records(self, ShardIterator):
+        self.get_records_calls += 1
+        if not ShardIterator.startswith('empty:'):
+            ShardIterator = f'empty:{self.empty_pages}:{ShardIterator}'
+        _, remaining, iterator = ShardIterator.split(':', 2)
+        if int(remaining):
+            return {'Records': [], 'NextShardIterator': f'empty:{int(remaining) - 1}:{iterator}'}
+        return self.client.get_records(ShardIterator=iterator)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _setup(stream=True):
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    s3_client.create_bucket(Bucket=BUCKET)
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    table_kwargs = {}
+    if stream:
+        table_kwargs['StreamSpecification'] = {'StreamEnabled': True, 'StreamViewType': 'NEW_IMAGE'}
+    table = dynamodb.create_table(
+        TableName=TABLE,
+        KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        **table_kwargs
+    )
+    return s3_client, dynamodb, table
+
+
+def _put_sample(s3_client, table, experiment_id, sample_id, tissue, treatment, version='v1'):
+    key = f'raw_data/{experiment_id}/{sample_id}.fastq.gz'
+    s3_client.put_object(Bucket=BUCKET, Key=key, Body='dummy-content')
+    s3_client.put_object_tagging(Bucket=BUCKET, Key=key, Tagging={'TagSet': [
+        {'Key': 'tissue', 'Value': tissue},
+        {'Key': 'fastq_2', 'Value': key.replace('.fastq.gz', '_R2.fastq.gz')}
+    ]})
+    table.put_item(Item={
+        'experiment_id': experiment_id,
+        'sample_id': sample_id,
+        's3_object_key': key,
+        'experimental_group': 'treated' if treatment != 'none' else 'control',
+        'treatment': treatment,
+        'replicate': 1,
+        **({'updated_at': version} if version else {})
+    })
+
+
+def _sample_ids(rows):
+    return [(item['experiment_id'], item['sample_id']) for item, _ in rows]
+
+
+@mock_aws
+def test_sync_reads_only_stream_changes_after_full_sync(aws_credentials):
+    s3_client, dynamodb, table = _setup()
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP1', 'S2', 'brain', 'drug_x')
+    _put_sample(s3_client, table, 'EXP2', 'S1', 'liver', 'none')
+
+    s3 = CountingS3(s3_client)
+    catalog = MetadataCatalog(':memory:')
+    syncer = CatalogSync(catalog, table, BUCKET, s3, boto3.client('dynamodbstreams', region_name='us-east-1'), scan_segments=2)
+
+    stats = syncer.sync()
+    assert stats['mode'] == 'full'
+    assert len(catalog) == 3
+    assert s3.tag_calls == 3
+
+    # Writes just before the scan are replayed from the stream, but their
+    # versions are unchanged so the catalogued tags are reused
+    stats = syncer.sync()
+    assert stats['mode'] == 'stream'
+    assert stats['upserted'] == 3
+    assert s3.tag_calls == 3
+
+    _put_sample(s3_client, table, 'EXP3', 'S9', 'liver', 'drug_x')
+    table.update_item(
+        Key={'experiment_id': 'EXP1', 'sample_id': 'S2'},
+        UpdateExpression='SET treatment = :t',
+        ExpressionAttributeValues={':t': 'drug_y'}
+    )
+    table.delete_item(Key={'experiment_id': 'EXP2', 'sample_id': 'S1'})
+    s3.tag_calls = 0
+
+    stats = syncer.sync()
+    assert stats['mode'] == 'stream'
+    assert (stats['upserted'], stats['removed']) == (2, 1)
+    assert len(catalog) == 3
+    assert catalog.query({'treatment': 'drug_y'})[0][0]['sample_id'] == 'S2'
+    assert ('EXP2', 'S1') not in catalog.keys()
+    # The updated sample kept its version, so only the new sample's tags are fetched
+    assert s3.tag_calls == 1
+
+
+@mock_aws
+def test_query_filters_across_experiments(aws_credentials):
+    s3_client, dynamodb, table = _setup(stream=False)
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP1', 'S2', 'brain', 'drug_x')
+    _put_sample(s3_client, table, 'EXP2', 'S1', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP2', 'S2', 'liver', 'none')
+
+    catalog = MetadataCatalog(':memory:')
+    stats = CatalogSync(catalog, table, BUCKET, s3_client).sync()
+    assert stats['mode'] == 'full'
+
+    # Tags and item attributes are both filterable
+    assert _sample_ids(catalog.query({'tissue': 'liver', 'treatment': 'drug_x'})) == [('EXP1', 'S1'), ('EXP2', 'S1')]
+    assert _sample_ids(catalog.query({'tissue': ['liver', 'brain'], 'treatment': 'drug_x'}, experiment_id='EXP1')) == [
+        ('EXP1', 'S1'), ('EXP1', 'S2')
+    ]
+    assert _sample_ids(catalog.query({'replicate': 1, 'treatment': 'none'})) == [('EXP2', 'S2')]
+    item, tags = catalog.query({'experiment_id': 'EXP2', 'sample_id': 'S2'})[0]
+    assert item['replicate'] == 1
+    assert tags['tissue'] == 'liver'
+
+
+@mock_aws
+def test_query_pages_are_read_one_page_at_a_time(aws_credentials):
+    s3_client, dynamodb, table = _setup(stream=False)
+    for experiment_id in ('EXP1', 'EXP2'):
+        for n in range(3):
+            _put_sample(s3_client, table, experiment_id, f'S{n}', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP3', 'S0', 'brain', 'drug_x')
+    catalog = MetadataCatalog(':memory:')
+    CatalogSync(catalog, table, BUCKET, s3_client).sync()
+
+    pages = list(catalog.query_pages({'tissue': 'liver'}, page_size=4))
+
+    assert [len(page) for page in pages] == [4, 2]
+    assert _sample_ids(pages[0] + pages[1]) == [
+        ('EXP1', 'S0'), ('EXP1', 'S1'), ('EXP1', 'S2'), ('EXP2', 'S0'), ('EXP2', 'S1'), ('EXP2', 'S2')
+    ]
+    assert list(catalog.query_pages({'tissue': 'heart'})) == []
+
+
+@mock_aws
+def test_stream_sync_reads_past_empty_pages_of_an_open_shard(aws_credentials):
+    s3_client, dynamodb, table = _setup()
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    catalog = MetadataCatalog(':memory:')
+    streams_client = boto3.client('dynamodbstreams', region_name='us-east-1')
+    CatalogSync(catalog, table, BUCKET, s3_client, streams_client).sync()
+
+    _put_sample(s3_client, table, 'EXP2', 'S1', 'liver', 'drug_x')
+    streams = EmptyPagesFirst(streams_client, empty_pages=2)
+    stats = CatalogSync(catalog, table, BUCKET, s3_client, streams).sync()
+
+    assert stats['mode'] == 'stream'
+    assert ('EXP2', 'S1') in catalog.keys()
+
+    # Reading stops after a bounded number of empty pages
+    streams = EmptyPagesFirst(streams_client, empty_pages=100)
+    CatalogSync(catalog, table, BUCKET, s3_client, streams).sync()
+    assert streams.get_records_calls == metadata_catalog.STREAM_MAX_EMPTY_POLLS
+
+
+@mock_aws
+def test_unchanged_samples_without_a_version_are_not_refetched(aws_credentials):
+    s3_client, dynamodb, table = _setup()
+    for n in range(5):
+        _put_sample(s3_client, table, 'EXP1', f'S{n}', 'liver', 'drug_x', version=None)
+    s3 = CountingS3(s3_client)
+    catalog = MetadataCatalog(':memory:')
+    syncer = CatalogSync(catalog, table, BUCKET, s3, boto3.client('dynamodbstreams', region_name='us-east-1'))
+
+    assert syncer.sync()['tags_fetched'] == 5
+    assert catalog.pending_tags() == []
+    for full in (False, False, True):
+        assert syncer.sync(full=full)['tags_fetched'] == 0
+    assert s3.tag_calls == 5
+
+
+@mock_aws
+def test_failed_tag_fetches_are_retried_on_the_next_sync(aws_credentials):
+    s3_client, dynamodb, table = _setup(stream=False)
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    catalog = MetadataCatalog(':memory:')
+    failing = CountingS3(s3_client)
+    failing.get_object_tagging = lambda **kwargs: (_ for _ in ()).throw(RuntimeError('unavailable'))
+
+    # Fetched during the scan and retried once at the end of the same sync
+    assert CatalogSync(catalog, table, BUCKET, failing).sync()['tag_errors'] == 2
+    assert [item['sample_id'] for item in catalog.pending_tags()] == ['S1']
+
+    s3 = CountingS3(s3_client)
+    CatalogSync(catalog, table, BUCKET, s3).sync()
+    assert s3.tag_calls == 1
+    assert catalog.pending_tags() == []
+    assert catalog.query({'tissue': 'liver'})[0][1]['tissue'] == 'liver'
+
+
+@mock_aws
+def test_full_sync_removes_deleted_samples_and_skips_unchanged_tags(aws_credentials):
+    s3_client, dynamodb, table = _setup(stream=False)
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP1', 'S2', 'brain', 'drug_x')
+    s3 = CountingS3(s3_client)
+    catalog = MetadataCatalog(':memory:')
+    syncer = CatalogSync(catalog, table, BUCKET, s3)
+    syncer.sync()
+
+    table.delete_item(Key={'experiment_id': 'EXP1', 'sample_id': 'S1'})
+    _put_sample(s3_client, table, 'EXP1', 'S2', 'heart', 'drug_x', version='v2')
+    s3.tag_calls = 0
+    stats = syncer.sync()
+
+    assert stats['removed'] == 1
+    assert s3.tag_calls == 1
+    assert _sample_ids(catalog.query({'tissue': 'heart'})) == [('EXP1', 'S2')]
+
+
+@mock_aws
+def test_trimmed_stream_cursor_falls_back_to_full_sync(aws_credentials):
+    s3_client, dynamodb, table = _setup()
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    catalog = MetadataCatalog(':memory:')
+    syncer = CatalogSync(catalog, table, BUCKET, s3_client, boto3.client('dynamodbstreams', region_name='us-east-1'))
+    syncer.sync()
+
+    cursor = catalog.get_state('cursor')
+    cursor['shards'] = {'shardId-trimmed': '100'}
+    catalog.set_state('cursor', cursor)
+
+    assert syncer.sync()['mode'] == 'full'
+    assert len(catalog) == 1
+
+
+@mock_aws
+def test_handler_serves_filtered_samplesheet_from_catalog(aws_credentials, tmp_path, monkeypatch):
+    s3_client, dynamodb, table = _setup(stream=False)
+    _put_sample(s3_client, table, 'EXP1', 'S1', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP2', 'S1', 'liver', 'drug_x')
+    _put_sample(s3_client, table, 'EXP2', 'S2', 'brain', 'drug_x')
+    path = str(tmp_path / 'catalog.db')
+    catalog = MetadataCatalog(path)
+    CatalogSync(catalog, table, BUCKET, s3_client).sync()
+    catalog.close()
+
+    monkeypatch.setenv('DYNAMODB_TABLE', TABLE)
+    monkeypatch.setenv('S3_BUCKET', BUCKET)
+    monkeypatch.setenv('SAMPLESHEET_BACKEND', 'catalog')
+    monkeypatch.setenv('CATALOG_PATH', path)
+    monkeypatch.setattr(handler, '_catalog', None)
+    tagging_calls = []
+    monkeypatch.setattr(handler, '_fetch_tags', lambda *args: tagging_calls.append(args))
+
+    event = {'body': json.dumps({'filters': {'tissue': 'liver', 'treatment': 'drug_x'}})}
+    response = handler.generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+
+    assert response['statusCode'] == 200
+    assert response['body'] == (
+        'sample,fastq_1,fastq_2,experimental_group,treatment\r\n'
+        'S1,s3://test-bucket/raw_data/EXP1/S1.fastq.gz,raw_data/EXP1/S1_R2.fastq.gz,treated,drug_x\r\n'
+        'S1,s3://test-bucket/raw_data/EXP2/S1.fastq.gz,raw_data/EXP2/S1_R2.fastq.gz,treated,drug_x\r\n'
+    )
+    assert tagging_calls == []
+
+    # Listed samples come back in request order, as from the DynamoDB backend
+    event = {'body': json.dumps({'experiment_id': 'EXP2', 'sample_ids': ['S2', 'S1'], 'columns': ['sample']})}
+    response = handler.generate_samplesheet(event, {}, dynamodb=dynamodb, s3_client=s3_client)
+    assert response['body'] == 'sample\r\nS2\r\nS1\r\n'
+    handler._catalog.close()
+
+
+def test_filters_require_catalog_backend(aws_credentials, monkeypatch):
+    monkeypatch.delenv('SAMPLESHEET_BACKEND', raising=False)
+    event = {'body': json.dumps({'filters': {'tissue': 'liver'}})}
+    response = handler.generate_samplesheet(event, {}, dynamodb=object(), s3_client=object())
+    assert response['statusCode'] == 400
+
+
+def test_catalogs_without_tags_pending_are_migrated(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(metadata_catalog.SCHEMA.replace("    tags_pending INTEGER NOT NULL DEFAULT 0,\n", ''))
+    conn.executemany('INSERT INTO samples (experiment_id, sample_id, s3_object_key, version, item, synced_at) VALUES (?, ?, ?, ?, ?, 0)', [
+        ('EXP1', 'S1', 'raw_data/S1.fastq.gz', None, json.dumps({'experiment_id': 'EXP1', 'sample_id': 'S1'})),
+        ('EXP1', 'S2', 'raw_data/S2.fastq.gz', 'v1', json.dumps({'experiment_id': 'EXP1', 'sample_id': 'S2'})),
+    ])
+    conn.commit()
+    conn.close()
+
+    catalog = MetadataCatalog(path)
+
+    # Rows whose fetch failed under the old format are retried once
+    assert [item['sample_id'] for item in catalog.pending_tags()] == ['S1']
+    assert catalog.versions([('EXP1', 'S2')])[('EXP1', 'S2')] == ('v1', {}, False)
@@ -0,0 +1,86 @@
+import pytest
+import gzip
+import json
+import os
+import sys
+from decimal import Decimal
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metadata_validation import Validator, get_validator, infer_fields, iter_dynamodb_export, iter_jsonl, load_schemas
+
+def test_schemas_derive_types_formats_and_required_fields():
+    schemas = load_schemas()
+
+    assert set(schemas) == {'sample', 'library', 'sequencing', 'experiment_contexts', 'audit_log'}
+    assert schemas['sample']['uuid'] == {'type': 'string', 'format': 'uuid', 'required': True}
+    assert schemas['sequencing']['read_length']['type'] == 'integer'
+    assert schemas['audit_log']['experiments_used_in']['items']['fields']['date']['format'] == 'date'
+    # Present in only one of the two examples
+    assert schemas['experiment_contexts']['paired_sample']['required'] is False
+
+def test_validator_reports_field_errors():
+    validator = get_validator('library')
+    assert get_validator('library') is validator
+    record = {
+        'library_id': 'LIB_1', 'prep_date': '2024-01-20', 'prep_kit': 'kit', 'fragmentation_method': 'chemical',
+        'size_selection': '200-300bp', 'pcr_cycles': Decimal('12'), 'index_i7': 'ATCACG', 'index_i5': 'TTAGGC',
+        'strandedness': 'reverse', 'input_amount_ng': 500, 'extra_field': 'allowed'
+    }
+    assert validator.errors(record) == []
+
+    record.update(prep_date='20/01/2024', pcr_cycles=True, input_amount_ng=Decimal('1.5'))
+    del record['prep_kit']
+    assert sorted(validator.errors(record)) == [
+        ('input_amount_ng', 'expected integer'),
+        ('pcr_cycles', 'expected integer'),
+        ('prep_date', 'expected date format'),
+        ('prep_kit', 'missing required field'),
+    ]
+    with pytest.raises(ValueError):
+        get_validator('unknown')
+
+def test_coerce_converts_numeric_strings_from_csv_rows():
+    validator = Validator('reading', infer_fields([{'lane': 1, 'yield_gb': 1.5, 'run_id': '001'}]))
+    row = {'lane': ' 2', 'yield_gb': '1e2', 'run_id': '002', 'extra': '3'}
+
+    coerced = validator.coerce(row)
+
+    assert coerced == {'lane': 2, 'yield_gb': Decimal('100'), 'run_id': '002', 'extra': '3'}
+    assert validator.errors(coerced) == []
+    assert row['lane'] == ' 2'
+    assert validator.errors(validator.coerce({'lane': '2.5', 'yield_gb': 'lots', 'run_id': '003'})) == [
+        ('lane', 'expected integer'),
+        ('yield_gb', 'expected number'),
+    ]
+
+def test_validate_many_streams_and_samples_examples(tmp_path):
+    path = tmp_path / 'runs.jsonl.gz'
+    with gzip.open(path, 'wt') as f:
+        for i in range(1000):
+            record = {'run_id': f'RUN{i}', 'platform': 'NovaSeq', 'read_type': 'paired-end', 'read_length': 150,
+                      'flow_cell_id': 'FC', 'lane': i % 4 + 1, 'read_number': 'R1', 'sequencing_date': '2024-01-21'}
+            if i % 10 == 0:
+                record['lane'] = 'one'
+            f.write(json.dumps(record) + '\n')
+
+    report = get_validator('sequencing').validate_many(iter_jsonl(str(path)), examples_per_field=3)
+
+    result = report.to_dict()
+    assert (result['total'], result['invalid']) == (1000, 100)
+    assert result['fields']['lane']['errors'] == {'expected integer': 100}
+    examples = result['fields']['lane']['examples']
+    assert len(examples) == 3
+    assert all(example['index'] % 10 == 0 and example['record']['lane'] == 'one' for example in examples)
+
+def test_dynamodb_export_records_are_deserialized(tmp_path):
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps({'Item': {
+        'run_id': {'S': 'RUN1'}, 'platform': {'S': 'NovaSeq'}, 'read_type': {'S': 'paired-end'},
+        'read_length': {'N': '150'}, 'flow_cell_id': {'S': 'FC'}, 'lane': {'N': '1'},
+        'read_number': {'S': 'R1'}, 'sequencing_date': {'S': '2024-01-21'}
+    }}) + '\n')
+
+    report = get_validator('sequencing').validate_many(iter_dynamodb_export(str(path)))
+    assert report.valid
@@ -0,0 +1,274 @@
+import pytest
+import json
+import os
+import sys
+import threading
+import time
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import monitor
+from job_index import JobIndex
+from job_metrics import MetricsCollector
+import tracing
+
+class StubBatch:
+    """Minimal stand-in for the Batch API with nextToken paging and per-call latency."""
+
+    def __init__(self, jobs_per_status, page_size=100, latency=0.0):
+        self.jobs = {
+            status: [
+                {'jobId': f'{status}-{i}', 'jobName': f'job-{i}', 'status': status, 'createdAt': i * 10 + index}
+                for i in range(count)
+            ]
+            for index, (status, count) in enumerate(jobs_per_status.items())
+        }
+        self.page_size = page_size
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def list_jobs(self, jobQueue, jobStatus, maxResults=100, nextToken=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        start = int(nextToken or 0)
+        jobs = self.jobs.get(jobStatus, [])
+        page = jobs[start:start + min(maxResults, self.page_size)]
+        response = {'jobSummaryList': page}
+        if start + len(page) < len(jobs):
+            response['nextToken'] = str(start + len(page))
+        return response
+
+@pytest.fixture
+def client(monkeypatch):
+    monitor.app.config['JOB_QUEUE'] = 'test-queue'
+    monitor.app.config['TESTING'] = True
+    monitor._job_list_cache.clear()
+    monitor._job_description_cache.clear()
+    monitor._metrics_collector = None
+    yield monitor.app.test_client()
+    monitor._job_list_cache.clear()
+    monitor._job_description_cache.clear()
+    monitor._metrics_collector = None
+
+def _use_batch(monkeypatch, batch):
+    monkeypatch.setattr(monitor, 'get_batch_client', lambda: batch)
+
+def test_list_jobs_pages_through_every_status(client, monkeypatch):
+    batch = StubBatch({'RUNNING': 250, 'SUCCEEDED': 120, 'FAILED': 3})
+    _use_batch(monkeypatch, batch)
+
+    response = client.get('/jobs')
+
+    jobs = response.get_json()
+    assert response.status_code == 200
+    assert len(jobs) == 373
+    assert response.headers['X-Total-Count'] == '373'
+    assert [job['createdAt'] for job in jobs] == sorted((job['createdAt'] for job in jobs), reverse=True)
+
+def test_list_jobs_filters_and_paginates(client, monkeypatch):
+    _use_batch(monkeypatch, StubBatch({'RUNNING': 50, 'FAILED': 50}))
+
+    response = client.get('/jobs?status=failed&since=200&limit=5&offset=2')
+
+    jobs = response.get_json()
+    assert response.headers['X-Total-Count'] == '30'
+    assert [job['jobId'] for job in jobs] == ['FAILED-47', 'FAILED-46', 'FAILED-45', 'FAILED-44', 'FAILED-43']
+    assert client.get('/jobs?status=BOGUS').status_code == 400
+
+def test_list_jobs_is_cached_and_collapses_concurrent_refreshes(client, monkeypatch):
+    batch = StubBatch({status: 1 for status in monitor.JOB_STATUSES}, latency=0.2)
+    _use_batch(monkeypatch, batch)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client.get, args=('/jobs',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Eight concurrent requests share one parallel refresh of the seven statuses
+    assert batch.calls == len(monitor.JOB_STATUSES)
+    assert elapsed < 0.2 * len(monitor.JOB_STATUSES)
+
+    client.get('/jobs')
+    assert batch.calls == len(monitor.JOB_STATUSES)
+
+class StubLogs:
+    """Serves a fixed log stream in pages with CloudWatch-style forward tokens."""
+
+    def __init__(self, messages, page_size=2):
+        self.messages = messages
+        self.page_size = page_size
+        self.requested_tokens = []
+
+    def get_log_events(self, logGroupName, logStreamName, startFromHead, nextToken=None):
+        self.requested_tokens.append(nextToken)
+        start = int(nextToken[2:]) if nextToken else 0
+        page = self.messages[start:start + self.page_size]
+        return {
+            'events': [{'message': message} for message in page],
+            'nextForwardToken': f'f/{start + len(page)}'
+        }
+
+class StubJobDescriptions:
+    def __init__(self, status):
+        self.status = status
+        self.calls = 0
+
+    def describe_jobs(self, jobs):
+        self.calls += 1
+        return {'jobs': [{'jobId': jobs[0], 'status': self.status, 'container': {'logStreamName': 'stream-1'}}]}
+
+def _sse_events(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if fields:
+            events.append(fields)
+    return events
+
+def test_get_job_logs_follows_cursor(client, monkeypatch):
+    logs = StubLogs([f'line {i}' for i in range(5)])
+    monkeypatch.setattr(monitor, 'get_batch_client', lambda: StubJobDescriptions('RUNNING'))
+    monkeypatch.setattr(monitor, 'get_logs_client', lambda: logs)
+
+    first = client.get('/jobs/job-1/logs').get_json()
+    assert first == {'logs': [f'line {i}' for i in range(5)], 'cursor': 'f/5'}
+
+    logs.messages.append('line 5')
+    second = client.get('/jobs/job-1/logs?cursor=f/5').get_json()
+    assert second == {'logs': ['line 5'], 'cursor': 'f/6'}
+
+def test_stream_job_logs_resumes_from_cursor(client, monkeypatch):
+    logs = StubLogs([f'line {i}' for i in range(7)])
+    monkeypatch.setattr(monitor, 'get_batch_client', lambda: StubJobDescriptions('SUCCEEDED'))
+    monkeypatch.setattr(monitor, 'get_logs_client', lambda: logs)
+
+    response = client.get('/jobs/job-1/logs/stream', headers={'Last-Event-ID': 'f/3'})
+
+    assert response.mimetype == 'text/event-stream'
+    events = _sse_events(response.get_data(as_text=True))
+    assert events[0]['id'] == 'f/7'
+    assert json.loads(events[0]['data'])['lines'] == ['line 3', 'line 4', 'line 5', 'line 6']
+    assert events[-1]['event'] == 'end'
+    assert logs.requested_tokens[0] == 'f/3'
+
+def test_log_viewers_share_job_status_from_index_and_cache(client, monkeypatch):
+    logs = StubLogs([f'line {i}' for i in range(3)])
+    batch = StubJobDescriptions('SUCCEEDED')
+    monkeypatch.setattr(monitor, 'get_batch_client', lambda: batch)
+    monkeypatch.setattr(monitor, 'get_logs_client', lambda: logs)
+
+    # Without the index, viewers within the TTL share one cached description
+    for _ in range(5):
+        events = _sse_events(client.get('/jobs/job-1/logs/stream').get_data(as_text=True))
+        assert events[-1]['event'] == 'end'
+    assert batch.calls == 1
+
+    # With the index, a job whose container has not started is never described
+    index = JobIndex(lambda statuses: [{'jobId': 'job-2', 'status': 'RUNNABLE'}], monitor.JOB_STATUSES)
+    index.poll()
+    monkeypatch.setattr(monitor, '_job_index', index)
+    assert client.get('/jobs/job-2/logs').get_json() == {'logs': 'Log stream not available for this job yet.'}
+    assert batch.calls == 1
+
+def test_get_job_metrics_resolution_and_unknown_job(client, monkeypatch):
+    class NoJobs:
+        def describe_jobs(self, jobs):
+            return {'jobs': []}
+
+    collector = MetricsCollector(NoJobs(), None, 'test-queue', cluster_name='cluster')
+    monkeypatch.setattr(monitor, 'get_metrics_collector', lambda: collector)
+
+    assert client.get('/jobs/job-1/metrics?resolution=5s').status_code == 400
+    assert client.get('/jobs/job-1/metrics').status_code == 404
+    assert client.get('/jobs/metrics?ids=job-1,job-2').get_json() == {'job-1': None, 'job-2': None}
+
+def test_jobs_served_from_index_regardless_of_viewers(client, monkeypatch):
+    batch = StubBatch({'RUNNING': 5, 'SUCCEEDED': 20}, page_size=10)
+    _use_batch(monkeypatch, batch)
+    index = monitor.start_job_index('test-queue', active_interval=60, idle_interval=60)
+    try:
+        assert index.wait_until_ready(5)
+        calls_after_poll = batch.calls
+        for _ in range(20):
+            response = client.get('/jobs?status=RUNNING')
+            assert len(response.get_json()) == 5
+        assert response.headers['X-Total-Count'] == '5'
+        assert batch.calls == calls_after_poll
+    finally:
+        index.stop()
+        monitor._job_index = None
+
+def _read_events(response, count):
+    """Reads `count` events from a streaming SSE response, skipping keep-alives."""
+    events = []
+    buffer = ''
+    chunks = iter(response.response)
+    while len(events) < count:
+        buffer += next(chunks).decode()
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            events.extend(_sse_events(block + '\n\n'))
+    response.close()
+    return events
+
+def test_stream_jobs_sends_snapshot_then_deltas(client, monkeypatch):
+    jobs = {'job-1': 'RUNNING', 'job-2': 'RUNNING'}
+    index = JobIndex(lambda statuses: [{'jobId': job_id, 'status': status} for job_id, status in jobs.items()], monitor.JOB_STATUSES)
+    index.poll()
+    monkeypatch.setattr(monitor, '_job_index', index)
+    monitor.app.config['STREAM_KEEPALIVE'] = 0.01
+
+    response = client.get('/jobs/stream', buffered=False)
+    [snapshot] = _read_events(response, 1)
+    assert snapshot['event'] == 'snapshot'
+    assert snapshot['id'] == '1'
+    assert len(json.loads(snapshot['data'])['jobs']) == 2
+
+    jobs['job-1'] = 'SUCCEEDED'
+    index.poll()
+    # A reconnecting client only receives what it missed
+    response = client.get('/jobs/stream', headers={'Last-Event-ID': '1'}, buffered=False)
+    [delta] = _read_events(response, 1)
+    assert delta['event'] == 'delta'
+    assert delta['id'] == '2'
+    assert [job['jobId'] for job in json.loads(delta['data'])['upserted']] == ['job-1']
+    monitor.app.config.pop('STREAM_KEEPALIVE')
+
+def test_metrics_endpoint_exports_request_and_span_timings(client, monkeypatch):
+    _use_batch(monkeypatch, StubBatch({'RUNNING': 3}))
+    tracing.reset()
+    tracing.enable()
+    try:
+        client.get('/jobs')
+        client.get('/jobs?status=BOGUS')
+        response = client.get('/metrics')
+    finally:
+        tracing.disable()
+        tracing.reset()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'http_request_duration_seconds_count{endpoint="/jobs",method="GET",status="200"} 1' in lines
+    assert 'http_request_duration_seconds_count{endpoint="/jobs",method="GET",status="400"} 1' in lines
+    assert 'span_duration_seconds_count{span="monitor.list_jobs_for_status"} 7' in lines
+
+def test_stream_jobs_without_index(client):
+    assert client.get('/jobs/stream').status_code == 503
+
+def test_clients_are_shared_and_pooled(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('MONITOR_MAX_POOL_CONNECTIONS', '64')
+    monkeypatch.setattr(monitor, '_batch_client', None)
+
+    batch = monitor.get_batch_client()
+
+    assert monitor.get_batch_client() is batch
+    assert batch.meta.config.max_pool_connections == 64
+    assert batch.meta.config.retries['mode'] == 'adaptive'
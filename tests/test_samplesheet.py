@@ -0,0 +1,110 @@
+import pytest
+import boto3
+import os
+import sys
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import lambda_function.handler as handler
+import samplesheet
+
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture
+def experiment(aws_credentials, monkeypatch):
+    """A moto table and bucket with three tagged samples; the handler's cached clients are reset."""
+    with mock_aws():
+        monkeypatch.setattr(handler, '_dynamodb', None)
+        monkeypatch.setattr(handler, '_s3_client', None)
+        monkeypatch.setattr(handler, '_tag_cache', handler.TagCache())
+        s3_client = boto3.client('s3', region_name='us-east-1')
+        s3_client.create_bucket(Bucket='test-bucket')
+        table = boto3.resource('dynamodb', region_name='us-east-1').create_table(
+            TableName='test-table',
+            KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+        )
+        for i, treatment in enumerate(['drug_x', 'none', 'drug_x']):
+            key = f'raw_data/EXP001/S{i}.fastq.gz'
+            s3_client.put_object(Bucket='test-bucket', Key=key, Body='dummy-content')
+            s3_client.put_object_tagging(Bucket='test-bucket', Key=key, Tagging={'TagSet': [
+                {'Key': 'fastq_2', 'Value': key.replace('.fastq.gz', '_R2.fastq.gz')}
+            ]})
+            table.put_item(Item={
+                'experiment_id': 'EXP001', 'sample_id': f'S{i}', 's3_object_key': key,
+                'experimental_group': 'treated' if treatment != 'none' else 'control', 'treatment': treatment
+            })
+        yield s3_client
+
+
+def test_writes_samplesheet_without_listing_the_bucket(experiment, tmp_path):
+    listings = []
+    handler._get_s3_client().meta.events.register('before-call.s3.ListObjectsV2', lambda **kwargs: listings.append(kwargs))
+    output = tmp_path / 'samplesheet.csv'
+
+    exit_code = samplesheet.main([
+        '--experiment-id', 'EXP001', '--table', 'test-table', '--bucket', 'test-bucket', '--output', str(output)
+    ])
+
+    assert exit_code == 0
+    assert output.read_text().splitlines() == [
+        'sample,fastq_1,fastq_2,experimental_group,treatment',
+        'S0,s3://test-bucket/raw_data/EXP001/S0.fastq.gz,raw_data/EXP001/S0_R2.fastq.gz,treated,drug_x',
+        'S1,s3://test-bucket/raw_data/EXP001/S1.fastq.gz,raw_data/EXP001/S1_R2.fastq.gz,control,none',
+        'S2,s3://test-bucket/raw_data/EXP001/S2.fastq.gz,raw_data/EXP001/S2_R2.fastq.gz,treated,drug_x',
+    ]
+    assert listings == []
+
+
+def test_passes_filters_and_columns(experiment, capsys):
+    exit_code = samplesheet.main([
+        '--experiment-id', 'EXP001', '--table', 'test-table', '--bucket', 'test-bucket',
+        '--filter', 'treatment=drug_x', '--columns', 'sample,treatment'
+    ])
+
+    assert exit_code == 0
+    assert capsys.readouterr().out.splitlines() == ['sample,treatment', 'S0,drug_x', 'S2,drug_x']
+
+
+def test_missing_experiment_exits_with_no_samples(experiment, tmp_path):
+    output = tmp_path / 'samplesheet.csv'
+    exit_code = samplesheet.main([
+        '--experiment-id', 'EXP404', '--table', 'test-table', '--bucket', 'test-bucket', '--output', str(output)
+    ])
+    assert exit_code == samplesheet.EXIT_NO_SAMPLES
+    assert not output.exists()
+
+
+def test_runs_from_the_files_the_image_copies(tmp_path):
+    """Only the files Dockerfile.samplesheet copies are importable inside the image."""
+    import shutil
+    import subprocess
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    with open(os.path.join(project_root, 'Dockerfile.samplesheet')) as f:
+        copies = [line.split()[1:] for line in f if line.startswith('COPY ')]
+    for *sources, destination in copies:
+        # As in COPY: files land inside the destination directory, directories are copied into it
+        destination = tmp_path / destination
+        destination.mkdir(parents=True, exist_ok=True)
+        for source in sources:
+            path = os.path.join(project_root, source)
+            if os.path.isdir(path):
+                shutil.copytree(path, destination, dirs_exist_ok=True)
+            else:
+                shutil.copy(path, destination / os.path.basename(source))
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+    result = subprocess.run([sys.executable, 'samplesheet.py', '--help'], cwd=tmp_path, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert '--experiment-id' in result.stdout
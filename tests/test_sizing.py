@@ -0,0 +1,63 @@
+import pytest
+import boto3
+import os
+import sys
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sizing import HeadJobSizer, trace_tasks_per_sample
+
+TRACE_HEADER = 'task_id\thash\tnative_id\tname\tstatus\texit\tsubmit\tduration\trealtime\t%cpu\tpeak_rss\tpeak_vmem\trchar\twchar\n'
+
+def _trace(samples, processes):
+    lines = [TRACE_HEADER]
+    task_id = 1
+    for sample in samples:
+        for process in processes:
+            lines.append(f'{task_id}\tab/cdef12\tjob-{task_id}\t{process} ({sample})\tCOMPLETED\t0\t2024-01-01 00:00:00.000\t1m\t50s\t98.0%\t1 GB\t2 GB\t1 MB\t1 MB\n')
+            task_id += 1
+    return ''.join(lines)
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+def test_trace_tasks_per_sample_counts_distinct_tags():
+    trace = _trace(['SAM1', 'SAM2', 'SAM3'], ['FASTQC', 'TRIM', 'ALIGN', 'QUANT'])
+
+    assert trace_tasks_per_sample(trace.splitlines(keepends=True)) == 4
+    assert trace_tasks_per_sample([TRACE_HEADER]) is None
+
+@mock_aws
+def test_head_job_sizer_uses_trace_history(aws_credentials):
+    """Sizing scales with sample count using the ratio seen in past traces."""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    s3_client.create_bucket(Bucket='test-bucket')
+    processes = [f'STEP{i}' for i in range(40)]
+    s3_client.put_object(Bucket='test-bucket', Key='work/trace/trace.txt', Body=_trace(['SAM1', 'SAM2'], processes))
+
+    sizer = HeadJobSizer(s3_client, 'test-bucket')
+
+    small = sizer.choose(4)
+    assert (small['vcpus'], small['memory']) == (1, 768)
+    assert '40.0 tasks/sample' in small['reason']
+    large = sizer.choose(2000)
+    assert (large['vcpus'], large['memory']) == (8, 16384)
+    assert sizer.choose(None)['memory'] == 1024
+
+@mock_aws
+def test_head_job_sizer_without_history(aws_credentials):
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    s3_client.create_bucket(Bucket='test-bucket')
+
+    choice = HeadJobSizer(s3_client, 'test-bucket').choose(500)
+
+    assert (choice['vcpus'], choice['memory']) == (2, 4096)
+    assert 'no trace history' in choice['reason']
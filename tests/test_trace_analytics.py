@@ -0,0 +1,112 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from trace_analytics import TraceTable, load_traces, parse_durations, parse_percentages, parse_sizes, process_report, suggest_labels
+
+HEADER = 'task_id\tname\tprocess\tstatus\texit\tattempt\tsubmit\tstart\tduration\trealtime\tcpus\tmemory\t%cpu\tpeak_rss\n'
+
+@pytest.fixture
+def trace_file(tmp_path):
+    rows = [
+        '1\tALIGN (S1)\tALIGN\tCOMPLETED\t0\t1\t2024-01-01 00:00:00.000\t2024-01-01 00:01:00.000\t11m\t10m\t8\t32 GB\t400.0%\t8 GB\n',
+        '2\tALIGN (S2)\tALIGN\tFAILED\t137\t1\t2024-01-01 00:00:00.000\t2024-01-01 00:00:30.000\t5m 30s\t5m\t8\t32 GB\t800.0%\t32 GB\n',
+        '3\tALIGN (S2)\tALIGN\tCOMPLETED\t0\t2\t2024-01-01 00:06:00.000\t2024-01-01 00:08:00.000\t12m\t10m\t8\t32 GB\t600.0%\t16 GB\n',
+        '4\tFASTQC (S1)\tFASTQC\tCOMPLETED\t0\t1\t2024-01-01 00:00:00.000\t2024-01-01 00:00:10.000\t40s\t30s\t2\t4 GB\t100.0%\t1 GB\n',
+        'truncated row\n',
+    ]
+    path = tmp_path / 'trace.txt'
+    path.write_text(HEADER + ''.join(rows))
+    return str(path)
+
+def test_human_readable_parsers():
+    assert parse_durations(['1h 2m 3s', '250ms', '1d', '-', '1500']).tolist()[:3] == [3723.0, 0.25, 86400.0]
+    assert np.isnan(parse_durations(['-'])[0])
+    assert parse_durations(['1500'])[0] == 1.5
+    assert parse_sizes(['1.5 GB', '512 MB', '10 KB', '2048']).tolist() == [1.5 * 1024 ** 3, 512 * 1024 ** 2, 10240.0, 2048.0]
+    percentages = parse_percentages(['98.5%', '-', '', '250.0%'])
+    assert percentages[0] == 98.5 and percentages[3] == 250.0
+    assert np.isnan(percentages[1]) and np.isnan(percentages[2])
+
+def test_process_report(trace_file):
+    table = load_traces([trace_file], chunk_rows=2)
+    report = {entry['process']: entry for entry in process_report(table)}
+
+    assert len(table) == 4
+    align = report['ALIGN']
+    assert align['tasks'] == 3
+    assert align['oom'] == 1 and align['failed'] == 1 and align['retried'] == 1
+    assert align['cpu_efficiency'] == pytest.approx((0.5 + 1.0 + 0.75) / 3)
+    assert align['memory_efficiency'] == pytest.approx((0.25 + 1.0 + 0.5) / 3)
+    assert align['queue_wait_median_s'] == 60.0
+    assert report['FASTQC']['queue_wait_median_s'] == 10.0
+
+    labels = suggest_labels(list(report.values()))
+    assert labels['large'] == {'cpus': 8, 'memory': '40 GB'}
+    assert labels['small']['cpus'] <= labels['large']['cpus']
+
+def test_save_and_reload_columnar_table(trace_file, tmp_path):
+    table = load_traces([trace_file])
+    saved = str(tmp_path / 'table.npz')
+    table.save(saved)
+
+    combined = load_traces([saved, trace_file])
+
+    assert len(combined) == 8
+    assert combined.sources == [trace_file, trace_file]
+    assert sorted(set(combined.columns['run'].tolist())) == [0, 1]
+    assert [entry['tasks'] for entry in process_report(combined)] == [6, 2]
+
+def test_rows_without_a_process_are_left_out_of_the_report(trace_file, tmp_path):
+    unnamed = tmp_path / 'unnamed.txt'
+    unnamed.write_text(
+        'task_id\tstatus\texit\tattempt\trealtime\n'
+        '1\tFAILED\t137\t2\t1h\n'
+        '2\tCOMPLETED\t0\t1\t30m\n'
+    )
+    table = load_traces([trace_file, str(unnamed)])
+    report = {entry['process']: entry for entry in process_report(table)}
+
+    assert len(table) == 6
+    assert set(report) == {'ALIGN', 'FASTQC'}
+    assert report['ALIGN']['tasks'] == 3 and report['ALIGN']['failed'] == 1
+    assert report['ALIGN']['total_realtime_s'] == 1500.0
+    assert process_report(load_traces([str(unnamed)])) == []
+
+def test_malformed_rows_with_offsetting_widths_are_dropped(tmp_path):
+    path = tmp_path / 'trace.txt'
+    path.write_text(
+        'task_id\tprocess\trealtime\n'
+        '1\tALIGN\t10m\n'
+        '2\tALIGN\n'
+        '3\tFASTQC\t30s\textra\n'
+        '4\tFASTQC\t30s\n'
+    )
+    table = load_traces([str(path)])
+    report = {entry['process']: entry for entry in process_report(table)}
+
+    assert len(table) == 2
+    assert report['ALIGN']['total_realtime_s'] == 600.0
+    assert report['FASTQC']['total_realtime_s'] == 30.0
+
+def test_header_only_and_empty_traces(trace_file, tmp_path):
+    header_only = tmp_path / 'started.txt'
+    header_only.write_text(HEADER)
+    empty = tmp_path / 'empty.txt'
+    empty.write_text('')
+
+    table = load_traces([str(header_only), str(empty)])
+    assert len(table) == 0
+    assert process_report(table) == []
+    saved = str(tmp_path / 'empty.npz')
+    table.save(saved)
+    assert len(load_traces([saved])) == 0
+    assert len(load_traces([])) == 0
+
+    combined = load_traces([str(header_only), trace_file])
+    assert len(combined) == 4
+    assert set(combined.columns['run'].tolist()) == {1}
@@ -0,0 +1,95 @@
+import pytest
+import boto3
+import os
+import sys
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import tracing
+
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture
+def tracing_enabled():
+    tracing.reset()
+    tracing.enable()
+    yield
+    tracing.disable()
+    tracing.reset()
+
+
+def test_disabled_spans_record_nothing():
+    tracing.reset()
+    tracing.disable()
+
+    @tracing.traced('work')
+    def work():
+        return 42
+
+    with tracing.span('block'):
+        assert work() == 42
+    assert tracing.snapshot() == {}
+    assert tracing.render_prometheus() == ''
+
+
+def test_spans_record_counts_and_percentiles(tracing_enabled):
+    @tracing.traced('work')
+    def work(fail=False):
+        if fail:
+            raise ValueError('boom')
+
+    for _ in range(9):
+        work()
+    with pytest.raises(ValueError):
+        work(fail=True)
+    for seconds in [0.001 * n for n in range(1, 101)]:
+        tracing.record(tracing.SPAN_METRIC, seconds, span='synthetic')
+
+    spans = tracing.snapshot()[tracing.SPAN_METRIC]
+    # Failed calls are timed too
+    assert spans['work']['count'] == 10
+    assert spans['synthetic']['count'] == 100
+    assert spans['synthetic']['p50_ms'] == 50.0
+    assert spans['synthetic']['p99_ms'] == 99.0
+
+
+def test_prometheus_histogram_is_cumulative(tracing_enabled):
+    for seconds in (0.0005, 0.003, 0.003, 120.0):
+        tracing.record(tracing.HTTP_REQUEST_METRIC, seconds, endpoint='/jobs', method='GET', status='200')
+
+    lines = tracing.render_prometheus().splitlines()
+    labels = 'endpoint="/jobs",method="GET",status="200"'
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.001"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.005"}} 3' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="60.0"}} 3' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4' in lines
+    assert f'http_request_duration_seconds_count{{{labels}}} 4' in lines
+
+
+@mock_aws
+def test_instrumented_client_records_api_calls(aws_credentials, tracing_enabled):
+    s3_client = tracing.instrument_client(boto3.client('s3', region_name='us-east-1'))
+    # Instrumenting again must not double-count
+    tracing.instrument_client(s3_client)
+    s3_client.create_bucket(Bucket='test-bucket')
+    s3_client.put_object(Bucket='test-bucket', Key='a', Body=b'x')
+    s3_client.put_object(Bucket='test-bucket', Key='b', Body=b'x')
+    with pytest.raises(s3_client.exceptions.NoSuchKey):
+        s3_client.get_object(Bucket='test-bucket', Key='missing')
+
+    calls = tracing.snapshot()[tracing.AWS_API_CALL_METRIC]
+    assert {name: summary['count'] for name, summary in calls.items()} == {
+        's3.CreateBucket': 1, 's3.PutObject': 2, 's3.GetObject': 1
+    }
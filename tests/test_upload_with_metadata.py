@@ -0,0 +1,183 @@
+import pytest
+import boto3
+import os
+import json
+import sys
+from boto3.s3.transfer import TransferConfig
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from upload_with_metadata import bulk_upload, glob_entries, load_upload_manifest, resumable_upload, upload_with_metadata
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+@pytest.fixture
+def aws(aws_credentials):
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='test-bucket')
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(
+            TableName='test-table',
+            KeySchema=[{'AttributeName': 'experiment_id', 'KeyType': 'HASH'}, {'AttributeName': 'sample_id', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'experiment_id', 'AttributeType': 'S'}, {'AttributeName': 'sample_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        yield s3, dynamodb
+
+def _tags(s3, key):
+    return {tag['Key']: tag['Value'] for tag in s3.get_object_tagging(Bucket='test-bucket', Key=key)['TagSet']}
+
+def test_single_upload_tags_in_upload_request(aws, tmp_path, mocker):
+    s3, dynamodb = aws
+    path = tmp_path / 'SAM001.fastq.gz'
+    path.write_bytes(b'reads')
+    put_tagging = mocker.spy(s3, 'put_object_tagging')
+
+    upload_with_metadata(str(path), 'test-bucket', 'raw/SAM001.fastq.gz', 'test-table', 'EXP001',
+                         '{"treatment": "drug_a"}', '{"sample_id": "SAM001", "organism": "human"}')
+
+    assert _tags(s3, 'raw/SAM001.fastq.gz') == {'sample_id': 'SAM001', 'organism': 'human'}
+    item = dynamodb.Table('test-table').get_item(Key={'experiment_id': 'EXP001', 'sample_id': 'SAM001'})['Item']
+    assert item['treatment'] == 'drug_a'
+    put_tagging.assert_not_called()
+
+def test_bulk_upload_from_glob(aws, tmp_path, mocker):
+    s3, dynamodb = aws
+    for i in range(30):
+        (tmp_path / f'SAM{i:03d}.fastq.gz').write_bytes(b'x' * 100)
+    # One file large enough for a multipart upload
+    (tmp_path / 'BIG.fastq.gz').write_bytes(os.urandom(6 * 1024 * 1024))
+    entries = glob_entries(str(tmp_path / '*.fastq.gz'), 'raw/run1', {'organism': 'human'}, {'run': 'run1'})
+    batch_write = mocker.spy(dynamodb.meta.client, 'batch_write_item')
+    config = TransferConfig(multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+
+    summary = bulk_upload(entries, 'test-bucket', 'test-table', 'EXP001', max_workers=8,
+                          transfer_config=config, s3_client=s3, dynamodb=dynamodb)
+
+    assert summary['uploaded'] == 31
+    assert summary['failed'] == 0
+    assert summary['bytes'] == 30 * 100 + 6 * 1024 * 1024
+    assert _tags(s3, 'raw/run1/BIG.fastq.gz') == {'sample_id': 'BIG', 'organism': 'human'}
+    items = dynamodb.Table('test-table').scan()['Items']
+    assert len(items) == 31
+    assert all(item['run'] == 'run1' for item in items)
+    assert batch_write.call_count == 2
+
+def test_bulk_upload_collects_failures_into_retry_manifest(aws, tmp_path):
+    s3, dynamodb = aws
+    (tmp_path / 'good.fastq.gz').write_bytes(b'x')
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text(
+        'file_path,key,tag:sample_id,treatment\n'
+        f'{tmp_path / "good.fastq.gz"},raw/good.fastq.gz,GOOD,drug_a\n'
+        f'{tmp_path / "missing.fastq.gz"},raw/missing.fastq.gz,MISSING,drug_b\n'
+    )
+    entries = load_upload_manifest(str(manifest))
+    assert entries[0]['core_metadata'] == {'sample_id': 'GOOD'}
+    assert entries[0]['context'] == {'treatment': 'drug_a'}
+    entries.append({'file_path': str(tmp_path / 'good.fastq.gz'), 'key': 'raw/other.fastq.gz', 'core_metadata': {'sample_id': 'OTHER'}})
+    retry_path = tmp_path / 'retry.json'
+
+    summary = bulk_upload(entries[:2], 'test-bucket', 'test-table', 'EXP001', s3_client=s3, dynamodb=dynamodb, retry_manifest=str(retry_path))
+    failed_upload = bulk_upload(entries[2:], 'missing-bucket', 'test-table', 'EXP001', s3_client=s3, dynamodb=dynamodb, retry_manifest=str(tmp_path / 'retry2.json'))
+
+    assert summary['uploaded'] == 1
+    assert summary['failed'] == 1
+    retry = load_upload_manifest(str(retry_path))
+    assert [(entry['key'], entry['stage']) for entry in retry] == [('raw/missing.fastq.gz', 'validate')]
+    assert failed_upload['failed'] == 1
+    assert load_upload_manifest(str(tmp_path / 'retry2.json'))[0]['stage'] == 'upload'
+
+def test_resumable_upload_resumes_and_skips(aws, tmp_path, mocker):
+    s3, _ = aws
+    path = tmp_path / 'SAM001.bam'
+    data = os.urandom(11 * 1024 * 1024)
+    path.write_bytes(data)
+    journal_dir = str(tmp_path / 'journal')
+    part_size = 5 * 1024 * 1024
+
+    # Interrupt the first run on part 3
+    upload_part = s3.upload_part
+    def flaky_upload_part(**kwargs):
+        if kwargs['PartNumber'] == 3:
+            raise ConnectionError('link dropped')
+        return upload_part(**kwargs)
+    mocker.patch.object(s3, 'upload_part', side_effect=flaky_upload_part)
+    with pytest.raises(ConnectionError):
+        resumable_upload(s3, str(path), 'test-bucket', 'raw/SAM001.bam', 'sample_id=SAM001', part_size=part_size, max_workers=1, journal_dir=journal_dir)
+    assert len(os.listdir(journal_dir)) == 1
+
+    mocker.patch.object(s3, 'upload_part', side_effect=upload_part)
+    result = resumable_upload(s3, str(path), 'test-bucket', 'raw/SAM001.bam', 'sample_id=SAM001', part_size=part_size, journal_dir=journal_dir)
+
+    assert (result['resumed_parts'], result['uploaded_parts']) == (2, 1)
+    assert s3.get_object(Bucket='test-bucket', Key='raw/SAM001.bam')['Body'].read() == data
+    assert _tags(s3, 'raw/SAM001.bam') == {'sample_id': 'SAM001'}
+    assert os.listdir(journal_dir) == []
+
+    # Already present with a matching checksum: nothing is sent
+    create = mocker.spy(s3, 'create_multipart_upload')
+    again = resumable_upload(s3, str(path), 'test-bucket', 'raw/SAM001.bam', part_size=part_size, journal_dir=journal_dir)
+    assert again['skipped'] and not again['retagged']
+    assert again['checksum_sha256'] == result['checksum_sha256']
+    create.assert_not_called()
+
+    # Re-running with corrected metadata updates the tags of the skipped object
+    put_tagging = mocker.spy(s3, 'put_object_tagging')
+    corrected = resumable_upload(s3, str(path), 'test-bucket', 'raw/SAM001.bam', 'sample_id=SAM001&tissue=liver', part_size=part_size, journal_dir=journal_dir)
+    assert corrected['skipped'] and corrected['retagged']
+    assert _tags(s3, 'raw/SAM001.bam') == {'sample_id': 'SAM001', 'tissue': 'liver'}
+    unchanged = resumable_upload(s3, str(path), 'test-bucket', 'raw/SAM001.bam', 'sample_id=SAM001&tissue=liver', part_size=part_size, journal_dir=journal_dir)
+    assert not unchanged['retagged']
+    assert put_tagging.call_count == 1
+    create.assert_not_called()
+
+def test_bulk_upload_rejects_records_failing_schema(aws, tmp_path):
+    s3, dynamodb = aws
+    (tmp_path / 'a.fastq.gz').write_bytes(b'x')
+    context = {
+        'pi_name': 'Dr. Smith', 'project_id': 'P1', 'experimental_group': 'treatment', 'treatment': 'drug',
+        'concentration': '10uM', 'timepoint': '24h', 'replicate_type': 'biological', 'replicate_number': 1, 'batch': 'w1'
+    }
+    entries = [
+        {'file_path': str(tmp_path / 'a.fastq.gz'), 'key': 'raw/a.fastq.gz', 'core_metadata': {'sample_id': 'A'}, 'context': context},
+        {'file_path': str(tmp_path / 'a.fastq.gz'), 'key': 'raw/b.fastq.gz', 'core_metadata': {'sample_id': 'B'},
+         'context': dict(context, replicate_number='three')}
+    ]
+
+    summary = bulk_upload(entries, 'test-bucket', 'test-table', 'EXP001', s3_client=s3, dynamodb=dynamodb,
+                          retry_manifest=str(tmp_path / 'retry.json'), validate_schema='experiment_contexts')
+
+    assert (summary['uploaded'], summary['failed']) == (1, 1)
+    retry = load_upload_manifest(str(tmp_path / 'retry.json'))
+    assert retry[0]['key'] == 'raw/b.fastq.gz'
+    assert retry[0]['error'] == 'replicate_number: expected integer'
+    assert 'Contents' not in s3.list_objects_v2(Bucket='test-bucket', Prefix='raw/b')
+
+def test_bulk_upload_validates_csv_manifests_with_numeric_columns(aws, tmp_path):
+    s3, dynamodb = aws
+    (tmp_path / 'a.fastq.gz').write_bytes(b'x')
+    columns = 'file_path,key,tag:sample_id,pi_name,project_id,experimental_group,treatment,concentration,timepoint,replicate_type,replicate_number,batch'
+    row = f"{tmp_path / 'a.fastq.gz'},raw/{{0}}.fastq.gz,{{0}},Dr. Smith,P1,treatment,drug,10uM,24h,biological,{{1}},w1"
+    (tmp_path / 'manifest.csv').write_text('\n'.join([columns, row.format('A', '2'), row.format('B', 'three')]) + '\n')
+
+    summary = bulk_upload(load_upload_manifest(str(tmp_path / 'manifest.csv')), 'test-bucket', 'test-table', 'EXP001',
+                          s3_client=s3, dynamodb=dynamodb, retry_manifest=str(tmp_path / 'retry.json'),
+                          validate_schema='experiment_contexts')
+
+    assert (summary['uploaded'], summary['failed']) == (1, 1)
+    retry = load_upload_manifest(str(tmp_path / 'retry.json'))
+    assert (retry[0]['key'], retry[0]['error']) == ('raw/B.fastq.gz', 'replicate_number: expected integer')
+    item = dynamodb.Table('test-table').get_item(Key={'experiment_id': 'EXP001', 'sample_id': 'A'})['Item']
+    assert item['replicate_number'] == 2
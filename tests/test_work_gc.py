@@ -0,0 +1,152 @@
+import pytest
+import boto3
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from moto import mock_aws
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from work_gc import WorkDirCollector, load_referenced_hashes, main, shard_prefixes, trace_hashes
+
+BUCKET = 'test-bucket'
+TRACE_HEADER = 'task_id\thash\tname\tstatus\n'
+
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+def _task_dir(shard, n):
+    return f'{shard}/{n:02x}' + 'c' * 28
+
+
+def _populate(s3_client):
+    """Creates six task directories of three 10-byte files each, plus a trace and a report."""
+    s3_client.create_bucket(Bucket=BUCKET)
+    dirs = [_task_dir(shard, n) for shard in ('0a', 'ff') for n in range(1, 4)]
+    for task_dir in dirs:
+        for name in ('.command.sh', '.command.log', 'out.bam'):
+            s3_client.put_object(Bucket=BUCKET, Key=f'work/{task_dir}/{name}', Body=b'0123456789')
+    # Run 1 used the first directory of each shard, run 2 the second of shard 0a
+    s3_client.put_object(Bucket=BUCKET, Key='work/trace/trace-run1.txt', Body=(
+        TRACE_HEADER + f'1\t{dirs[0][:9]}\tALIGN (S1)\tCOMPLETED\n2\t{dirs[3][:9]}\tALIGN (S2)\tCOMPLETED\n'
+    ).encode())
+    s3_client.put_object(Bucket=BUCKET, Key='work/trace/trace-run2.txt', Body=(
+        TRACE_HEADER + f'1\t{dirs[1][:9]}\tSORT (S1)\tCOMPLETED\n'
+    ).encode())
+    s3_client.put_object(Bucket=BUCKET, Key='work/reports/report.html', Body=b'<html></html>')
+    return dirs
+
+
+def _keys(s3_client):
+    paginator = s3_client.get_paginator('list_objects_v2')
+    return {obj['Key'] for page in paginator.paginate(Bucket=BUCKET) for obj in page.get('Contents', [])}
+
+
+def test_trace_hashes_reads_hash_column():
+    lines = [TRACE_HEADER, '1\tab/cdef01\tA (x)\tCOMPLETED\n', '2\t-\tB\tFAILED\n', 'short\n']
+    assert list(trace_hashes(lines)) == ['ab/cdef01']
+    assert list(trace_hashes(['task_id\tname\n', '1\tA\n'])) == []
+
+
+def test_shard_prefixes():
+    assert len(shard_prefixes()) == 256
+    assert shard_prefixes()[:2] == ['00/', '01/']
+    assert len(shard_prefixes(1)) == 4096
+    assert shard_prefixes(1)[-1] == 'ff/f'
+
+
+@mock_aws
+def test_dry_run_reports_reclaimable_bytes_without_deleting(aws_credentials):
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dirs = _populate(s3_client)
+    before = _keys(s3_client)
+
+    referenced, sources, unusable = load_referenced_hashes(s3_client, BUCKET)
+    assert referenced == {dirs[0][:9], dirs[1][:9], dirs[3][:9]}
+    assert len(sources) == 2
+
+    collector = WorkDirCollector(s3_client, BUCKET, referenced, now=datetime.now(timezone.utc) + timedelta(days=30))
+    summary = collector.run()
+
+    assert _keys(s3_client) == before
+    assert summary['task_dirs'] == 6
+    assert summary['referenced_dirs'] == 3
+    assert summary['collected_dirs'] == 3
+    assert summary['collected_objects'] == 9
+    assert summary['collected_bytes'] == 90
+    assert summary['delete_calls'] == 0
+    assert summary['dry_run'] is True
+
+
+@mock_aws
+def test_deletes_unreferenced_dirs_in_batches(aws_credentials, tmp_path):
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    dirs = _populate(s3_client)
+    # No trace in S3 is retained; only a local trace that references one directory
+    local_trace = tmp_path / 'trace.txt'
+    local_trace.write_text(TRACE_HEADER + f'1\t{dirs[1][:9]}\tSORT (S1)\tCOMPLETED\n')
+    referenced, sources, unusable = load_referenced_hashes(s3_client, BUCKET, keep_runs=0, paths=[str(local_trace)])
+    assert sources == [str(local_trace)]
+    assert unusable == []
+
+    collector = WorkDirCollector(
+        s3_client, BUCKET, referenced, dry_run=False, batch_size=4, max_workers=4,
+        now=datetime.now(timezone.utc) + timedelta(days=30)
+    )
+    summary = collector.run()
+
+    remaining = _keys(s3_client)
+    kept_dirs = {key.split('/', 1)[1].rsplit('/', 1)[0] for key in remaining if key.count('/') == 3}
+    assert kept_dirs == {dirs[1]}
+    assert {'work/trace/trace-run1.txt', 'work/trace/trace-run2.txt', 'work/reports/report.html'} <= remaining
+    assert summary['collected_objects'] == 15
+    # Shard 0a has 6 keys to delete and ff has 9, in batches of at most 4
+    assert summary['delete_calls'] == 5
+    assert summary['delete_errors'] == 0
+
+
+@mock_aws
+def test_recent_dirs_are_kept(aws_credentials):
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    _populate(s3_client)
+    before = _keys(s3_client)
+
+    summary = WorkDirCollector(s3_client, BUCKET, set(), dry_run=False, min_age_days=7).run()
+
+    assert summary['recent_dirs'] == 6
+    assert summary['collected_dirs'] == 0
+    assert _keys(s3_client) == before
+
+
+@mock_aws
+def test_delete_refuses_when_traces_yield_no_hashes(aws_credentials, capsys):
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    _populate(s3_client)
+    s3_client.put_object(Bucket=BUCKET, Key='work/trace/trace-run3.txt', Body=b'task_id\tname\tstatus\n1\tALIGN (S3)\tCOMPLETED\n')
+    before = _keys(s3_client)
+
+    referenced, sources, unusable = load_referenced_hashes(s3_client, BUCKET)
+    assert len(referenced) == 3
+    assert unusable == [f's3://{BUCKET}/work/trace/trace-run3.txt']
+
+    # One trace without a hash column is enough to refuse
+    with pytest.raises(SystemExit) as exit_info:
+        main(['--bucket', BUCKET, '--delete', '--min-age-days', '0'])
+    assert exit_info.value.code == 2
+    assert '1 trace file(s) list no task hashes' in capsys.readouterr().err
+
+    # As is a trace prefix whose files list no hashes at all
+    with pytest.raises(SystemExit):
+        main(['--bucket', BUCKET, '--delete', '--min-age-days', '0', '--trace-prefix', 'work/trace/trace-run3'])
+    assert 'no task hashes found' in capsys.readouterr().err
+    assert _keys(s3_client) == before
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# trace_analytics.py
+"""
+Columnar analytics over Nextflow trace files.
+
+Trace files (local paths, s3:// objects or s3:// prefixes) are streamed in
+chunks into NumPy column arrays; no per-task Python objects are kept. Human
+readable durations, sizes and percentages are parsed once per distinct value
+and broadcast back with np.unique, and timestamps are converted with NumPy's
+datetime parser, so millions of rows stay cheap. A parsed table can be saved
+to a compressed .npz file and reloaded instead of re-reading the raw text.
+
+From the table the CLI reports per-process CPU and memory efficiency, queue
+wait versus run time, retry and OOM hotspots, and suggested
+`withLabel: small/medium/large` values for nextflow.config.
+"""
+import argparse
+import json
+import math
+import re
+import sys
+import numpy as np
+
+DEFAULT_CHUNK_ROWS = 200000
+# Exit codes Nextflow tasks report when the kernel or Batch kills them for memory
+OOM_EXIT_CODES = (137,)
+# Headroom applied to observed peaks when suggesting label resources
+MEMORY_HEADROOM = 1.25
+LABEL_QUANTILES = {'small': 0.5, 'medium': 0.9, 'large': 1.0}
+
+DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0, 'd': 86400.0}
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4, 'PB': 1024 ** 5}
+DURATION_TOKEN = re.compile(r'(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)')
+SIZE_VALUE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGTP]?B)\s*$')
+
+# Columns kept in the table and how each one is parsed
+DURATION_COLUMNS = ('duration', 'realtime')
+SIZE_COLUMNS = ('memory', 'peak_rss', 'peak_vmem', 'rchar', 'wchar')
+PERCENT_COLUMNS = ('%cpu', '%mem')
+NUMBER_COLUMNS = ('cpus', 'exit', 'attempt')
+TIMESTAMP_COLUMNS = ('submit', 'start', 'complete')
+CATEGORY_COLUMNS = ('process', 'status')
+
+
+def _parse_unique(values, parse):
+    """Applies `parse` once per distinct string and broadcasts the results."""
+    uniques, inverse = np.unique(values, return_inverse=True)
+    parsed = np.array([parse(value) for value in uniques], dtype=np.float64)
+    return parsed[inverse] if len(values) else np.empty(0, dtype=np.float64)
+
+
+def _parse_duration(value):
+    """'1h 2m 3.5s' -> seconds. Raw trace values (plain numbers) are milliseconds."""
+    try:
+        return float(value) / 1000.0
+    except ValueError:
+        pass
+    tokens = DURATION_TOKEN.findall(value)
+    if not tokens:
+        return math.nan
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in tokens)
+
+
+def _parse_size(value):
+    """'1.5 GB' -> bytes. Raw trace values (plain numbers) are bytes."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = SIZE_VALUE.match(value)
+    if not match:
+        return math.nan
+    return float(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def _parse_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def parse_durations(values):
+    return _parse_unique(np.asarray(values), _parse_duration)
+
+
+def parse_sizes(values):
+    return _parse_unique(np.asarray(values), _parse_size)
+
+
+def parse_percentages(values):
+    """'98.5%' -> 98.5, fully vectorized; '-' and blanks become NaN."""
+    stripped = np.char.strip(np.char.rstrip(np.asarray(values, dtype=str), '%'))
+    valid = np.char.str_len(stripped) > 0
+    valid &= np.char.find(stripped, '-') != 0
+    result = np.full(stripped.shape, np.nan)
+    result[valid] = stripped[valid].astype(np.float64)
+    return result
+
+
+def parse_timestamps(values):
+    """'2024-01-01 12:00:00.000' (or raw epoch ms) -> epoch seconds."""
+    values = np.asarray(values, dtype=str)
+    result = np.full(values.shape, np.nan)
+    if not len(values):
+        return result
+    is_iso = np.char.count(values, '-') == 2
+    if is_iso.any():
+        iso = np.char.replace(values[is_iso], ' ', 'T')
+        result[is_iso] = iso.astype('datetime64[ms]').astype(np.int64) / 1000.0
+    raw = ~is_iso
+    if raw.any():
+        result[raw] = _parse_unique(values[raw], _parse_number) / 1000.0
+    return result
+
+
+def _process_names(names):
+    """Strips the ' (tag)' suffix Nextflow appends to task names."""
+    return np.char.strip(np.char.partition(np.asarray(names, dtype=str), ' (')[:, 0])
+
+
+class TraceTable:
+    """
+    Column-oriented trace data. Numeric columns are float64 arrays (NaN where
+    absent); `process` and `status` are stored as integer codes into
+    `categories[column]`; `run` is the index of the source file in `sources`.
+    """
+
+    def __init__(self, columns, categories, sources):
+        self.columns = columns
+        self.categories = categories
+        self.sources = sources
+
+    def __len__(self):
+        return len(self.columns['run'])
+
+    @classmethod
+    def concat(cls, chunks, sources):
+        categories = {}
+        columns = {}
+        names = set()
+        for chunk_columns, _ in chunks:
+            names.update(chunk_columns)
+        for name in sorted(names):
+            if name in CATEGORY_COLUMNS:
+                continue
+            columns[name] = np.concatenate([
+                chunk_columns.get(name, np.full(len(chunk_columns['run']), np.nan))
+                for chunk_columns, _ in chunks
+            ]) if chunks else np.empty(0)
+        # Header-only or empty traces (e.g. a run with no finished task yet) yield no chunks
+        columns.setdefault('run', np.empty(0, dtype=np.int32))
+        # Re-code categories against a shared vocabulary
+        for name in CATEGORY_COLUMNS:
+            vocabulary = sorted(set().union(*(chunk_categories.get(name, ()) for _, chunk_categories in chunks))) if chunks else []
+            index = {value: code for code, value in enumerate(vocabulary)}
+            parts = []
+            for chunk_columns, chunk_categories in chunks:
+                mapping = np.array([index[value] for value in chunk_categories.get(name, [])], dtype=np.int32)
+                codes = chunk_columns.get(name)
+                parts.append(mapping[codes] if codes is not None and len(mapping) else np.full(len(chunk_columns['run']), -1, dtype=np.int32))
+            columns[name] = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+            categories[name] = vocabulary
+        return cls(columns, categories, sources)
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            __categories__=json.dumps(self.categories),
+            __sources__=json.dumps(self.sources),
+            **{f'col:{name}': values for name, values in self.columns.items()}
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {key[4:]: data[key] for key in data.files if key.startswith('col:')}
+            return cls(columns, json.loads(str(data['__categories__'])), json.loads(str(data['__sources__'])))
+
+
+def _parse_chunk(header, lines, run_index):
+    """Parses a list of newline-terminated, tab-separated lines into column arrays."""
+    width = len(header)
+    # Split the whole chunk at once and slice columns out of the flat field list;
+    # this avoids building a Python list per row
+    if all(line.count('\t') == width - 1 for line in lines):
+        fields = ''.join(lines).replace('\n', '\t').split('\t')[:-1]
+        row_count = len(lines)
+    else:
+        # Some rows are malformed; fall back to per-row splitting and drop them
+        rows = [row for row in (line.rstrip('\n').split('\t') for line in lines) if len(row) == width]
+        fields = [field for row in rows for field in row]
+        row_count = len(rows)
+    raw = {name: fields[i::width] for i, name in enumerate(header)}
+    columns = {'run': np.full(row_count, run_index, dtype=np.int32)}
+    categories = {}
+
+    for name in DURATION_COLUMNS:
+        if name in raw:
+            columns[name] = parse_durations(raw[name])
+    for name in SIZE_COLUMNS:
+        if name in raw:
+            columns[name] = parse_sizes(raw[name])
+    for name in PERCENT_COLUMNS:
+        if name in raw:
+            columns[name] = parse_percentages(raw[name])
+    for name in NUMBER_COLUMNS:
+        if name in raw:
+            columns[name] = _parse_unique(np.asarray(raw[name], dtype=str), _parse_number)
+    for name in TIMESTAMP_COLUMNS:
+        if name in raw:
+            columns[name] = parse_timestamps(raw[name])
+
+    process = raw.get('process') or (_process_names(raw['name']) if raw.get('name') else None)
+    for name, values in (('process', process), ('status', raw.get('status'))):
+        if values is None or not len(values):
+            continue
+        vocabulary, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        columns[name] = codes.astype(np.int32)
+        categories[name] = vocabulary.tolist()
+    return columns, categories
+
+
+def read_trace_lines(lines, run_index, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yields parsed (columns, categories) chunks from an iterable of lines."""
+    lines = iter(lines)
+    header = next(lines, '').rstrip('\n').split('\t')
+    chunk = []
+    for line in lines:
+        chunk.append(line if line.endswith('\n') else line + '\n')
+        if len(chunk) >= chunk_rows:
+            yield _parse_chunk(header, chunk, run_index)
+            chunk = []
+    if chunk:
+        yield _parse_chunk(header, chunk, run_index)
+
+
+def _iter_sources(paths, s3_client=None):
+    """Yields (source, line iterator) for local files, S3 objects and S3 prefixes."""
+    for path in paths:
+        if not path.startswith('s3://'):
+            with open(path, 'r') as f:
+                yield path, f
+            continue
+
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3')
+        bucket, _, key = path[len('s3://'):].partition('/')
+        if key and not key.endswith('/'):
+            keys = [key]
+        else:
+            keys = []
+            paginator = s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=key):
+                keys.extend(
+                    obj['Key'] for obj in page.get('Contents', [])
+                    if obj['Key'].rsplit('/', 1)[-1].startswith('trace')
+                )
+        for object_key in keys:
+            body = s3_client.get_object(Bucket=bucket, Key=object_key)['Body']
+            yield f's3://{bucket}/{object_key}', (line.decode('utf-8') for line in body.iter_lines())
+
+
+def load_traces(paths, s3_client=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Streams trace files into a single TraceTable.
+
+    Args:
+        paths (list): Local trace files, saved .npz tables, s3:// trace
+                      objects or s3:// prefixes holding trace files.
+        s3_client: Optional boto3 S3 client for s3:// inputs.
+        chunk_rows (int): Lines parsed per chunk.
+    """
+    chunks = []
+    sources = []
+    for path in paths:
+        if path.endswith('.npz'):
+            table = TraceTable.load(path)
+            offset = len(sources)
+            sources.extend(table.sources)
+            columns = dict(table.columns)
+            columns['run'] = columns['run'] + offset
+            chunks.append((columns, table.categories))
+            continue
+        for source, lines in _iter_sources([path], s3_client):
+            run_index = len(sources)
+            sources.append(source)
+            chunks.extend(read_trace_lines(lines, run_index, chunk_rows))
+    return TraceTable.concat(chunks, sources)
+
+
+def _group_quantile(codes, values, n_groups, q):
+    """Per-group q-quantile of `values` (nearest rank, rounding up), ignoring NaN."""
+    result = np.full(n_groups, np.nan)
+    valid = ~np.isnan(values) & (codes >= 0)
+    codes, values = codes[valid], values[valid]
+    if not len(values):
+        return result
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    ranks = starts[present] + np.ceil(q * (counts[present] - 1)).astype(np.int64)
+    result[present] = values[order][ranks]
+    return result
+
+
+def _group_mean(codes, values, n_groups):
+    valid = ~np.isnan(values) & (codes >= 0)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def _column(table, name):
+    return table.columns.get(name, np.full(len(table), np.nan))
+
+
+def process_report(table):
+    """
+    Summarizes each process in the table.
+
+    Returns:
+        list: One dict per process, sorted by total run time, with CPU and
+              memory efficiency, queue wait and run time medians, and
+              retry/failure/OOM counts.
+    """
+    processes = table.categories.get('process', [])
+    n = len(processes)
+    if not n:
+        return []
+    codes = table.columns['process']
+    cpus = _column(table, 'cpus')
+    pct_cpu = _column(table, '%cpu')
+    memory = _column(table, 'memory')
+    peak_rss = _column(table, 'peak_rss')
+    realtime = _column(table, 'realtime')
+    duration = _column(table, 'duration')
+    exit_codes = _column(table, 'exit')
+    attempt = _column(table, 'attempt')
+
+    # Queue wait is start - submit when both are traced, otherwise duration - realtime
+    queue_wait = _column(table, 'start') - _column(table, 'submit')
+    queue_wait = np.where(np.isnan(queue_wait), duration - realtime, queue_wait)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cpu_efficiency = pct_cpu / (cpus * 100.0)
+        memory_efficiency = peak_rss / memory
+
+    status_names = table.categories.get('status', [])
+    failed_code = status_names.index('FAILED') if 'FAILED' in status_names else -2
+    failed = table.columns.get('status', np.full(len(table), -1)) == failed_code
+    oom = np.isin(exit_codes, OOM_EXIT_CODES)
+    retried = attempt > 1
+    # Rows from traces without a name/process column have code -1 and belong to no process
+    known = codes >= 0
+    timed = known & ~np.isnan(realtime)
+
+    tasks = np.bincount(codes[known], minlength=n)
+    total_realtime = np.bincount(codes[timed], weights=realtime[timed], minlength=n)
+    stats = {
+        'cpu_efficiency': _group_mean(codes, cpu_efficiency, n),
+        'memory_efficiency': _group_mean(codes, memory_efficiency, n),
+        'queue_wait_median_s': _group_quantile(codes, queue_wait, n, 0.5),
+        'realtime_median_s': _group_quantile(codes, realtime, n, 0.5),
+        'realtime_p95_s': _group_quantile(codes, realtime, n, 0.95),
+        'cpus_requested': _group_quantile(codes, cpus, n, 0.5),
+        'memory_requested_bytes': _group_quantile(codes, memory, n, 0.5),
+        'cpu_used_p95': _group_quantile(codes, pct_cpu / 100.0, n, 0.95),
+        'peak_rss_p95_bytes': _group_quantile(codes, peak_rss, n, 0.95),
+    }
+    counts = {
+        'failed': np.bincount(codes[known & failed], minlength=n),
+        'oom': np.bincount(codes[known & oom], minlength=n),
+        'retried': np.bincount(codes[known & retried], minlength=n),
+    }
+
+    report = []
+    for i, process in enumerate(processes):
+        entry = {'process': process, 'tasks': int(tasks[i]), 'total_realtime_s': float(total_realtime[i])}
+        for name, values in stats.items():
+            entry[name] = None if np.isnan(values[i]) else float(values[i])
+        for name, values in counts.items():
+            entry[name] = int(values[i])
+        report.append(entry)
+    report.sort(key=lambda entry: entry['total_realtime_s'], reverse=True)
+    return report
+
+
+def suggest_labels(report):
+    """
+    Suggests `withLabel` resources from the processes' observed p95 usage.
+    `small` covers the median process, `medium` the 90th percentile and
+    `large` the heaviest one, with memory headroom for variance.
+    """
+    cpu_needs = np.array([entry['cpu_used_p95'] for entry in report if entry['cpu_used_p95'] is not None])
+    memory_needs = np.array([entry['peak_rss_p95_bytes'] for entry in report if entry['peak_rss_p95_bytes'] is not None])
+    if not len(cpu_needs) or not len(memory_needs):
+        return {}
+
+    suggestions = {}
+    for label, q in LABEL_QUANTILES.items():
+        cpus = max(1, int(2 ** math.ceil(math.log2(max(np.quantile(cpu_needs, q), 1)))))
+        memory_gb = max(1, int(math.ceil(np.quantile(memory_needs, q) * MEMORY_HEADROOM / SIZE_UNITS['GB'])))
+        suggestions[label] = {'cpus': cpus, 'memory': f'{memory_gb} GB'}
+    return suggestions
+
+
+def _format_seconds(value):
+    return '-' if value is None else f'{value:.0f}s'
+
+
+def _format_ratio(value):
+    return '-' if value is None else f'{value * 100:.0f}%'
+
+
+def print_report(table, report, suggestions, top=None):
+    print(f"{len(table)} tasks from {len(table.sources)} trace file(s)\n")
+    print(f"{'process':<40} {'tasks':>8} {'cpu eff':>8} {'mem eff':>8} {'queue p50':>10} {'run p50':>10} {'run p95':>10} {'retried':>8} {'failed':>7} {'oom':>5}")
+    for entry in report[:top]:
+        print(
+            f"{entry['process'][:40]:<40} {entry['tasks']:>8} {_format_ratio(entry['cpu_efficiency']):>8} "
+            f"{_format_ratio(entry['memory_efficiency']):>8} {_format_seconds(entry['queue_wait_median_s']):>10} "
+            f"{_format_seconds(entry['realtime_median_s']):>10} {_format_seconds(entry['realtime_p95_s']):>10} "
+            f"{entry['retried']:>8} {entry['failed']:>7} {entry['oom']:>5}"
+        )
+
+    hotspots = sorted((entry for entry in report if entry['oom'] or entry['retried']), key=lambda e: (e['oom'], e['retried']), reverse=True)
+    if hotspots:
+        print("\nRetry/OOM hotspots:")
+        for entry in hotspots[:10]:
+            print(f"  {entry['process']}: {entry['oom']} OOM kills, {entry['retried']} retried tasks")
+
+    if suggestions:
+        print("\nSuggested nextflow.config labels:")
+        print("process {")
+        for label, resources in suggestions.items():
+            print(f"    withLabel: {label} {{")
+            print(f"        cpus = {resources['cpus']}")
+            print(f"        memory = '{resources['memory']}'")
+            print("    }")
+        print("}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze Nextflow trace files.')
+    parser.add_argument('paths', nargs='+', help='Trace files, saved .npz tables, s3:// trace objects or s3:// prefixes.')
+    parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format.')
+    parser.add_argument('--save', required=False, help='Save the parsed columnar table to this .npz file.')
+    parser.add_argument('--top', default=None, type=int, help='Only show the N processes with the most run time.')
+    args = parser.parse_args()
+
+    table = load_traces(args.paths)
+    if args.save:
+        table.save(args.save)
+        print(f"Saved {len(table)} tasks to {args.save}", file=sys.stderr)
+
+    report = process_report(table)
+    suggestions = suggest_labels(report)
+    if args.format == 'json':
+        json.dump({'tasks': len(table), 'sources': len(table.sources), 'processes': report[:args.top], 'labels': suggestions}, sys.stdout, indent=4)
+        print()
+    else:
+        print_report(table, report, suggestions, args.top)
@@ -0,0 +1,256 @@
+# tracing.py
+"""
+Lightweight timing spans for the launcher, the samplesheet Lambda and the
+monitor.
+
+Tracing is off unless the TRACING_ENABLED environment variable is set (or
+enable() is called); while it is off, span() returns a shared no-op context
+manager and instrumented boto3 clients return from their event hooks at once.
+When it is on, every duration is recorded in a process-wide registry under a
+metric family and a set of labels:
+
+    span_duration_seconds{span=...}                      code wrapped in span()/traced()
+    aws_api_call_duration_seconds{service=,operation=}   calls of instrumented clients
+    http_request_duration_seconds{endpoint=,method=,status=}  recorded by the monitor
+
+Each series keeps a Prometheus histogram (cumulative buckets, sum and count)
+and a bounded window of recent durations for p50/p99. render_prometheus()
+produces the text exposition format served by the monitor's /metrics, and
+snapshot() the JSON form used by benchmarks/scaling.py and logged by the
+Lambda and the launcher.
+
+Only the standard library is imported, so the Lambda's cold start is not
+affected.
+"""
+import contextlib
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+
+SPAN_METRIC = 'span_duration_seconds'
+AWS_API_CALL_METRIC = 'aws_api_call_duration_seconds'
+HTTP_REQUEST_METRIC = 'http_request_duration_seconds'
+METRIC_HELP = {
+    SPAN_METRIC: 'Duration of traced code spans.',
+    AWS_API_CALL_METRIC: 'Duration of AWS API calls, including retries.',
+    HTTP_REQUEST_METRIC: 'Duration of HTTP requests served.'
+}
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent durations kept per series for percentiles
+DEFAULT_WINDOW = 4096
+
+_enabled = os.environ.get('TRACING_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(len(sorted_values) * fraction) - 1))]
+
+
+class Series:
+    """Histogram and recent-duration window of one metric/label combination."""
+
+    def __init__(self, buckets, window):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def summary(self):
+        recent = sorted(self.recent)
+        return {
+            'count': self.count,
+            'sum_ms': round(self.sum * 1000, 3),
+            'p50_ms': round(percentile(recent, 0.50) * 1000, 3) if recent else None,
+            'p99_ms': round(percentile(recent, 0.99) * 1000, 3) if recent else None
+        }
+
+
+class Registry:
+    """Thread-safe store of every recorded series."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW):
+        self.buckets = tuple(buckets)
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric, seconds, labels):
+        # Labels keep the caller's order, which names the series in snapshot()
+        key = (metric, tuple(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = Series(self.buckets, self.window)
+            series.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """
+        Returns {metric: {series name: summary}} where the series name joins
+        the label values with '.', e.g. 's3.GetObjectTagging'.
+        """
+        with self._lock:
+            items = [(metric, labels, series.summary()) for (metric, labels), series in self._series.items()]
+        result = {}
+        for metric, labels, summary in sorted(items):
+            result.setdefault(metric, {})['.'.join(str(value) for _, value in labels)] = summary
+        return result
+
+    def render_prometheus(self):
+        """Returns every series in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            items = sorted(
+                (metric, labels, list(series.bucket_counts), series.count, series.sum)
+                for (metric, labels), series in self._series.items()
+            )
+        lines = []
+        current = None
+        for metric, labels, bucket_counts, count, total in items:
+            if metric != current:
+                current = metric
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(metric, metric)}")
+                lines.append(f'# TYPE {metric} histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_labels(labels, le=repr(float(bound)))} {cumulative}")
+            lines.append(f"{metric}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f'{metric}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'{metric}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+registry = Registry()
+
+
+def record(metric, seconds, **labels):
+    """Records one duration if tracing is enabled."""
+    if _enabled:
+        registry.observe(metric, seconds, labels)
+
+
+def record_api_call(service, operation, seconds):
+    """Records an AWS API call made outside an instrumented boto3 client (e.g. by a stub)."""
+    record(AWS_API_CALL_METRIC, seconds, service=service, operation=operation)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(SPAN_METRIC, time.perf_counter() - self.start, span=self.name)
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name):
+    """Context manager that times its block as span `name` while tracing is enabled."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def traced(name):
+    """Decorator that times every call of the function as span `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _before_call(model, context, **kwargs):
+    if _enabled:
+        context['tracing_start'] = time.perf_counter()
+
+
+def instrument_client(client):
+    """
+    Records the duration of every API call the boto3 client makes, labelled
+    by service and operation. Calls that fail before a response is parsed
+    (e.g. connection errors) are not recorded. Instrumenting a client twice
+    has no further effect; returns the client.
+    """
+    if getattr(client, '_tracing_instrumented', False):
+        return client
+    service = client.meta.service_model.service_name
+
+    def after_call(model, context, **kwargs):
+        start = context.pop('tracing_start', None)
+        if start is not None:
+            record(AWS_API_CALL_METRIC, time.perf_counter() - start, service=service, operation=model.name)
+
+    client.meta.events.register('before-call', _before_call)
+    client.meta.events.register('after-call', after_call)
+    client._tracing_instrumented = True
+    return client
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def render_prometheus():
+    return registry.render_prometheus()
+
+
+def reset():
+    registry.reset()
@@ -0,0 +1,41 @@
+# wsgi.py
+"""
+Production entry point for the monitoring dashboard.
+
+Serve it with gunicorn's threaded workers, which suit the dashboard's
+long-lived Server-Sent Event connections:
+
+    MONITOR_JOB_QUEUE=<queue> gunicorn -c gunicorn.conf.py wsgi:app
+
+Configuration is read from the environment:
+    MONITOR_JOB_QUEUE             AWS Batch job queue to monitor (required)
+    MONITOR_ECS_CLUSTER           ECS cluster for job metrics (looked up if unset)
+    MONITOR_POLL_INTERVAL         Job index poll interval while jobs are active
+    MONITOR_IDLE_POLL_INTERVAL    Longest job index poll interval while idle
+    MONITOR_INDEX                 Set to 0 to list jobs per request instead
+    MONITOR_CACHE_TTL             Listing cache TTL when the index is off
+    MONITOR_MAX_POOL_CONNECTIONS  HTTP connections per shared AWS client
+    TRACING_ENABLED               Set to 1 to serve request and AWS call timings at /metrics
+
+Each worker process runs its own job index poller, so keep MONITOR_WORKERS
+low and scale with MONITOR_THREADS; do not use gunicorn's --preload, as the
+poller thread would not survive the fork.
+"""
+import os
+
+import monitor
+
+
+def _optional_float(name):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+app = monitor.configure(
+    os.environ['MONITOR_JOB_QUEUE'],
+    ecs_cluster=os.environ.get('MONITOR_ECS_CLUSTER'),
+    cache_ttl=float(os.environ.get('MONITOR_CACHE_TTL', monitor.DEFAULT_JOB_LIST_TTL)),
+    poll_interval=_optional_float('MONITOR_POLL_INTERVAL'),
+    idle_poll_interval=_optional_float('MONITOR_IDLE_POLL_INTERVAL'),
+    index=os.environ.get('MONITOR_INDEX', '1') != '0'
+)